@@ -0,0 +1,81 @@
+"""
+Сравнение форматов файлов папок: время записи, время чтения и размер.
+
+    python .github/benchmarks/formats.py
+    python .github/benchmarks/formats.py --sizes 1000 50000 --repeat 5 --json
+
+Данные синтетические и воспроизводимые (--seed). Файлы пишутся во
+временную папку тем же путем, что и в приложении (снимок с fsync и .sum),
+а читаются через read_snapshot + decode_folder.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from synthetic import import_main, make_folder
+
+def measure(function, repeat):
+    """Лучшее время из repeat запусков, мс"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run(sizes, repeat, seed):
+    workdir = tempfile.mkdtemp(prefix="finance_bench_")
+    try:
+        main = import_main(workdir)
+        main.ensure_data_dir()
+        return [row for size in sizes for row in run_size(main, size, repeat, seed)]
+    finally:
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def run_size(main, size, repeat, seed):
+    results = []
+    folder = make_folder(main, size, random.Random(seed))
+    for data_format in main.DATA_FORMATS:
+        path = os.path.join(main.DATA_DIR, f"bench_{size}_{data_format.replace('+', '_')}")
+
+        def save():
+            body = main.encode_shard(folder, data_format)
+            digest = main.hashlib.sha1(body).hexdigest()
+            main.write_snapshot(path, main.pack_shard(1, digest, body, data_format))
+
+        def load():
+            shard = main.read_snapshot(path, main.decode_shard)
+            main.decode_folder(shard["data"])
+
+        save_ms = measure(save, repeat)
+        load_ms = measure(load, repeat)
+        results.append({"records": size, "format": data_format,
+                        "bytes": os.path.getsize(path),
+                        "save_ms": round(save_ms, 2), "load_ms": round(load_ms, 2)})
+    return results
+
+def print_table(results):
+    print(f"{'records':>8} {'format':<13} {'size, KB':>10} {'save, ms':>10} {'load, ms':>10}")
+    for row in results:
+        print(f"{row['records']:>8} {row['format']:<13} {row['bytes'] / 1024:>10.1f} "
+              f"{row['save_ms']:>10.2f} {row['load_ms']:>10.2f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="вывести результаты как JSON")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat, args.seed)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
@@ -0,0 +1,213 @@
+"""
+Бенчмарки горячих путей: хранилище, агрегаты и построение списков.
+
+    python .github/benchmarks/suite.py
+    python .github/benchmarks/suite.py --users 3 --folders 8 --records 5000 --storage sqlite
+    python .github/benchmarks/suite.py --update-baseline
+    python .github/benchmarks/suite.py --baseline other.json --threshold 0.1
+
+Данные генерируются заново при каждом запуске (--seed, от
+фиксированной даты synthetic.NOW) во временной папке. Виджеты строятся без окна (mock-бэкенд Kivy). Результаты
+пишутся в JSON (--output) и сравниваются с базовой линией: если медиана
+какого-то пути выросла больше чем на --threshold, выход с кодом 1.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from synthetic import NOW, import_main, make_records, populate
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+# Результаты последнего запуска; файл в .gitignore, в git только baseline.json
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "benchmark.json")
+
+def timed(function, repeat, setup=None, teardown=None):
+    """Медиана и минимум repeat запусков, мс. setup() готовит состояние
+    для function (не измеряется), teardown получает ее результат"""
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        started = time.perf_counter()
+        result = function(state) if setup is not None else function()
+        times.append((time.perf_counter() - started) * 1000)
+        if teardown is not None:
+            teardown(result)
+    return {"median_ms": round(statistics.median(times), 3),
+            "min_ms": round(min(times), 3), "runs": repeat}
+
+def run(args):
+    main = import_main(args.workdir)
+    from kivy.uix.screenmanager import NoTransition
+
+    main.save_settings({"storage": args.storage, "theme": "Light", "language": "EN"})
+    users = populate(main, args.users, args.folders, args.records, args.seed)
+    user_id = users[0][0]
+    folder_names = [f"Folder {f}" for f in range(args.folders)]
+    results = {}
+
+    def bench(name, function, setup=None, teardown=None):
+        results[name] = timed(function, args.repeat, setup, teardown)
+        print(f"  {name:<22} {results[name]['median_ms']:>10.2f} ms", file=sys.stderr)
+
+    # ---- хранилище ----
+    bench("load_users", lambda state: main.load_users(), setup=main.reset_storage)
+    bench("login_summaries", lambda state: main.get_user_store(user_id).load_summaries(),
+          setup=main.reset_storage)
+
+    # ---- главный экран ----
+    manager = main.AppScreenManager()
+    manager.transition = NoTransition()
+
+    def new_screen_state():
+        main.reset_storage()
+        store = main.get_user_store(user_id)
+        return store, store.load_summaries()["data"]
+
+    def close_screen(screen):
+        screen.persister.close()
+
+    bench("main_screen", lambda state: main.MainScreen(user_data=state[1], store=state[0]),
+          setup=new_screen_state, teardown=close_screen)
+
+    store, user_data = new_screen_state()
+    screen = main.MainScreen(user_data=user_data, store=store)
+    manager.add_widget(screen)
+    bench("create_stats_card", screen.create_stats_card)
+    bench("load_folders", screen.load_folders)
+
+    # ---- экран папки ----
+    def cold_folder():
+        # Пустой пул и выгруженные записи: открытие читает папку с диска
+        for folder_screen in list(screen.folder_screens.values()):
+            manager.remove_widget(folder_screen)
+            folder_screen.release()
+        screen.folder_screens.clear()
+        screen.release_folders()
+
+    bench("open_folder_cold", lambda state: screen.open_folder(folder_names[0]), setup=cold_folder)
+    folder_screen = screen.folder_screens[folder_names[0]]
+    bench("folder_load_records", folder_screen.load_records)
+
+    # ---- запись ----
+    rng = random.Random(args.seed)
+
+    def add_change():
+        folder = screen.get_folder(folder_names[0])
+        record = make_records(main, 1, rng)[0]
+        main.add_record(folder, record)
+        screen.update_folder_data(folder_names[0], folder, {"op": "add_record", "record": record})
+
+    bench("save_user_data", lambda state: screen.flush(full=True), setup=add_change)
+
+    # ---- агрегаты ----
+    def drop_columns():
+        screen.load_all_folders()
+        screen.columns = None
+
+    def reports(state):
+        columns = screen.get_columns()
+        for by in ("month", "currency", "folder"):
+            columns.group_totals(by)
+
+    bench("reports", reports, setup=drop_columns)
+
+    def drop_time_indexes():
+        screen.load_all_folders()
+        screen.time_indexes = {}
+
+    def period_totals(state):
+        now = datetime.fromtimestamp(NOW)
+        ranges = [main.period_range(period, now) for period in ("month", "year")]
+        for folder_name in folder_names:
+            time_index = screen.get_time_index(folder_name)
+            for time_range in ranges:
+                time_index.totals(time_range)
+
+    bench("period_totals", period_totals, setup=drop_time_indexes)
+
+    def drop_search_index():
+        screen.load_all_folders()
+        screen.search_index = None
+
+    bench("search", lambda state: screen.get_search_index().search("coffee"),
+          setup=drop_search_index)
+
+    screen.persister.close()
+    return results
+
+def compare(report, baseline, threshold):
+    """Печатает сравнение с базовой линией, возвращает список регрессий"""
+    if baseline.get("params") != report["params"]:
+        print("warning: baseline was recorded with different parameters", file=sys.stderr)
+    regressions = []
+    print(f"{'path':<22} {'median, ms':>12} {'baseline':>12} {'change':>8}")
+    for name, result in report["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print(f"{name:<22} {result['median_ms']:>12.2f} {'-':>12} {'':>8}")
+            continue
+        change = result["median_ms"] / base["median_ms"] - 1 if base["median_ms"] else 0.0
+        mark = ""
+        if change > threshold:
+            regressions.append(name)
+            mark = "  REGRESSION"
+        print(f"{name:<22} {result['median_ms']:>12.2f} {base['median_ms']:>12.2f} "
+              f"{change:>+8.0%}{mark}")
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=3)
+    parser.add_argument("--folders", type=int, default=5)
+    parser.add_argument("--records", type=int, default=2000, help="записей в каждой папке")
+    parser.add_argument("--storage", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="допустимый рост медианы (0.25 = +25%%)")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="записать результаты как новую базовую линию")
+    args = parser.parse_args()
+
+    # Пути - относительно папки запуска, до перехода во временную
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline)
+    args.workdir = tempfile.mkdtemp(prefix="finance_bench_")
+    try:
+        results = run(args)
+    finally:
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(args.workdir, ignore_errors=True)
+
+    report = {
+        "params": {"users": args.users, "folders": args.folders, "records": args.records,
+                   "storage": args.storage, "seed": args.seed, "repeat": args.repeat},
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline saved: {baseline_path}")
+        sys.exit(0)
+    if not os.path.exists(baseline_path):
+        print(f"no baseline at {baseline_path}; run with --update-baseline to create it")
+        sys.exit(0)
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.threshold)
+    sys.exit(1 if regressions else 0)
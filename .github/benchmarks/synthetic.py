@@ -0,0 +1,70 @@
+"""
+Воспроизводимые синтетические данные для бенчмарков: пользователи,
+папки и записи со смешанными валютами и датами за три года до NOW.
+"""
+import os
+import random
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+WORDS = ("coffee", "salary", "rent", "taxi", "groceries", "gift", "bonus", "pharmacy",
+         "cinema", "lunch", "internet", "phone", "books", "gym", "кафе", "продукты")
+DAY = 86400
+YEARS = 3
+# Фиксированное "сейчас" (2025-07-01 UTC): с тем же seed данные и
+# попадание записей в периоды не зависят от дня запуска
+NOW = 1751328000
+
+def import_main(workdir):
+    """Импортирует приложение без окна и без разбора аргументов.
+    DATA_DIR создается относительно текущей папки - ею становится workdir.
+    Kivy при импорте перехватывает sys.stderr - возвращаем его, чтобы
+    ошибки и ход замеров были видны в консоли"""
+    os.environ.setdefault("KIVY_NO_ARGS", "1")
+    os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+    os.environ.setdefault("KIVY_GL_BACKEND", "mock")
+    os.chdir(workdir)
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    stderr = sys.stderr
+    import main
+    sys.stderr = stderr
+    return main
+
+def make_records(main, count, rng, now=None):
+    """count случайных записей: доходы и расходы в разных валютах"""
+    now = NOW if now is None else now
+    currencies = [main.currency_code(name) for name in main.CURRENCIES]
+    records = []
+    for i in range(count):
+        name = f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i % 97}"
+        kind = main.Record.EXPENSE if rng.random() < 0.3 else main.Record.INCOME
+        records.append(main.Record(sys.intern(name), rng.randrange(1, 500000),
+                                   now - rng.randrange(YEARS * 365 * DAY), kind,
+                                   rng.choice(currencies)))
+    return records
+
+def make_folder(main, count, rng, now=None):
+    """Папка из count записей с посчитанными итогами"""
+    folder = {"records": make_records(main, count, rng, now)}
+    main.folder_summary(folder)
+    return folder
+
+def populate(main, users, folders, records, seed=1):
+    """Создает users пользователей по folders папок из records записей
+    в текущем бэкенде хранения. Возвращает [(user_id, email, nickname)]"""
+    rng = random.Random(seed)
+    main.prepare_storage()
+    created = []
+    for u in range(users):
+        email = f"user{u}@bench.local"
+        nickname = f"user{u}"
+        user_id = main.hashlib.md5(email.encode()).hexdigest()
+        profile = {"email": email, "nickname": nickname, "created_at": "2024-01-01T00:00:00"}
+        data = {f"Folder {f}": make_folder(main, records, rng) for f in range(folders)}
+        main.get_user_store(user_id).save_user(dict(profile, data={"folders": data}))
+        main.add_account(user_id, profile)
+        created.append((user_id, email, nickname))
+    main.reset_storage()
+    return created
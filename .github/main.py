@@ -3,6 +3,10 @@
 С сохранением данных, настройками и всеми функциями
 """
 
+# Отсчет фаз запуска начинается до импорта Kivy (см. ЗАМЕРЫ ЗАПУСКА)
+import time
+STARTUP_STARTED = time.perf_counter()
+
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.gridlayout import GridLayout
@@ -10,7 +14,9 @@ from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
 from kivy.uix.spinner import Spinner
-from kivy.uix.scrollview import ScrollView
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.uix.screenmanager import ScreenManager, Screen, SlideTransition
 from kivy.uix.popup import Popup
 from kivy.uix.modalview import ModalView
@@ -19,16 +25,191 @@ from kivy.graphics import Color, Rectangle, RoundedRectangle
 from kivy.metrics import dp, sp
 from kivy.utils import get_color_from_hex
 from kivy.clock import Clock
+from kivy.event import EventDispatcher
+from kivy.properties import ColorProperty, StringProperty
 import json
 import os
-from datetime import datetime
+import importlib.util
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 import re
+import sys
 import hashlib
+import csv
+import gzip
+import zlib
+import struct
+import itertools
+import functools
+import contextlib
+import sqlite3
+from collections import OrderedDict, deque
+import threading
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right, insort
+import heapq
 
-# ====================== МОБИЛЬНЫЕ НАСТРОЙКИ ======================
-Window.softinput_mode = 'below_target'
-Window.keyboard_anim_args = {'d': 0.2, 't': 'linear'}
+# ====================== ЗАМЕРЫ ЗАПУСКА ======================
+# Запуск делится на фазы: импорты, определения модуля, настройка
+# платформы, первый экран, первый кадр и то, что отложено на после
+# него (разрешения, открытие хранилища). Отчет - в окне статистики.
+STARTUP_PHASES = []
+_startup_mark = STARTUP_STARTED
+
+def startup_phase(name):
+    """Закрывает фазу запуска name: время с прошлой отметки"""
+    global _startup_mark
+    now = time.perf_counter()
+    STARTUP_PHASES.append((name, (now - _startup_mark) * 1000))
+    _startup_mark = now
+
+def startup_report():
+    """Строки отчета о запуске: фазы и время до первого кадра"""
+    lines = []
+    to_first_frame = 0.0
+    for name, ms in STARTUP_PHASES:
+        lines.append(f"{name}: {ms:.0f} ms")
+        if to_first_frame is not None:
+            to_first_frame += ms
+            if name == "first frame":
+                lines.append(f"to first frame: {to_first_frame:.0f} ms")
+                to_first_frame = None
+    return lines
+
+startup_phase("imports")
+
+# ====================== ПРОФИЛИРОВАНИЕ ======================
+# Горячие пути помечены @profiled. Выключенный профилировщик (по
+# умолчанию) стоит обертке одну проверку флага, поэтому он есть и в
+# релизной сборке и включается в настройках для диагностики на
+# устройстве. Включенный пишет каждый вызов в кольцевой буфер: имя,
+# время, длительность и байты, прочитанные и записанные внутри вызова
+# (их сообщают read_snapshot, write_durable и журнал). Вложенный вызов
+# добавляет свои байты и вызывающему. p50/p95 считаются по буферу.
+PROFILE_RING_SIZE = 4096
+PROFILE_FRAMES = 240
+
+def percentile(sorted_values, fraction):
+    """Значение на доле fraction отсортированного списка (0..1)"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+class Profiler:
+    """Счетчики и кольцевой буфер замеров горячих путей"""
+    
+    def __init__(self, size=PROFILE_RING_SIZE):
+        self.enabled = False
+        self.samples = deque(maxlen=size)
+        self.counts = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        # Время кадров, мс - заполняет оверлей, пока он показан
+        self.frame_times = deque(maxlen=PROFILE_FRAMES)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        
+    def begin(self):
+        """Открывает замер в текущем потоке: [прочитано, записано]"""
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        span = [0, 0]
+        stack.append(span)
+        return span
+        
+    def end(self, name, started, span):
+        elapsed = time.perf_counter() - started
+        stack = self.local.stack
+        stack.pop()
+        if stack:
+            stack[-1][0] += span[0]
+            stack[-1][1] += span[1]
+        sample = (name, time.time() - elapsed, elapsed * 1000, span[0], span[1],
+                  threading.current_thread().name)
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+            self.samples.append(sample)
+            
+    def add_bytes(self, read=0, written=0):
+        """Ввод-вывод: в открытый замер потока и в общие счетчики"""
+        stack = getattr(self.local, "stack", None)
+        if stack:
+            stack[-1][0] += read
+            stack[-1][1] += written
+        with self.lock:
+            self.bytes_read += read
+            self.bytes_written += written
+            
+    def summary(self):
+        """Сводка по путям, самые дорогие по суммарному времени первыми"""
+        with self.lock:
+            samples = list(self.samples)
+            counts = dict(self.counts)
+        by_name = {}
+        for name, ts, ms, read, written, thread in samples:
+            entry = by_name.setdefault(name, [[], 0, 0])
+            entry[0].append(ms)
+            entry[1] += read
+            entry[2] += written
+        rows = []
+        for name, (durations, read, written) in by_name.items():
+            durations.sort()
+            rows.append({"name": name, "count": counts.get(name, len(durations)),
+                         "p50_ms": round(percentile(durations, 0.5), 3),
+                         "p95_ms": round(percentile(durations, 0.95), 3),
+                         "total_ms": round(sum(durations), 3),
+                         "read": read, "written": written})
+        rows.sort(key=lambda row: row["total_ms"], reverse=True)
+        return rows
+        
+    def frame_summary(self):
+        """Время кадра по последним кадрам: p50, p95 и худшее, мс"""
+        frames = sorted(self.frame_times)
+        if not frames:
+            return None
+        return {"frames": len(frames), "p50_ms": round(percentile(frames, 0.5), 2),
+                "p95_ms": round(percentile(frames, 0.95), 2), "max_ms": round(frames[-1], 2)}
+        
+    def export_jsonl(self, path):
+        """Пишет вызовы из буфера, сводку и кадры в JSON Lines.
+        Возвращает число строк"""
+        with self.lock:
+            samples = list(self.samples)
+            totals = {"type": "io", "read": self.bytes_read, "written": self.bytes_written}
+        lines = [{"type": "call", "name": name, "ts": round(ts, 6), "ms": round(ms, 3),
+                  "read": read, "written": written, "thread": thread}
+                 for name, ts, ms, read, written, thread in samples]
+        lines.extend(dict(row, type="stats") for row in self.summary())
+        lines.append(totals)
+        frames = self.frame_summary()
+        if frames is not None:
+            lines.append(dict(frames, type="frames"))
+        with open(path, "w", encoding="utf-8") as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        return len(lines)
+
+PROFILER = Profiler()
+
+def profiled(function):
+    """Замеряет вызовы function, пока профилировщик включен"""
+    name = function.__qualname__
+    
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not PROFILER.enabled:
+            return function(*args, **kwargs)
+        span = PROFILER.begin()
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            PROFILER.end(name, started, span)
+    return wrapper
 
+# ====================== МОБИЛЬНЫЕ НАСТРОЙКИ ======================
 # Определяем платформу
 try:
     from kivy.utils import platform
@@ -36,15 +217,13 @@ try:
 except:
     IS_MOBILE = True
 
-# Настраиваем пути для данных
+# Настраиваем пути для данных. Модуль android только ищется, а не
+# импортируется: разрешения запрашиваются после первого кадра
 if IS_MOBILE:
     if platform == 'android':
-        try:
-            from android.permissions import request_permissions, Permission
-            request_permissions([Permission.WRITE_EXTERNAL_STORAGE,
-                                Permission.READ_EXTERNAL_STORAGE])
+        if importlib.util.find_spec("android") is not None:
             DATA_DIR = '/storage/emulated/0/FinanceManager/'
-        except:
+        else:
             DATA_DIR = './finance_data/'
     elif platform == 'ios':
         DATA_DIR = os.path.join(os.path.expanduser('~'), 'Documents', 'FinanceManager/')
@@ -53,141 +232,2842 @@ if IS_MOBILE:
 else:
     DATA_DIR = './finance_data/'
 
-# Создаем директории если нет
-os.makedirs(DATA_DIR, exist_ok=True)
+def setup_window():
+    """Настройки окна под экранную клавиатуру"""
+    Window.softinput_mode = 'below_target'
+    Window.keyboard_anim_args = {'d': 0.2, 't': 'linear'}
+
+def request_storage_permissions():
+    """Доступ к общей памяти на Android (запрашивается после первого кадра)"""
+    if platform != 'android':
+        return
+    try:
+        from android.permissions import request_permissions, Permission
+        request_permissions([Permission.WRITE_EXTERNAL_STORAGE,
+                            Permission.READ_EXTERNAL_STORAGE])
+    except:
+        pass
+
+def ensure_data_dir():
+    """Создает DATA_DIR при открытии хранилища, а не при импорте"""
+    os.makedirs(DATA_DIR, exist_ok=True)
 
 # Файлы данных
 DATA_FILE = os.path.join(DATA_DIR, "finance_data.json")
 USERS_FILE = os.path.join(DATA_DIR, "users.json")
 SETTINGS_FILE = os.path.join(DATA_DIR, "settings.json")
+USERS_DIR = os.path.join(DATA_DIR, "users")
+DATABASE_FILE = os.path.join(DATA_DIR, "finance.db")
+RATES_FILE = os.path.join(DATA_DIR, "rates.json")
+
+# Журнал users.journal старого единого хранилища (нужен только для миграции)
+LEGACY_JOURNAL_FILE = os.path.join(DATA_DIR, "users.journal")
+
+# Сколько записей журнала копить до фонового сворачивания в файлы папок
+JOURNAL_COMPACT_EVERY = 200
+
+# Сколько экранов папок держать открытыми (настройка "folder_cache_size")
+FOLDER_CACHE_SIZE = 3
 
 # ====================== УТИЛИТЫ ДЛЯ ДАННЫХ ======================
 def load_data():
     """Загрузка финансовых данных"""
-    if not os.path.exists(DATA_FILE):
-        return {}
-    try:
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except:
-        return {}
+    data = read_json(DATA_FILE)
+    return data if data is not None else {}
 
 def save_data(data):
     """Сохранение финансовых данных"""
     try:
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        write_text(DATA_FILE, json.dumps(data, ensure_ascii=False, indent=2))
         return True
     except:
         return False
 
+@profiled
 def load_users():
-    """Загрузка пользователей"""
-    if not os.path.exists(USERS_FILE):
-        return {}
-    try:
-        with open(USERS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except:
-        return {}
+    """Загрузка всех пользователей вместе с данными"""
+    prepare_storage()
+    users = {}
+    if get_storage_backend() == "sqlite":
+        user_ids = get_database().user_ids()
+    elif os.path.isdir(USERS_DIR):
+        user_ids = os.listdir(USERS_DIR)
+    else:
+        return users
+    for user_id in user_ids:
+        user = get_user_store(user_id).load()
+        if user is not None:
+            users[user_id] = user
+    return users
 
 def save_users(users):
-    """Сохранение пользователей"""
+    """Сохранение всех пользователей"""
     try:
-        with open(USERS_FILE, "w", encoding="utf-8") as f:
-            json.dump(users, f, ensure_ascii=False, indent=2)
+        for user_id, user in users.items():
+            get_user_store(user_id).save_user(user)
         return True
     except:
         return False
 
 def load_settings():
     """Загрузка настроек"""
-    if not os.path.exists(SETTINGS_FILE):
-        return {"theme": "Light", "language": "EN"}
-    try:
-        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except:
+    settings = read_json(SETTINGS_FILE)
+    if not isinstance(settings, dict):
         return {"theme": "Light", "language": "EN"}
+    return settings
 
 def save_settings(settings):
     """Сохранение настроек"""
     try:
-        with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
-            json.dump(settings, f, ensure_ascii=False, indent=2)
+        ensure_data_dir()
+        write_text(SETTINGS_FILE, json.dumps(settings, ensure_ascii=False, indent=2))
         return True
     except:
         return False
 
+# Файлы данных пишутся снимками: временный файл + fsync + переименование,
+# прошлая версия остается рядом в .bak. Для каждого снимка в .sum лежат
+# его размер, mtime и sha256. При чтении снимок с совпавшими размером и
+# mtime принимается без чтения, иначе сверяется sha256 (без разбора
+# JSON). Поврежденный снимок откладывается в .corrupt, и читается .bak.
+def backup_path(path):
+    return path + ".bak"
+
+def checksum_path(path):
+    return path + ".sum"
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def fsync_dir(path):
+    """Фиксирует переименование на диске (где ОС это позволяет)"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+def write_durable(path, data, keep_backup=False):
+    """Байты во временный файл, fsync и атомарная замена. С keep_backup
+    текущая версия вместе с ее .sum сначала уходит в .bak"""
+    if PROFILER.enabled:
+        PROFILER.add_bytes(written=len(data))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    if keep_backup and os.path.exists(path):
+        # Сначала .sum: после сбоя между заменами у файла просто нет .sum
+        # (он читается без проверки), а у .bak нет чужой контрольной суммы
+        if os.path.exists(checksum_path(path)):
+            os.replace(checksum_path(path), checksum_path(backup_path(path)))
+        elif os.path.exists(checksum_path(backup_path(path))):
+            os.remove(checksum_path(backup_path(path)))
+        os.replace(path, backup_path(path))
+    os.replace(tmp_path, path)
+    fsync_dir(path)
+
+def verify_snapshot(path, checksum_file=None):
+    """True - снимок цел, False - поврежден, None - проверить нечем.
+    checksum_file - .sum, с которым сверять вместо собственного"""
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(checksum_file or checksum_path(path), "r", encoding="utf-8") as f:
+            checksum = json.load(f)
+    except:
+        return None
+    stat = os.stat(path)
+    if stat.st_size != checksum.get("size"):
+        return False
+    if stat.st_mtime_ns == checksum.get("mtime_ns"):
+        return True
+    return file_sha256(path) == checksum.get("sha256")
+
+def read_json(path, recovered=None):
+    """Читает JSON-снимок, при повреждении - прошлую версию из .bak (путь
+    поврежденного файла добавляется в список recovered). None, если целой
+    версии нет"""
+    return read_snapshot(path, json.loads, recovered)
+
+def read_snapshot(path, decode, recovered=None):
+    """То же для любого формата: decode(байты) -> данные или исключение"""
+    damaged = False
+    missing = not os.path.exists(path)
+    for candidate in (path, backup_path(path)):
+        status = verify_snapshot(candidate)
+        if status is False and missing and candidate != path:
+            # Сбой прежней версии write_durable между переносом файла в .bak
+            # и переносом его .sum: .sum остался у пропавшего файла, а у .bak
+            # - от поколения раньше. Сверяем с оставшимся, иначе - разбором
+            status = verify_snapshot(candidate, checksum_path(path)) or None
+        if status is False:
+            if candidate == path and os.path.exists(path):
+                # Поврежденный файл не должен уйти в .bak при следующей записи
+                damaged = True
+                try:
+                    os.replace(path, path + ".corrupt")
+                except OSError:
+                    pass
+            continue
+        try:
+            with open(candidate, "rb") as f:
+                raw = f.read()
+            if PROFILER.enabled:
+                PROFILER.add_bytes(read=len(raw))
+            data = decode(raw)
+        except:
+            damaged = damaged or candidate == path
+            continue
+        if candidate != path and recovered is not None:
+            recovered.append(path)
+        return data
+    if damaged and recovered is not None:
+        recovered.append(path)
+    return None
+
+def write_text(path, text):
+    """Атомарно записывает снимок файла с контрольной суммой"""
+    write_snapshot(path, text.encode("utf-8"))
+
+def write_snapshot(path, data, seq=None):
+    write_durable(path, data, keep_backup=True)
+    write_checksum(path, data, seq)
+
+def write_checksum(path, data, seq=None):
+    """Пишет .sum для только что записанного файла с содержимым data.
+    seq файла папки лежит там же: .sum уходит в .bak вместе с файлом,
+    и по нему видно, с какого места журнала .bak нужно догонять"""
+    checksum = {"size": len(data), "mtime_ns": os.stat(path).st_mtime_ns,
+                "sha256": hashlib.sha256(data).hexdigest()}
+    if seq is not None:
+        checksum["seq"] = seq
+    write_durable(checksum_path(path), json.dumps(checksum).encode("utf-8"))
+
+# ====================== МОДЕЛЬ ЗАПИСИ ======================
+# В памяти запись хранится как компактный Record: сумма - целое число
+# сотых (копеек/центов), дата - секунды эпохи, тип и валюта - маленькие
+# коды. Строки разбираются один раз при загрузке, итоги считаются в целых
+# числах без накопления ошибки float. На диск запись уходит в прежнем
+# JSON-виде {"name", "amount", "type", "currency", "date"}.
+DATE_FORMAT = "%d.%m.%Y %H:%M"
+
+# Таблица интернирования валют: код -> название и обратно
+CURRENCY_NAMES = []
+_currency_codes = {}
+_currency_lock = threading.Lock()
+
+def currency_code(name):
+    """Маленький код валюты по ее названию"""
+    code = _currency_codes.get(name)
+    if code is None:
+        # Новые валюты могут появиться и в фоновом импорте
+        with _currency_lock:
+            code = _currency_codes.get(name)
+            if code is None:
+                CURRENCY_NAMES.append(name)
+                code = _currency_codes[name] = len(CURRENCY_NAMES) - 1
+    return code
+
+def parse_minor(text):
+    """Строку суммы в целые сотые: "12.5" -> 1250. ValueError, если не число"""
+    try:
+        value = Decimal(str(text).strip().replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f"invalid amount: {text!r}")
+    if not value.is_finite():
+        raise ValueError(f"invalid amount: {text!r}")
+    return int((value * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def format_minor(minor):
+    """Целые сотые в строку суммы: 1250 -> "12.50" """
+    sign = "-" if minor < 0 else ""
+    whole, cents = divmod(abs(minor), 100)
+    return f"{sign}{whole}.{cents:02d}"
+
+def format_money(minor):
+    """Целые сотые в сумму для экрана: 123456 -> "1,234.56" """
+    sign = "-" if minor < 0 else ""
+    whole, cents = divmod(abs(minor), 100)
+    return f"{sign}{whole:,}.{cents:02d}"
+
+def parse_timestamp(text):
+    """Дату записи в секунды эпохи, None если даты нет"""
+    try:
+        return int(datetime.strptime(text, DATE_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+class Record:
+    """Запись о доходе или расходе. В raw - исходный текст суммы или даты,
+    которые не удалось разобрать: он записывается обратно без изменений"""
+    __slots__ = ("name", "minor", "ts", "kind", "currency", "raw")
+    
+    EXPENSE = 0
+    INCOME = 1
+    
+    def __init__(self, name, minor, ts, kind, currency, raw=None):
+        self.name = name
+        self.minor = minor
+        self.ts = ts
+        self.kind = kind
+        self.currency = currency
+        self.raw = raw
+        
+    @classmethod
+    def create(cls, name, amount, record_type, currency, ts=None):
+        """Новая запись из полей формы (amount - строка)"""
+        if ts is None:
+            ts = int(datetime.now().replace(second=0, microsecond=0).timestamp())
+        return cls(sys.intern(name), parse_minor(amount), ts,
+                   cls.INCOME if record_type == 'income' else cls.EXPENSE,
+                   currency_code(currency))
+        
+    @classmethod
+    def from_dict(cls, data):
+        """Запись из JSON-словаря"""
+        minor, ts, raw = parse_fields(data.get('amount', 0), data.get('date'))
+        return cls(sys.intern(data.get('name', 'No name')), minor, ts,
+                   cls.INCOME if data.get('type') == 'income' else cls.EXPENSE,
+                   currency_code(data.get('currency', '$')), raw)
+        
+    def to_dict(self):
+        """JSON-словарь в прежнем формате"""
+        data = {
+            'name': self.name,
+            'amount': format_minor(self.minor),
+            'type': self.type,
+            'currency': self.currency_name
+        }
+        if self.ts is not None:
+            data['date'] = self.date_text
+        if self.raw:
+            data.update(self.raw)
+        return data
+        
+    @property
+    def is_income(self):
+        return self.kind == Record.INCOME
+        
+    @property
+    def type(self):
+        return 'income' if self.kind == Record.INCOME else 'expense'
+        
+    @property
+    def currency_name(self):
+        return CURRENCY_NAMES[self.currency]
+        
+    @property
+    def date_text(self):
+        if self.ts is None:
+            return 'No date'
+        return datetime.fromtimestamp(self.ts).strftime(DATE_FORMAT)
+
+def parse_fields(amount, date):
+    """Сумма и дата записи: (minor, ts, raw). Неразобранные поля идут в
+    счет как 0 и "без даты", а их исходный текст остается в raw"""
+    raw = None
+    try:
+        minor = parse_minor(amount)
+    except ValueError:
+        minor = 0
+        raw = {'amount': amount}
+    ts = parse_timestamp(date)
+    if ts is None and date:
+        raw = dict(raw or (), date=date)
+    return minor, ts, raw
+
+def decode_record(record):
+    return Record.from_dict(record) if isinstance(record, dict) else record
+
+def decode_folder(folder):
+    """Превращает JSON-словари записей папки в Record (один раз при загрузке)"""
+    folder['records'] = [decode_record(record) for record in folder.get('records', [])]
+    return folder
+
+def encode_json(obj):
+    """default= для json.dumps: Record пишется в прежнем формате"""
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+def month_key(ts):
+    """Номер месяца (год * 12 + месяц - 1) по времени записи, -1 без даты"""
+    if ts is None:
+        return -1
+    moment = datetime.fromtimestamp(ts)
+    return moment.year * 12 + moment.month - 1
+
+def month_label(key):
+    return "—" if key < 0 else f"{key // 12}-{key % 12 + 1:02d}"
+
+# ====================== ВАЛЮТЫ И КУРСЫ ======================
+# Суммы в разных валютах не складываются напрямую: итоги ведутся
+# отдельно по каждой паре (валюта, месяц), а в базовую валюту
+# переводятся по локальной таблице исторических курсов rates.json. Курс
+# на дату ищется bisect, множитель для пары (валюта, месяц) запоминается
+# и сбрасывается при изменении таблицы.
+BASE_CURRENCY = "USD"
+
+# Стартовые курсы: сколько USD стоит единица валюты. Приблизительные,
+# уточняются пользователем через меню "Rates"
+DEFAULT_RATES = {
+    "USD": 1.0, "EUR": 1.08, "GBP": 1.27, "RUB": 0.011,
+    "JPY": 0.0067, "KRW": 0.00073, "INR": 0.012
+}
+
+_iso_codes = {}
+
+def currency_iso(name):
+    """ISO-код по названию валюты: "€ EUR" -> "EUR", старое "€" -> "EUR" """
+    code = _iso_codes.get(name)
+    if code is None:
+        parts = name.split()
+        if len(parts) > 1 or (parts and parts[0].isalpha()):
+            code = parts[-1].upper()
+        else:
+            code = next((option.split()[-1] for option in CURRENCIES
+                         if parts and option.split()[0] == parts[0]), name)
+        _iso_codes[name] = code
+    return code
+
+def currency_symbol(name):
+    return name.split()[0] if name.strip() else name
+
+class RateTable:
+    """Исторические курсы валют к USD с поиском по дате"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.times = {}
+        self.values = {}
+        self.factors = {}
+        self.version = 0
+        data = read_json(path) or {}
+        rates = data.get("rates") or {code: [[0, rate]] for code, rate in DEFAULT_RATES.items()}
+        for code, history in rates.items():
+            history = sorted(history)
+            self.times[code] = [ts for ts, _ in history]
+            self.values[code] = [rate for _, rate in history]
+            
+    def rate(self, code, ts):
+        """Курс валюты на момент ts (последний известный на эту дату)"""
+        times = self.times.get(code)
+        if not times:
+            return None
+        i = bisect_right(times, ts) - 1
+        return self.values[code][max(i, 0)]
+        
+    def latest(self, code):
+        values = self.values.get(code)
+        return values[-1] if values else None
+        
+    def factor(self, code, month, base):
+        """Множитель перевода сумм валюты за месяц в базовую валюту. None,
+        если курса нет (валюта из импорта): такие суммы не переводятся 1:1,
+        а не входят в итог и считаются в его поле excluded"""
+        key = (code, month, base)
+        if key not in self.factors:
+            if code == base:
+                factor = 1.0
+            else:
+                # Берется курс, действовавший на конец месяца
+                if month < 0:
+                    ts = float("inf")
+                else:
+                    year, index = divmod(month + 1, 12)
+                    ts = datetime(year, index + 1, 1).timestamp() - 1
+                rate, base_rate = self.rate(code, ts), self.rate(base, ts)
+                factor = rate / base_rate if rate and base_rate else None
+            self.factors[key] = factor
+        return self.factors[key]
+        
+    def update(self, code, ts, rate):
+        """Добавляет курс на дату и сбрасывает запомненные множители"""
+        times = self.times.setdefault(code, [])
+        values = self.values.setdefault(code, [])
+        i = bisect_right(times, ts)
+        times.insert(i, ts)
+        values.insert(i, rate)
+        self.factors.clear()
+        self.version += 1
+        self.save()
+        
+    def save(self):
+        rates = {code: [[ts, rate] for ts, rate in zip(self.times[code], self.values[code])]
+                 for code in self.times}
+        write_text(self.path, json.dumps({"rates": rates}, indent=2))
+
+_rates = None
+
+def get_rates():
+    """Таблица курсов (читается с диска при первом обращении)"""
+    global _rates
+    if _rates is None:
+        _rates = RateTable(RATES_FILE)
+    return _rates
+
+def to_base(record, base):
+    """Сумма записи в базовой валюте, в сотых без округления: итог
+    округляется один раз, как в convert_summary, иначе суммы периода и
+    всего времени расходились бы на копейки. None - курса валюты нет"""
+    factor = get_rates().factor(currency_iso(record.currency_name), month_key(record.ts), base)
+    return record.minor * factor if factor is not None else None
+
+def excluded_note(totals):
+    """Пометка к переведенному итогу, если в него не вошли записи в
+    валютах без курса"""
+    excluded = totals.get("excluded", 0)
+    return f"  ({excluded} w/o rate)" if excluded else ""
+
+# ====================== АГРЕГАТЫ ======================
+# У каждой папки есть кэш "summary" с доходом, расходом, балансом (в
+# целых сотых) и числом записей. Он обновляется за O(1) при добавлении и
+# удалении записи, сохраняется вместе с папкой и пересчитывается целиком
+# только если отсутствует, устарел по версии или не сходится с числом
+# записей. В "buckets" те же суммы разложены по ключам "валюта:месяц" -
+# из них строятся итоги по валютам и перевод в базовую валюту.
+SUMMARY_VERSION = 3
+
+def empty_summary():
+    return {"v": SUMMARY_VERSION, "income": 0, "expense": 0, "balance": 0, "count": 0,
+            "buckets": {}}
+
+def bucket_add(buckets, key, income, expense, count):
+    bucket = buckets.get(key)
+    if bucket is None:
+        bucket = buckets[key] = [0, 0, 0]
+    bucket[0] += income
+    bucket[1] += expense
+    bucket[2] += count
+    if not bucket[2]:
+        del buckets[key]
+
+def summary_add(summary, record, sign=1):
+    """Добавляет (sign=1) или вычитает (sign=-1) запись из итогов"""
+    amount = record.minor * sign
+    key = f"{currency_iso(record.currency_name)}:{month_key(record.ts)}"
+    if record.kind == Record.INCOME:
+        summary["income"] += amount
+        summary["balance"] += amount
+        bucket_add(summary["buckets"], key, amount, 0, sign)
+    else:
+        summary["expense"] += amount
+        summary["balance"] -= amount
+        bucket_add(summary["buckets"], key, 0, amount, sign)
+    summary["count"] += sign
+
+@profiled
+def folder_summary(folder):
+    """Итоги папки: из кэша, а если он устарел - пересчитанные"""
+    records = folder.setdefault('records', [])
+    summary = folder.get('summary')
+    if (not summary or summary.get("v") != SUMMARY_VERSION
+            or summary.get("count") != len(records)):
+        summary = empty_summary()
+        for record in records:
+            summary_add(summary, record)
+        folder['summary'] = summary
+    return summary
+
+def summary_add_totals(summary, other, sign=1):
+    """Складывает (sign=1) или вычитает (sign=-1) одни итоги из других"""
+    for key in ("income", "expense", "balance", "count"):
+        summary[key] += other[key] * sign
+    if "excluded" in summary:
+        summary["excluded"] += other.get("excluded", 0) * sign
+    if "buckets" in summary:
+        for key, (income, expense, count) in other.get("buckets", {}).items():
+            bucket_add(summary["buckets"], key, income * sign, expense * sign, count * sign)
+
+@profiled
+def currency_totals(summary):
+    """Итоги по валютам без перевода: {код: summary без buckets}"""
+    totals = {}
+    for key, (income, expense, count) in summary["buckets"].items():
+        code = key.rsplit(":", 1)[0]
+        total = totals.get(code)
+        if total is None:
+            total = totals[code] = {"income": 0, "expense": 0, "balance": 0, "count": 0}
+        total["income"] += income
+        total["expense"] += expense
+        total["balance"] += income - expense
+        total["count"] += count
+    return dict(sorted(totals.items()))
+
+def convert_summary(summary, base):
+    """Итоги в базовой валюте. Проходит по корзинам (валюта, месяц), а не по
+    записям; множители курсов берутся из кэша таблицы. Округляется только
+    итог - так же считают TimeIndex и ColumnStore. Записи валют без курса
+    в суммы не входят, их число - в поле excluded"""
+    rates = get_rates()
+    income = expense = 0.0
+    excluded = 0
+    for key, (bucket_income, bucket_expense, count) in summary["buckets"].items():
+        code, month = key.rsplit(":", 1)
+        factor = rates.factor(code, int(month), base)
+        if factor is None:
+            excluded += count
+            continue
+        income += bucket_income * factor
+        expense += bucket_expense * factor
+    income, expense = round(income), round(expense)
+    return {"income": income, "expense": expense, "balance": income - expense,
+            "count": summary["count"], "excluded": excluded}
+
+def add_record(folder, record):
+    """Добавляет запись в папку и обновляет итоги"""
+    summary = folder_summary(folder)
+    folder['records'].append(record)
+    summary_add(summary, record)
+
+def extend_records(folder, records):
+    """Добавляет пачку записей в папку и обновляет итоги"""
+    summary = folder_summary(folder)
+    folder['records'].extend(records)
+    for record in records:
+        summary_add(summary, record)
+
+def delete_record(folder, index):
+    """Удаляет запись из папки и обновляет итоги"""
+    summary = folder_summary(folder)
+    record = folder['records'].pop(index)
+    summary_add(summary, record, -1)
+    return record
+
+# ====================== КОЛОНОЧНОЕ ПРЕДСТАВЛЕНИЕ ======================
+# Для отчетов по многолетней истории все записи пользователя
+# раскладываются в непрерывные колонки: сумма, время, тип, валюта, папка
+# и месяц, плюс сумма в базовой валюте. Группировки по папке, месяцу и
+# валюте тогда считаются векторно на NumPy. Без NumPy колонки хранятся в array.array, а итоги
+# считаются обычным циклом - результат тот же.
+_numpy = False
+
+def get_numpy():
+    """Модуль numpy или None; импортируется только при первой надобности"""
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = None
+    return _numpy
+
+def column_value(value):
+    """Значение колонки "value": NaN вместо суммы без курса"""
+    return float("nan") if value is None else value
+
+class ColumnStore:
+    """Колонки всех записей пользователя для векторных итогов"""
+    COLUMNS = ("minor", "value", "ts", "kind", "currency", "folder", "month")
+    
+    def __init__(self, base):
+        self.np = get_numpy()
+        self.base = base
+        self.size = 0
+        self.folder_names = []
+        self.folder_ids = {}
+        # "value" - сумма в базовой валюте без округления (см. to_base),
+        # NaN - у валюты нет курса
+        if self.np is not None:
+            self.columns = {name: self.np.zeros(0, dtype=self.np.float64 if name == "value"
+                                                else self.np.int64)
+                            for name in self.COLUMNS}
+        else:
+            self.columns = {name: array('d' if name == "value" else 'q') for name in self.COLUMNS}
+            
+    @classmethod
+    @profiled
+    def build(cls, folders, base):
+        """folders - пары (имя, папка); папки могут приходить по одной"""
+        store = cls(base)
+        for folder_name, folder in folders:
+            store.extend(folder_name, folder.get('records', []))
+        return store
+        
+    def folder_id(self, folder_name):
+        folder_id = self.folder_ids.get(folder_name)
+        if folder_id is None:
+            folder_id = self.folder_ids[folder_name] = len(self.folder_names)
+            self.folder_names.append(folder_name)
+        return folder_id
+        
+    def append(self, folder_name, record):
+        self.extend(folder_name, [record])
+        
+    def extend(self, folder_name, records):
+        """Дописывает записи папки в конец колонок"""
+        if not records:
+            return
+        folder_id = self.folder_id(folder_name)
+        values = {
+            "minor": [record.minor for record in records],
+            "value": [column_value(to_base(record, self.base)) for record in records],
+            "ts": [record.ts or 0 for record in records],
+            "kind": [record.kind for record in records],
+            "currency": [record.currency for record in records],
+            "folder": [folder_id] * len(records),
+            "month": [month_key(record.ts) for record in records]
+        }
+        if self.np is None:
+            for name, column in self.columns.items():
+                column.extend(values[name])
+            self.size += len(records)
+            return
+            
+        end = self.size + len(records)
+        capacity = len(self.columns["minor"])
+        if end > capacity:
+            # Емкость растет вдвое, чтобы дописывание было амортизированно O(1)
+            capacity = max(end, capacity * 2, 1024)
+            for name, column in self.columns.items():
+                grown = self.np.zeros(capacity, dtype=column.dtype)
+                grown[:self.size] = column[:self.size]
+                self.columns[name] = grown
+        for name, column in self.columns.items():
+            column[self.size:end] = values[name]
+        self.size = end
+        
+    @profiled
+    def group_totals(self, by):
+        """Итоги по папке, месяцу или валюте: {ключ: summary}, по возрастанию
+        ключа. По валютам суммы без перевода, остальное - в базовой валюте"""
+        if self.np is not None:
+            groups = self._group_numpy(by)
+        else:
+            groups = self._group_python(by)
+            
+        result = {}
+        for key, income, expense, count, excluded in groups:
+            if by == "folder":
+                key = self.folder_names[key]
+            elif by == "currency":
+                key = CURRENCY_NAMES[key]
+            else:
+                key = month_label(key)
+            if by != "currency":
+                income, expense = round(income), round(expense)
+            result[key] = {"income": income, "expense": expense,
+                           "balance": income - expense, "count": count, "excluded": excluded}
+        return result
+        
+    def _group_numpy(self, by):
+        np = self.np
+        if not self.size:
+            return []
+        keys = self.columns[by][:self.size]
+        minor = self.columns["minor" if by == "currency" else "value"][:self.size]
+        is_income = self.columns["kind"][:self.size] == Record.INCOME
+        missing = np.isnan(minor) if by != "currency" else np.zeros(self.size, dtype=bool)
+        minor = np.where(missing, 0, minor)
+        
+        # Сортируем по ключу и суммируем отрезки одинаковых ключей
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+        income = np.add.reduceat(np.where(is_income, minor, 0)[order], starts)
+        expense = np.add.reduceat(np.where(is_income, 0, minor)[order], starts)
+        counts = np.diff(np.append(starts, self.size))
+        excluded = np.add.reduceat(missing[order].astype(np.int64), starts)
+        return zip(sorted_keys[starts].tolist(), income.tolist(), expense.tolist(), counts.tolist(),
+                   excluded.tolist())
+        
+    def _group_python(self, by):
+        groups = {}
+        columns = self.columns
+        amounts = columns["minor" if by == "currency" else "value"]
+        for key, minor, kind in zip(columns[by], amounts, columns["kind"]):
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = [0, 0, 0, 0]
+            if minor != minor:
+                # NaN - у валюты нет курса
+                group[3] += 1
+            else:
+                group[0 if kind == Record.INCOME else 1] += minor
+            group[2] += 1
+        return [(key,) + tuple(groups[key]) for key in sorted(groups)]
+
+# ====================== ВРЕМЕННОЙ ИНДЕКС ======================
+# Для фильтра по датам у каждой папки есть отсортированный индекс времени
+# записей с префиксными суммами дохода и расхода в базовой валюте. Диапазон дат - это два
+# bisect: записи берутся срезом, итоги - разностью префиксных сумм, без
+# разбора и проверки каждой записи. Суммы не округляются до итога, как
+# и в convert_summary.
+FILTER_PERIODS = ("all", "today", "week", "month", "year", "custom")
+DAY_FORMAT = "%d.%m.%Y"
+
+def period_range(period, now=None):
+    """Полуинтервал [начало, конец) в секундах эпохи; None для "all" """
+    now = now or datetime.now()
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "today":
+        start, end = day, day + timedelta(days=1)
+    elif period == "week":
+        start = day - timedelta(days=day.weekday())
+        end = start + timedelta(days=7)
+    elif period == "month":
+        start = day.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1)
+    elif period == "year":
+        start = day.replace(month=1, day=1)
+        end = start.replace(year=start.year + 1)
+    else:
+        return None
+    return int(start.timestamp()), int(end.timestamp())
+
+def parse_day_range(start_text, end_text):
+    """Произвольный диапазон из двух дат "дд.мм.гггг" включительно"""
+    start = datetime.strptime(start_text.strip(), DAY_FORMAT)
+    end = datetime.strptime(end_text.strip(), DAY_FORMAT) + timedelta(days=1)
+    if end <= start:
+        raise ValueError("empty date range")
+    return int(start.timestamp()), int(end.timestamp())
+
+class TimeIndex:
+    """Записи папки, упорядоченные по времени, с префиксными суммами"""
+    
+    @profiled
+    def __init__(self, records, base):
+        self.base = base
+        # Записи без даты в индекс не попадают и в диапазоны не входят
+        entries = sorted((record.ts, position) for position, record in enumerate(records)
+                         if record.ts is not None)
+        self.keys = [ts for ts, _ in entries]
+        self.positions = [position for _, position in entries]
+        self.values = [to_base(records[position], base) for position in self.positions]
+        self.kinds = [records[position].kind for position in self.positions]
+        self.income = [0]
+        self.expense = [0]
+        # Число записей без курса (value None) - они в суммы не входят
+        self.excluded = [0]
+        self.rebuild_sums(0)
+        
+    def rebuild_sums(self, start):
+        """Пересчитывает префиксные суммы начиная с позиции start"""
+        del self.income[start + 1:]
+        del self.expense[start + 1:]
+        del self.excluded[start + 1:]
+        income, expense, excluded = self.income[start], self.expense[start], self.excluded[start]
+        for value, kind in zip(self.values[start:], self.kinds[start:]):
+            if value is None:
+                excluded += 1
+            elif kind == Record.INCOME:
+                income += value
+            else:
+                expense += value
+            self.income.append(income)
+            self.expense.append(expense)
+            self.excluded.append(excluded)
+            
+    def insert(self, position, record):
+        """Добавляет запись, дописанную в папку на место position"""
+        if record.ts is None:
+            return
+        # Новая запись обычно самая поздняя - тогда это дописывание в конец
+        i = bisect_right(self.keys, record.ts)
+        self.keys.insert(i, record.ts)
+        self.positions.insert(i, position)
+        self.values.insert(i, to_base(record, self.base))
+        self.kinds.insert(i, record.kind)
+        self.rebuild_sums(i)
+        
+    def remove(self, position):
+        """Убирает запись с позиции position и сдвигает позиции после нее"""
+        found = None
+        positions = self.positions
+        for i, value in enumerate(positions):
+            if value == position:
+                found = i
+            elif value > position:
+                positions[i] = value - 1
+        if found is None:
+            return
+        for column in (self.keys, self.positions, self.values, self.kinds):
+            del column[found]
+        self.rebuild_sums(found)
+        
+    def bounds(self, time_range):
+        start, end = time_range
+        return bisect_left(self.keys, start), bisect_left(self.keys, end)
+        
+    def positions_in(self, time_range):
+        """Позиции записей в диапазоне, по возрастанию времени"""
+        lo, hi = self.bounds(time_range)
+        return self.positions[lo:hi]
+        
+    @profiled
+    def totals(self, time_range):
+        """Итоги диапазона за O(log n)"""
+        lo, hi = self.bounds(time_range)
+        income = round(self.income[hi] - self.income[lo])
+        expense = round(self.expense[hi] - self.expense[lo])
+        return {"income": income, "expense": expense, "balance": income - expense,
+                "count": hi - lo, "excluded": self.excluded[hi] - self.excluded[lo]}
+
+# ====================== ПОИСК ======================
+# Поиск по названиям записей во всех папках идет по инвертированному
+# индексу: слово названия -> записи с ним. Словарь слов хранится
+# отсортированным, поэтому слова с заданным префиксом находятся двумя
+# bisect. Индекс строится при первом поиске и дальше правится при
+# добавлении и удалении записей.
+SEARCH_PAGE_SIZE = 20
+WORD_RE = re.compile(r"\w+")
+
+def name_words(name):
+    return set(WORD_RE.findall(name.lower()))
+
+class SearchIndex:
+    """Инвертированный индекс названий записей пользователя"""
+    
+    def __init__(self):
+        self.postings = {}
+        self.vocabulary = []
+        self.folders = {}
+        
+    @classmethod
+    @profiled
+    def build(cls, folders):
+        index = cls()
+        for folder_name, folder in folders.items():
+            for record in folder.get('records', []):
+                index.add(folder_name, record)
+        return index
+        
+    def add(self, folder_name, record):
+        self.folders[record] = folder_name
+        for word in name_words(record.name):
+            posting = self.postings.get(word)
+            if posting is None:
+                posting = self.postings[word] = set()
+                insort(self.vocabulary, word)
+            posting.add(record)
+            
+    def remove(self, record):
+        if self.folders.pop(record, None) is None:
+            return
+        for word in name_words(record.name):
+            posting = self.postings.get(word)
+            if posting is None:
+                continue
+            posting.discard(record)
+            if not posting:
+                del self.postings[word]
+                del self.vocabulary[bisect_left(self.vocabulary, word)]
+                
+    def prefix_matches(self, prefix):
+        """Записи, у которых есть слово, начинающееся с prefix"""
+        lo = bisect_left(self.vocabulary, prefix)
+        hi = bisect_left(self.vocabulary, prefix + "\uffff")
+        if hi - lo == 1:
+            return self.postings[self.vocabulary[lo]]
+        matches = set()
+        for word in self.vocabulary[lo:hi]:
+            matches |= self.postings[word]
+        return matches
+        
+    @profiled
+    def search(self, query, page=0, page_size=SEARCH_PAGE_SIZE):
+        """Страница результатов [(папка, запись)] и общее число совпадений.
+        Каждое слово запроса - префикс слова названия; выше стоят
+        точные совпадения названия, затем короткие и более новые записи"""
+        words = WORD_RE.findall(query.lower())
+        if not words:
+            return [], 0
+        # Пересекаем начиная с самого короткого множества
+        candidates = sorted((self.prefix_matches(word) for word in words), key=len)
+        matches = candidates[0]
+        for other in candidates[1:]:
+            matches = matches & other
+            if not matches:
+                return [], 0
+                
+        text = " ".join(words)
+        def rank(record):
+            name = record.name.lower()
+            return (name != text, not name.startswith(text), len(name), -(record.ts or 0))
+            
+        # Сортируем не все совпадения, а только нужные до конца страницы
+        end = (page + 1) * page_size
+        top = heapq.nsmallest(end, matches, key=rank)
+        return [(self.folders[record], record) for record in top[page * page_size:end]], len(matches)
+
+# ====================== ЖУРНАЛ ИЗМЕНЕНИЙ ======================
+# Изменение данных пользователя дописывается в его journal.log одной
+# строкой JSON, поэтому добавление записи стоит O(1) байт на диске.
+# Журнал периодически сворачивается в фоне в файлы папок, а при загрузке
+# проигрывается поверх них. Номер seq, сохраненный в каждом файле папки,
+# защищает от повторного применения записей после сбоя.
+FOLDER_OPS = ("create_folder", "set_folder", "add_record", "add_records", "delete_record")
+
+def read_journal(path):
+    """Читает записи журнала, пропуская оборванную последнюю строку"""
+    if not os.path.exists(path):
+        return
+    if PROFILER.enabled:
+        PROFILER.add_bytes(read=os.path.getsize(path))
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                return
+
+def apply_change(folders, change):
+    """Применяет одну запись журнала к папкам пользователя"""
+    op = change.get("op")
+    if op == "set_folders":
+        folders.clear()
+        for name, data in change["folders"].items():
+            folders[name] = decode_folder(data)
+        return
+        
+    folder_name = change.get("folder")
+    if op == "create_folder":
+        folders.setdefault(folder_name, {"records": []})
+    elif op == "set_folder":
+        folders[folder_name] = decode_folder(change["data"])
+    elif op == "add_record":
+        add_record(folders.setdefault(folder_name, {"records": []}),
+                   decode_record(change["record"]))
+    elif op == "add_records":
+        extend_records(folders.setdefault(folder_name, {"records": []}),
+                       [decode_record(record) for record in change["records"]])
+    elif op == "delete_record":
+        folder = folders.get(folder_name, {"records": []})
+        if 0 <= change["index"] < len(folder.get("records", [])):
+            delete_record(folder, change["index"])
+
+def apply_summary_change(summaries, change):
+    """То же, но только для итогов папок, без самих записей. Итоги,
+    которые без записей не восстановить, становятся None"""
+    op = change.get("op")
+    if op == "set_folders":
+        summaries.clear()
+        for name, data in change["folders"].items():
+            summaries[name] = folder_summary(decode_folder(data))
+        return
+        
+    folder_name = change.get("folder")
+    if op == "set_folder":
+        summaries[folder_name] = folder_summary(decode_folder(change["data"]))
+        return
+    summary = summaries.setdefault(folder_name, empty_summary())
+    if summary is None:
+        return
+    if op == "add_record":
+        summary_add(summary, decode_record(change["record"]))
+    elif op == "add_records":
+        for record in change["records"]:
+            summary_add(summary, decode_record(record))
+    elif op == "delete_record":
+        if "record" in change:
+            summary_add(summary, decode_record(change["record"]), -1)
+        else:
+            summaries[folder_name] = None
+
+# ====================== ФОРМАТ ФАЙЛОВ ПАПОК ======================
+# Формат файлов папок выбирается в настройках ("data_format"):
+#   json    - читаемый JSON с отступами (по умолчанию)
+#   compact - тот же JSON без отступов и пробелов
+#   binary  - записи фиксированными структурами SHARD_RECORD, имена одной
+#             строкой UTF-8, прочее (итоги, таблица валют) - коротким JSON
+# Суффикс "+zlib" дополнительно сжимает файл. Формат определяется по
+# первым байтам, поэтому файлы разных форматов читаются одинаково, а
+# при смене настройки старые файлы переписываются постепенно.
+DATA_FORMATS = ("json", "compact", "compact+zlib", "binary", "binary+zlib")
+SHARD_MAGIC = b"FMB1"
+SHARD_HEADER = struct.Struct("<q40s")
+SHARD_RECORD = struct.Struct("<qqBHI")
+SHARD_NO_TS = -1 << 63
+
+def get_data_format():
+    data_format = load_settings().get("data_format", "json")
+    return data_format if data_format in DATA_FORMATS else "json"
+
+def encode_records(folder):
+    """Тело двоичного файла папки: длина и JSON прочих полей, затем
+    записи структурами SHARD_RECORD и их имена одной строкой"""
+    records = folder.get('records', [])
+    currencies = {}
+    names = []
+    parts = [b""]
+    pack = SHARD_RECORD.pack
+    for record in records:
+        currency = currencies.get(record.currency)
+        if currency is None:
+            currency = currencies[record.currency] = len(currencies)
+        names.append(record.name)
+        parts.append(pack(record.minor, SHARD_NO_TS if record.ts is None else record.ts,
+                          record.kind, currency, len(record.name)))
+    meta = {"count": len(records), "currencies": [CURRENCY_NAMES[code] for code in currencies],
+            "folder": {key: value for key, value in folder.items() if key != 'records'}}
+    raw = {str(i): record.raw for i, record in enumerate(records) if record.raw}
+    if raw:
+        meta["raw"] = raw
+    meta = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    parts[0] = struct.pack("<I", len(meta)) + meta
+    parts.append("".join(names).encode("utf-8"))
+    return b"".join(parts)
+
+def decode_records(body):
+    """Папка из тела двоичного файла (записи сразу Record)"""
+    meta_size = struct.unpack_from("<I", body)[0]
+    meta = json.loads(body[4:4 + meta_size])
+    codes = [currency_code(name) for name in meta["currencies"]]
+    start = 4 + meta_size
+    end = start + meta["count"] * SHARD_RECORD.size
+    names = body[end:].decode("utf-8")
+    intern = sys.intern
+    records = []
+    offset = 0
+    for minor, ts, kind, currency, length in SHARD_RECORD.iter_unpack(body[start:end]):
+        records.append(Record(intern(names[offset:offset + length]), minor,
+                              None if ts == SHARD_NO_TS else ts, kind, codes[currency]))
+        offset += length
+    for i, raw in meta.get("raw", {}).items():
+        records[int(i)].raw = raw
+    folder = meta["folder"]
+    folder['records'] = records
+    return folder
+
+def encode_shard(folder, data_format):
+    """Тело файла папки в формате data_format (по нему считается хэш)"""
+    kind = data_format.partition("+")[0]
+    if kind == "binary":
+        return encode_records(folder)
+    if kind == "compact":
+        payload = json.dumps(folder, ensure_ascii=False, separators=(",", ":"), default=encode_json)
+    else:
+        payload = json.dumps(folder, ensure_ascii=False, indent=2, default=encode_json)
+    return payload.encode("utf-8")
+
+def pack_shard(seq, digest, body, data_format):
+    """Полный файл папки: seq, хэш и тело (по желанию сжатое)"""
+    kind, _, compression = data_format.partition("+")
+    if kind == "binary":
+        data = SHARD_MAGIC + SHARD_HEADER.pack(seq, digest.encode("ascii")) + body
+    else:
+        data = b'{"seq": %d, "hash": "%s", "data": %s}' % (seq, digest.encode("ascii"), body)
+    if compression == "zlib":
+        data = zlib.compress(data, 6)
+    return data
+
+def decode_shard(data):
+    """Файл папки любого формата -> {"seq", "hash", "data"}"""
+    if data[:1] == b"\x78":
+        data = zlib.decompress(data)
+    if data.startswith(SHARD_MAGIC):
+        seq, digest = SHARD_HEADER.unpack_from(data, len(SHARD_MAGIC))
+        body = data[len(SHARD_MAGIC) + SHARD_HEADER.size:]
+        return {"seq": seq, "hash": digest.decode("ascii"), "data": decode_records(body)}
+    return json.loads(data)
+
+# ====================== ШАРДИРОВАННОЕ ХРАНИЛИЩЕ ======================
+# Каждый пользователь живет в своей папке users/<user_id>/:
+#   profile.json  - email, никнейм и порядок папок
+#   folders/*.json - по файлу на каждую финансовую папку
+#   summaries.json - итоги каждой папки на момент записи ее файла
+#   journal.log   - журнал изменений поверх этих файлов
+# Вход одного пользователя не читает чужие данные, а сохранение
+# переписывает только грязные папки, и только если изменился их хэш.
+_user_stores = {}
+
+def get_user_store(user_id):
+    """Возвращает хранилище пользователя (одно на user_id)"""
+    store = _user_stores.get(user_id)
+    if store is None:
+        if get_storage_backend() == "sqlite":
+            store = SqliteStore(get_database(), user_id)
+        else:
+            store = UserStore(user_id)
+        _user_stores[user_id] = store
+    return store
+
+def migrate_legacy_users():
+    """Переносит единый users.json в папки пользователей"""
+    if not os.path.exists(USERS_FILE):
+        return
+    users = read_json(USERS_FILE) or {}
+    users.pop("_journal_seq", None)
+    
+    # Доигрываем журнал единого хранилища, если он остался
+    for path in (LEGACY_JOURNAL_FILE + ".old", LEGACY_JOURNAL_FILE):
+        for change in read_journal(path):
+            if change.get("op") == "register":
+                users[change["user"]] = change["profile"]
+            elif change.get("user") in users:
+                user = users[change["user"]]
+                folders = user.setdefault("data", {}).setdefault("folders", {})
+                apply_change(folders, change)
+                
+    for user_id, user in users.items():
+        for folder in user.get("data", {}).get("folders", {}).values():
+            decode_folder(folder)
+        get_user_store(user_id).save_user(user)
+        add_account(user_id, user)
+        
+    os.replace(USERS_FILE, USERS_FILE + ".migrated")
+    for path in (LEGACY_JOURNAL_FILE + ".old", LEGACY_JOURNAL_FILE):
+        if os.path.exists(path):
+            os.remove(path)
+
+class UserStore:
+    """Шардированное хранилище данных одного пользователя"""
+    
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.path = os.path.join(USERS_DIR, user_id)
+        self.folders_dir = os.path.join(self.path, "folders")
+        self.profile_file = os.path.join(self.path, "profile.json")
+        self.summaries_file = os.path.join(self.path, "summaries.json")
+        self.journal_file = os.path.join(self.path, "journal.log")
+        self.journal_old_file = self.journal_file + ".old"
+        self.journal_prev_file = self.journal_file + ".prev"
+        self.data_format = get_data_format()
+        
+        self.lock = threading.RLock()
+        self.seq = None
+        self.journal_count = 0
+        self.compacting = False
+        
+        # Грязные папки (изменены после последней записи файлов) и
+        # хэши содержимого уже записанных файлов папок
+        self.dirty = set()
+        self.profile_dirty = False
+        self.hashes = {}
+        
+        # seq файлов .bak (папка -> seq, None - профиль) для journal.prev
+        # и файлы, восстановленные при чтении, - о них говорим пользователю
+        self.backup_seqs = {}
+        self.recovered = []
+        
+    def exists(self):
+        return os.path.exists(self.profile_file)
+        
+    def load_profile(self, recovered=None):
+        """Загрузка профиля без финансовых данных"""
+        # Файлы читаются под той же блокировкой, под которой пишутся:
+        # чтение между заменой файла и записью его .sum приняло бы целый
+        # файл за поврежденный и убрало бы его в .corrupt
+        with self.lock:
+            return read_json(self.profile_file, recovered)
+        
+    def shard_file(self, folder_name):
+        digest = hashlib.sha1(folder_name.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.folders_dir, digest + ".json")
+        
+    def load_shard(self, folder_name, remember_hash=True, recovered=None):
+        """Загрузка файла папки -> (данные, seq)"""
+        with self.lock:
+            shard = read_snapshot(self.shard_file(folder_name), decode_shard, recovered)
+        if shard is None:
+            return {"records": []}, 0
+        if remember_hash:
+            self.hashes[folder_name] = shard.get("hash")
+        return decode_folder(shard.get("data", {"records": []})), shard.get("seq", 0)
+        
+    def replay(self, profile, folders, seqs, paths, apply=apply_change):
+        """Проигрывает журналы поверх загруженных файлов (или, с
+        apply=apply_summary_change, поверх итогов папок).
+        Возвращает затронутые папки (None - профиль), последний seq
+        и число примененных записей"""
+        touched = set()
+        applied = 0
+        profile_seq = profile.get("seq", 0)
+        last_seq = max([profile_seq] + list(seqs.values()))
+        
+        for path in paths:
+            for change in read_journal(path):
+                seq = change.get("seq", 0)
+                last_seq = max(last_seq, seq)
+                op = change.get("op")
+                if op == "set_folders":
+                    if seq <= profile_seq:
+                        continue
+                    apply(folders, change)
+                    profile_seq = seq
+                    for name in folders:
+                        seqs[name] = seq
+                    touched.update(folders)
+                    touched.add(None)
+                    applied += 1
+                elif op in FOLDER_OPS:
+                    folder_name = change.get("folder")
+                    if seq <= seqs.get(folder_name, 0):
+                        continue
+                    if folder_name not in folders:
+                        touched.add(None)
+                    apply(folders, change)
+                    seqs[folder_name] = seq
+                    touched.add(folder_name)
+                    applied += 1
+                    
+        return touched, last_seq, applied
+        
+    def load(self):
+        """Загрузка пользователя: профиль, файлы папок и журнал"""
+        recovered = []
+        profile = self.load_profile(recovered)
+        if profile is None:
+            return None
+            
+        folders = {}
+        seqs = {}
+        for folder_name in profile.get("folders", []):
+            folders[folder_name], seqs[folder_name] = self.load_shard(
+                folder_name, recovered=recovered)
+            
+        with self.lock:
+            self.start_session(profile, folders, seqs, recovered)
+            
+        user = {key: value for key, value in profile.items()
+                if key not in ("folders", "seq")}
+        user["data"] = {"folders": folders}
+        return user
+        
+    def start_session(self, profile, items, seqs, recovered, apply=apply_change):
+        """Проигрывает журналы и запоминает seq и грязные папки"""
+        touched, last_seq, applied = self.replay(
+            profile, items, seqs, self.journal_paths(recovered, self.journal_file), apply)
+        self.seq = last_seq
+        self.journal_count = applied
+        self.profile_dirty = None in touched
+        touched.discard(None)
+        self.dirty = touched
+        
+    @profiled
+    def load_summaries(self):
+        """Быстрая загрузка для входа: профиль и итоги папок из
+        summaries.json с журналом поверх них, без файлов папок.
+        В data["folders"] у всех папок None - записи не загружены
+        (см. load_folder), их итоги лежат в data["summaries"]"""
+        with self.lock:
+            recovered = []
+            profile = self.load_profile(recovered)
+            if profile is None:
+                return None
+            damaged = []
+            entries = (read_json(self.summaries_file, damaged) or {}).get("folders", {})
+            if damaged:
+                # Итоги из .bak могут быть старше сохраненных журналов
+                entries = {}
+            
+            summaries = {}
+            seqs = {}
+            missing = {}
+            for folder_name in profile.get("folders", []):
+                entry = entries.get(folder_name)
+                if entry is not None and entry["summary"].get("v") == SUMMARY_VERSION:
+                    summaries[folder_name], seqs[folder_name] = entry["summary"], entry["seq"]
+                    continue
+                # Данные прежней версии или сбой: итоги считаются по файлу папки
+                folder, seqs[folder_name] = self.load_shard(folder_name, recovered=recovered)
+                summaries[folder_name] = folder_summary(folder)
+                missing[folder_name] = {"seq": seqs[folder_name], "summary": summaries[folder_name]}
+            if missing:
+                self.write_summaries(missing, list(summaries))
+                
+            self.start_session(profile, summaries, seqs, recovered, apply_summary_change)
+            for folder_name, summary in summaries.items():
+                if summary is None:
+                    summaries[folder_name] = folder_summary(self.load_folder(folder_name))
+                    
+        user = {key: value for key, value in profile.items()
+                if key not in ("folders", "seq")}
+        user["data"] = {"folders": dict.fromkeys(summaries), "summaries": summaries}
+        return user
+        
+    @profiled
+    def load_folder(self, folder_name):
+        """Загрузка записей одной папки: ее файл и журнал поверх него"""
+        def apply(folders, change):
+            if change.get("folder") in (folder_name, None):
+                apply_change(folders, change)
+                
+        # Под блокировкой сворачивание журнала не заменит файл папки
+        # между его чтением и чтением журнала
+        with self.lock:
+            recovered = []
+            folders = {}
+            seqs = {}
+            folders[folder_name], seqs[folder_name] = self.load_shard(
+                folder_name, recovered=recovered)
+            profile = self.load_profile() or {}
+            self.replay(profile, folders, seqs,
+                        self.journal_paths(recovered, self.journal_file), apply)
+        return folders.get(folder_name, {"records": []})
+        
+    def write_summaries(self, updates, order):
+        """Обновляет в summaries.json итоги папок updates ({папка:
+        {"seq", "summary"}}) и убирает папки, которых нет в order"""
+        entries = (read_json(self.summaries_file) or {}).get("folders", {})
+        entries.update(updates)
+        entries = {name: entries[name] for name in order if name in entries}
+        write_text(self.summaries_file,
+                   json.dumps({"folders": entries}, ensure_ascii=False, separators=(",", ":")))
+        
+    def create(self, profile):
+        """Создает нового пользователя"""
+        os.makedirs(self.folders_dir, exist_ok=True)
+        with self.lock:
+            self.seq = 0
+            self.write_profile(dict(profile, folders=[], seq=0))
+        
+    def write_profile(self, profile):
+        os.makedirs(self.folders_dir, exist_ok=True)
+        write_text(self.profile_file, json.dumps(profile, ensure_ascii=False, indent=2))
+        self.backup_seqs.pop(None, None)
+        
+    def write_shard(self, folder_name, data, seq):
+        """Записывает файл папки, если ее содержимое изменилось"""
+        body = encode_shard(data, self.data_format)
+        digest = hashlib.sha1(body).hexdigest()
+        if self.hashes.get(folder_name) == digest:
+            return False
+        write_snapshot(self.shard_file(folder_name), pack_shard(seq, digest, body, self.data_format), seq)
+        self.hashes[folder_name] = digest
+        self.backup_seqs.pop(folder_name, None)
+        return True
+        
+    def log_change(self, change):
+        """Дописывает изменение в журнал и помечает папку грязной"""
+        return self.log_changes([change])
+        
+    @profiled
+    def log_changes(self, changes):
+        """Дописывает пачку изменений в журнал одной записью в файл.
+        Папки помечаются грязными до записи: если дозапись не удалась,
+        полная запись save() все равно возьмет их из памяти"""
+        if self.seq is None:
+            self.load()
+        try:
+            with self.lock:
+                for change in changes:
+                    if change.get("op") == "set_folders":
+                        self.dirty.update(change["folders"])
+                        self.profile_dirty = True
+                    else:
+                        self.dirty.add(change.get("folder"))
+                        if change.get("op") == "create_folder":
+                            self.profile_dirty = True
+                            
+                lines = []
+                for change in changes:
+                    entry = dict(change, seq=self.seq + len(lines) + 1)
+                    lines.append(json.dumps(entry, ensure_ascii=False, separators=(",", ":"),
+                                            default=encode_json))
+                text = "\n".join(lines) + "\n"
+                if PROFILER.enabled:
+                    PROFILER.add_bytes(written=len(text.encode("utf-8")))
+                size = os.path.getsize(self.journal_file) if os.path.exists(self.journal_file) else 0
+                try:
+                    with open(self.journal_file, "a", encoding="utf-8") as f:
+                        f.write(text)
+                except:
+                    # Оборванная строка остановила бы проигрывание журнала
+                    # на ней - вместе с повтором этой пачки после нее
+                    try:
+                        with open(self.journal_file, "r+b") as f:
+                            f.truncate(size)
+                    except OSError:
+                        pass
+                    raise
+                self.seq += len(lines)
+                self.journal_count += len(lines)
+                need_compaction = self.journal_count >= JOURNAL_COMPACT_EVERY
+        except:
+            return False
+        if need_compaction:
+            self.start_compaction()
+        return True
+        
+    @profiled
+    def save(self, folders):
+        """Записывает только грязные папки и обнуляет журнал"""
+        if self.seq is None:
+            self.load()
+        try:
+            with self.lock:
+                updates = {}
+                for folder_name in list(self.dirty):
+                    if folder_name in folders:
+                        data = folders[folder_name]
+                        if data is None:
+                            # Записи папки не загружены - берем их с диска
+                            data = self.load_folder(folder_name)
+                        self.write_shard(folder_name, data, self.seq)
+                        updates[folder_name] = {"seq": self.seq, "summary": folder_summary(data)}
+                if updates:
+                    self.write_summaries(updates, list(folders))
+                profile = self.load_profile() or {}
+                if self.profile_dirty or profile.get("folders") != list(folders):
+                    profile["folders"] = list(folders)
+                    profile["seq"] = self.seq
+                    self.write_profile(profile)
+                    
+                self.retire_journals(self.journal_old_file, self.journal_file)
+                self.dirty = set()
+                self.profile_dirty = False
+                self.journal_count = 0
+            return True
+        except:
+            return False
+            
+    def save_user(self, user):
+        """Полная запись пользователя (регистрация и миграция)"""
+        folders = user.get("data", {}).get("folders", {})
+        profile = {key: value for key, value in user.items() if key != "data"}
+        if not self.exists():
+            self.create(profile)
+        if self.seq is None:
+            self.load()
+        self.dirty.update(folders)
+        self.profile_dirty = True
+        return self.save(folders)
+        
+    def rewrite(self, folders, data_format):
+        """Переписывает все файлы папок в новом формате"""
+        if self.seq is None:
+            self.load()
+        self.data_format = data_format
+        self.hashes = {}
+        self.dirty.update(folders)
+        return self.save(folders)
+        
+    @profiled
+    def compact(self):
+        """Сворачивает журнал в файлы затронутых папок"""
+        try:
+            with self.lock:
+                # Если прошлое сворачивание прервалось - сначала доделываем его
+                if not os.path.exists(self.journal_old_file):
+                    if not os.path.exists(self.journal_file):
+                        return
+                    os.replace(self.journal_file, self.journal_old_file)
+                    self.journal_count = 0
+                    
+            # Читаем с диска только папки, упомянутые в журнале (каждый
+            # файл - под блокировкой, см. load_profile)
+            profile = self.load_profile() or {}
+            order = profile.get("folders", [])
+            changes = list(read_journal(self.journal_old_file))
+            full = any(change.get("op") == "set_folders" for change in changes)
+            mentioned = set(change.get("folder") for change in changes)
+            
+            folders = {}
+            seqs = {}
+            recovered = []
+            for folder_name in order:
+                if full or folder_name in mentioned:
+                    folders[folder_name], seqs[folder_name] = self.load_shard(
+                        folder_name, remember_hash=False, recovered=recovered)
+            touched, last_seq, applied = self.replay(
+                profile, folders, seqs, self.journal_paths(recovered))
+            
+            with self.lock:
+                # save() мог уже записать более свежее состояние
+                if not os.path.exists(self.journal_old_file):
+                    return
+                updates = {}
+                for folder_name in touched:
+                    if folder_name is not None:
+                        self.write_shard(folder_name, folders[folder_name], seqs[folder_name])
+                        updates[folder_name] = {"seq": seqs[folder_name],
+                                                "summary": folder_summary(folders[folder_name])}
+                if None in touched:
+                    if full:
+                        profile["folders"] = list(folders)
+                    else:
+                        profile["folders"] = order + [name for name in folders
+                                                      if name not in order]
+                    profile["seq"] = last_seq
+                    self.write_profile(profile)
+                if updates:
+                    self.write_summaries(updates, profile.get("folders", order))
+                self.retire_journals(self.journal_old_file)
+        except:
+            pass
+        finally:
+            self.compacting = False
+            
+    def journal_paths(self, recovered, *current):
+        """Журналы для проигрывания. Если какой-то файл прочитан из .bak,
+        первым идет journal.prev - он догоняет .bak до последней записи"""
+        if recovered:
+            self.recovered.extend(recovered)
+        paths = (self.journal_prev_file,) if recovered else ()
+        return paths + (self.journal_old_file,) + current
+        
+    def take_recovered(self):
+        """Имена восстановленных файлов (папки или "profile") с прошлого вызова"""
+        names = {self.shard_file(name): name
+                 for name in (self.load_profile() or {}).get("folders", [])}
+        names[self.profile_file] = "profile"
+        recovered, self.recovered = self.recovered, []
+        return sorted(set(names.get(path, os.path.basename(path)) for path in recovered))
+        
+    def backup_seq(self, folder_name):
+        """seq файла .bak папки (None - профиля) или None, если .bak нет.
+        Берется из его .sum, а у старых .sum без seq - из самого файла"""
+        if folder_name in self.backup_seqs:
+            return self.backup_seqs[folder_name]
+        seq = None
+        if folder_name is None:
+            try:
+                with open(backup_path(self.profile_file), "r", encoding="utf-8") as f:
+                    seq = json.load(f).get("seq", 0)
+            except:
+                pass
+        else:
+            path = backup_path(self.shard_file(folder_name))
+            try:
+                with open(checksum_path(path), "r", encoding="utf-8") as f:
+                    seq = json.load(f).get("seq")
+            except:
+                pass
+            if seq is None and os.path.exists(path):
+                try:
+                    with open(path, "rb") as f:
+                        seq = decode_shard(f.read()).get("seq", 0)
+                except:
+                    pass
+        self.backup_seqs[folder_name] = seq
+        return seq
+        
+    def needed_for_backup(self, change):
+        """Нужна ли запись журнала, чтобы догнать какой-то .bak"""
+        seq = change.get("seq", 0)
+        op = change.get("op")
+        if op == "set_folders":
+            names = list(change.get("folders", {})) + [None]
+        elif op == "create_folder":
+            names = [change.get("folder"), None]
+        else:
+            names = [change.get("folder")]
+        for name in names:
+            backup = self.backup_seq(name)
+            if backup is not None and seq > backup:
+                return True
+        return False
+        
+    def retire_journals(self, *paths):
+        """Журналы, уже вошедшие в файлы папок, переходят в journal.prev.
+        В нем остаются только записи новее .bak своей папки (и .bak
+        профиля): по ним .bak догоняется до записанного состояния, даже
+        если с тех пор сохранялись только другие папки. Записи старше
+        всех .bak не нужны - файл не растет без конца"""
+        paths = [path for path in paths if os.path.exists(path)]
+        if not paths:
+            return
+        sources = [self.journal_prev_file] if os.path.exists(self.journal_prev_file) else []
+        tmp_path = self.journal_prev_file + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as target:
+            for path in sources + paths:
+                with open(path, "r", encoding="utf-8") as source:
+                    for line in source:
+                        if not line.strip():
+                            continue
+                        try:
+                            change = json.loads(line)
+                        except ValueError:
+                            # Оборванная строка - конец этого журнала
+                            break
+                        if self.needed_for_backup(change):
+                            target.write(line.rstrip("\n") + "\n")
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(tmp_path, self.journal_prev_file)
+        for path in paths:
+            os.remove(path)
+        
+    def start_compaction(self):
+        """Запускает сворачивание журнала в фоновом потоке"""
+        if self.compacting:
+            return
+        self.compacting = True
+        threading.Thread(target=self.compact, daemon=True).start()
+
+# ====================== SQLITE ХРАНИЛИЩЕ ======================
+# Необязательный бэкенд на стандартном sqlite3. Включается ключом
+# "storage": "sqlite" в settings.json; при первом открытии в базу
+# один раз переносятся JSON-файлы пользователей. Записи лежат в таблице
+# с индексами (user, folder, ts) и (user, type), поэтому итоги и открытие
+# папки не требуют полного перебора. Итоги каждой папки хранятся готовыми
+# в таблице summaries и меняются в той же транзакции, что и записи.
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    nickname TEXT NOT NULL,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS folders (
+    user_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (user_id, name)
+);
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    name TEXT,
+    amount TEXT,
+    currency TEXT,
+    date TEXT
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    user_id TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user_id, folder)
+);
+CREATE INDEX IF NOT EXISTS records_folder_ts ON records (user_id, folder, ts);
+CREATE INDEX IF NOT EXISTS records_type ON records (user_id, type);
+"""
+
+_database = None
+
+def get_storage_backend():
+    """Выбранный бэкенд хранения: json или sqlite"""
+    return load_settings().get("storage", "json")
+
+def get_database():
+    """Возвращает общее подключение к SQLite базе"""
+    global _database
+    if _database is None:
+        _database = SqliteDatabase(DATABASE_FILE)
+    return _database
+
+_prepared_backend = None
+
+def prepare_storage():
+    """Переносит старые данные в выбранный бэкенд (один раз за запуск)"""
+    global _prepared_backend
+    backend = get_storage_backend()
+    if _prepared_backend == backend:
+        return
+    ensure_data_dir()
+    migrate_legacy_users()
+    if backend == "sqlite":
+        migrate_json_to_sqlite()
+    _prepared_backend = backend
+
+def migrate_json_to_sqlite():
+    """Однократный перенос JSON-файлов пользователей в SQLite"""
+    if not os.path.isdir(USERS_DIR):
+        return 0
+    database = get_database()
+    moved = 0
+    for user_id in os.listdir(USERS_DIR):
+        if database.user_exists(user_id):
+            continue
+        user = UserStore(user_id).load()
+        if user is not None:
+            SqliteStore(database, user_id).save_user(user)
+            moved += 1
+    return moved
+
+class SqliteDatabase:
+    """Подключение к SQLite базе в режиме WAL"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SQLITE_SCHEMA)
+        self.conn.commit()
+        
+    def user_exists(self, user_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return row is not None
+        
+    def user_ids(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT user_id FROM users")]
+            
+    def checkpoint(self):
+        """Переносит WAL в основной файл базы и обнуляет его"""
+        with self.lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class SqliteStore:
+    """Хранилище пользователя в SQLite с тем же интерфейсом, что UserStore"""
+    
+    def __init__(self, database, user_id):
+        self.database = database
+        self.conn = database.conn
+        self.lock = database.lock
+        self.user_id = user_id
+        # id строк в порядке записей каждой папки (для удаления по индексу)
+        self.record_ids = {}
+        # Папки, чья транзакция откатилась: save() перепишет их из памяти
+        self.dirty = set()
+        self.order_dirty = False
+        
+    def exists(self):
+        return self.database.user_exists(self.user_id)
+        
+    def take_recovered(self):
+        """Файлов снимков нет - восстанавливать нечего"""
+        return []
+        
+    def load_profile(self):
+        """Загрузка профиля без финансовых данных"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT email, nickname, created_at FROM users WHERE user_id = ?",
+                (self.user_id,)).fetchone()
+        if row is None:
+            return None
+        return {"email": row[0], "nickname": row[1], "created_at": row[2]}
+        
+    @profiled
+    def load_folder(self, folder_name):
+        """Загрузка записей одной папки"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, name, amount, type, currency, ts, date FROM records "
+                "WHERE user_id = ? AND folder = ? ORDER BY id",
+                (self.user_id, folder_name)).fetchall()
+            self.record_ids[folder_name] = [row[0] for row in rows]
+        
+        # Дата берется готовой из колонки ts, строка нужна, только если ts нет
+        records = []
+        for row_id, name, amount, record_type, currency, ts, date in rows:
+            minor, _, raw = parse_fields(amount, None if ts else date)
+            records.append(Record(sys.intern(name or 'No name'), minor, ts or None,
+                                  Record.INCOME if record_type == 'income' else Record.EXPENSE,
+                                  currency_code(currency or '$'), raw))
+        
+        # Итоги считает SQL по индексу, без разбора каждой записи в Python
+        summary = self.totals(folder_name).get(folder_name) or empty_summary()
+        return {"records": records, "summary": summary}
+        
+    def folder_names(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute(
+                "SELECT name FROM folders WHERE user_id = ? ORDER BY position",
+                (self.user_id,))]
+                
+    @profiled
+    def load_summaries(self):
+        """Быстрая загрузка для входа: профиль и готовые итоги папок,
+        записи не загружаются (см. load_folder)"""
+        user = self.load_profile()
+        if user is None:
+            return None
+        names = self.folder_names()
+        with self.lock, self.conn:
+            summaries = self.read_summaries(names)
+        user["data"] = {"folders": dict.fromkeys(names), "summaries": summaries}
+        return user
+        
+    def read_summaries(self, names):
+        """Итоги папок names из таблицы summaries. Для папок без строки
+        (база прежней версии) итоги считаются по записям и сохраняются"""
+        summaries = {}
+        for i in range(0, len(names), 500):
+            part = names[i:i + 500]
+            rows = self.conn.execute(
+                "SELECT folder, data FROM summaries WHERE user_id = ? AND folder IN (%s)"
+                % ",".join("?" * len(part)), [self.user_id] + part).fetchall()
+            for folder, data in rows:
+                summary = json.loads(data)
+                if summary.get("v") == SUMMARY_VERSION:
+                    summaries[folder] = summary
+        missing = [name for name in names if name not in summaries]
+        if missing:
+            totals = self.totals() if len(missing) > 1 else self.totals(missing[0])
+            for name in missing:
+                summaries[name] = totals.get(name) or empty_summary()
+            self.write_summaries({name: summaries[name] for name in missing})
+        return {name: summaries[name] for name in names}
+        
+    def write_summaries(self, summaries):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO summaries (user_id, folder, data) VALUES (?, ?, ?)",
+            [(self.user_id, name, json.dumps(summary, separators=(",", ":")))
+             for name, summary in summaries.items()])
+        
+    def load(self):
+        """Загрузка пользователя со всеми папками"""
+        user = self.load_profile()
+        if user is None:
+            return None
+        user["data"] = {"folders": {name: self.load_folder(name) for name in self.folder_names()}}
+        return user
+        
+    def totals(self, folder_name=None):
+        """Итоги папок, посчитанные средствами SQL по папке, типу, валюте
+        и месяцу: {папка: итоги}"""
+        query = ("SELECT folder, type, currency, "
+                 "CASE WHEN ts = 0 THEN -1 ELSE "
+                 "CAST(strftime('%Y', ts, 'unixepoch', 'localtime') AS INTEGER) * 12 + "
+                 "CAST(strftime('%m', ts, 'unixepoch', 'localtime') AS INTEGER) - 1 END AS month, "
+                 "SUM(CAST(ROUND(CAST(amount AS REAL) * 100) AS INTEGER)), "
+                 "COUNT(*) FROM records WHERE user_id = ?")
+        params = [self.user_id]
+        if folder_name is not None:
+            query += " AND folder = ?"
+            params.append(folder_name)
+        with self.lock:
+            rows = self.conn.execute(
+                query + " GROUP BY folder, type, currency, month", params).fetchall()
+                
+        summaries = {}
+        for folder, record_type, currency, month, amount, count in rows:
+            summary = summaries.get(folder)
+            if summary is None:
+                summary = summaries[folder] = empty_summary()
+            amount = amount or 0
+            key = f"{currency_iso(currency or '$')}:{month}"
+            if record_type == "income":
+                summary["income"] += amount
+                bucket_add(summary["buckets"], key, amount, 0, count)
+            else:
+                summary["expense"] += amount
+                bucket_add(summary["buckets"], key, 0, amount, count)
+            summary["count"] += count
+        for summary in summaries.values():
+            summary["balance"] = summary["income"] - summary["expense"]
+        return summaries
+        
+    def create(self, profile):
+        """Создает нового пользователя"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO users (user_id, email, nickname, created_at) VALUES (?, ?, ?, ?)",
+                (self.user_id, profile.get("email", ""), profile.get("nickname", ""),
+                 profile.get("created_at")))
+                 
+    def row_ids(self, folder_name):
+        """id строк папки в порядке ее записей; читаются из базы при
+        первом обращении, если папку еще не загружали"""
+        ids = self.record_ids.get(folder_name)
+        if ids is None:
+            rows = self.conn.execute(
+                "SELECT id FROM records WHERE user_id = ? AND folder = ? ORDER BY id",
+                (self.user_id, folder_name)).fetchall()
+            ids = self.record_ids[folder_name] = [row[0] for row in rows]
+        return ids
+        
+    def insert_records(self, folder_name, records):
+        ids = self.row_ids(folder_name)
+        for record in records:
+            record = decode_record(record)
+            data = record.to_dict()
+            cursor = self.conn.execute(
+                "INSERT INTO records (user_id, folder, ts, type, name, amount, currency, date) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.user_id, folder_name, record.ts or 0, record.type, record.name,
+                 data['amount'], record.currency_name, data.get('date')))
+            ids.append(cursor.lastrowid)
+            
+    def replace_folder(self, folder_name, data):
+        self.conn.execute("DELETE FROM records WHERE user_id = ? AND folder = ?",
+                          (self.user_id, folder_name))
+        self.record_ids[folder_name] = []
+        self.insert_records(folder_name, data.get("records", []))
+        
+    def add_folder(self, folder_name):
+        position = self.conn.execute(
+            "SELECT COALESCE(MAX(position) + 1, 0) FROM folders WHERE user_id = ?",
+            (self.user_id,)).fetchone()[0]
+        self.conn.execute(
+            "INSERT OR IGNORE INTO folders (user_id, name, position) VALUES (?, ?, ?)",
+            (self.user_id, folder_name, position))
+            
+    def log_change(self, change):
+        """Сразу применяет изменение к базе одной транзакцией"""
+        return self.log_changes([change])
+        
+    @profiled
+    def log_changes(self, changes):
+        """Применяет пачку изменений к базе одной транзакцией"""
+        try:
+            with self.lock, self.conn:
+                summaries = {}
+                for change in changes:
+                    if change.get("op") == "set_folders":
+                        self.conn.execute("DELETE FROM summaries WHERE user_id = ?",
+                                          (self.user_id,))
+                    elif change.get("folder") not in summaries:
+                        # Итоги читаются до изменения - оно применится к ним ниже
+                        summaries.update(self.read_summaries([change.get("folder")]))
+                    self.apply(change)
+                    apply_summary_change(summaries, change)
+                for name, summary in summaries.items():
+                    if summary is None:
+                        summaries[name] = self.totals(name).get(name) or empty_summary()
+                self.write_summaries(summaries)
+            return True
+        except:
+            self.rolled_back(changes)
+            return False
+            
+    def rolled_back(self, changes):
+        """Транзакция откатилась: id строк будут прочитаны заново (apply мог
+        их уже изменить), папки помечаются для полной записи в save()"""
+        with self.lock:
+            for change in changes:
+                if change.get("op") == "set_folders":
+                    self.dirty.update(change["folders"])
+                    self.order_dirty = True
+                else:
+                    self.dirty.add(change.get("folder"))
+            self.record_ids = {}
+            
+    def apply(self, change):
+        """Одно изменение внутри уже открытой транзакции"""
+        op = change.get("op")
+        folder_name = change.get("folder")
+        if op == "set_folders":
+            self.conn.execute("DELETE FROM folders WHERE user_id = ?", (self.user_id,))
+            self.conn.execute("DELETE FROM records WHERE user_id = ?", (self.user_id,))
+            self.record_ids = {}
+            for name, data in change["folders"].items():
+                self.add_folder(name)
+                self.insert_records(name, data.get("records", []))
+        elif op == "create_folder":
+            self.add_folder(folder_name)
+        elif op == "set_folder":
+            self.add_folder(folder_name)
+            self.replace_folder(folder_name, change["data"])
+        elif op == "add_record":
+            self.add_folder(folder_name)
+            self.insert_records(folder_name, [change["record"]])
+        elif op == "add_records":
+            self.add_folder(folder_name)
+            self.insert_records(folder_name, change["records"])
+        elif op == "delete_record":
+            ids = self.row_ids(folder_name)
+            if 0 <= change["index"] < len(ids):
+                self.conn.execute("DELETE FROM records WHERE id = ?",
+                                  (ids.pop(change["index"]),))
+            
+    def start_compaction(self):
+        """Контрольная точка WAL (вызывается из потока отложенной записи)"""
+        self.save(None)
+        
+    @profiled
+    def save(self, folders):
+        """Изменения уже в базе - остается контрольная точка WAL. Папки
+        из откатившихся транзакций переписываются из памяти целиком"""
+        try:
+            with self.lock:
+                if folders is not None and (self.dirty or self.order_dirty):
+                    self.rewrite_dirty(folders)
+                self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+            return True
+        except:
+            return False
+            
+    def rewrite_dirty(self, folders):
+        with self.conn:
+            if self.order_dirty:
+                data = {name: folder if folder is not None else self.load_folder(name)
+                        for name, folder in folders.items()}
+                self.conn.execute("DELETE FROM summaries WHERE user_id = ?", (self.user_id,))
+                self.apply({"op": "set_folders", "folders": data})
+                self.write_summaries({name: folder_summary(folder)
+                                      for name, folder in data.items()})
+            else:
+                summaries = {}
+                for folder_name in self.dirty:
+                    data = folders.get(folder_name)
+                    if data is None:
+                        continue
+                    self.add_folder(folder_name)
+                    self.replace_folder(folder_name, data)
+                    summaries[folder_name] = folder_summary(data)
+                self.write_summaries(summaries)
+        self.dirty = set()
+        self.order_dirty = False
+            
+    def rewrite(self, folders, data_format):
+        """Файлов папок нет - формат на базу не влияет"""
+        return self.save(folders)
+        
+    def save_user(self, user):
+        """Полная запись пользователя (миграция)"""
+        profile = {key: value for key, value in user.items() if key != "data"}
+        if not self.exists():
+            self.create(profile)
+        folders = user.get("data", {}).get("folders", {})
+        return self.log_change({"op": "set_folders", "folders": folders})
+
+# ====================== КАТАЛОГ ПОЛЬЗОВАТЕЛЕЙ ======================
+# Вход и регистрация смотрят только в accounts.json: хэш email -> никнейм
+# и дата создания. Каталог маленький, читается один раз за запуск и не
+# зависит от того, сколько данных у пользователей; хранилище открывается
+# лишь для того, кто вошел. Если каталога нет (данные прежней версии),
+# он один раз собирается по профилям.
+ACCOUNTS_FILE = os.path.join(DATA_DIR, "accounts.json")
+ACCOUNT_FIELDS = ("nickname", "created_at")
+
+_accounts = None
+
+def load_accounts():
+    """Каталог пользователей {user_id: {"nickname", "created_at"}}"""
+    global _accounts
+    if _accounts is None:
+        accounts = read_json(ACCOUNTS_FILE)
+        if not isinstance(accounts, dict):
+            accounts = build_accounts()
+        _accounts = accounts
+    return _accounts
+
+def build_accounts():
+    """Собирает каталог по профилям пользователей выбранного бэкенда"""
+    if get_storage_backend() == "sqlite":
+        user_ids = get_database().user_ids()
+    elif os.path.isdir(USERS_DIR):
+        user_ids = os.listdir(USERS_DIR)
+    else:
+        user_ids = []
+    accounts = {}
+    for user_id in user_ids:
+        profile = get_user_store(user_id).load_profile()
+        if profile is not None:
+            accounts[user_id] = {key: profile.get(key) for key in ACCOUNT_FIELDS}
+    save_accounts(accounts)
+    return accounts
+
+def save_accounts(accounts):
+    try:
+        write_text(ACCOUNTS_FILE, json.dumps(accounts, ensure_ascii=False, indent=2))
+        return True
+    except:
+        return False
+
+def find_account(user_id):
+    return load_accounts().get(user_id)
+
+def add_account(user_id, profile):
+    """Добавляет пользователя в каталог (после создания его хранилища)"""
+    accounts = load_accounts()
+    accounts[user_id] = {key: profile.get(key) for key in ACCOUNT_FIELDS}
+    return save_accounts(accounts)
+
+# ====================== ОТЛОЖЕННАЯ ЗАПИСЬ ======================
+# Интерфейс не пишет на диск сам: изменения складываются в очередь, а
+# фоновый поток ждет паузы в изменениях (PERSIST_DEBOUNCE, но не дольше
+# PERSIST_MAX_DELAY) и отдает всю пачку хранилищу одной записью. Быстрый
+# ввод десяти записей - это одна-две дозаписи журнала вместо десяти.
+# При уходе приложения в фон и выходе очередь сбрасывается синхронно.
+PERSIST_DEBOUNCE = 0.3
+PERSIST_MAX_DELAY = 2.0
+# Пачка, которую не удалось записать (диск полон, нет доступа), остается
+# в начале очереди и повторяется не чаще раза в PERSIST_RETRY_DELAY
+PERSIST_RETRY_DELAY = 5.0
+
+class Persister:
+    """Фоновый поток, пачками передающий изменения в хранилище"""
+    
+    def __init__(self, store, on_error=None):
+        self.store = store
+        # on_error() вызывается из потока записи при первой неудаче подряд
+        self.on_error = on_error
+        self.pending = []
+        self.first_at = self.last_at = 0.0
+        self.retry_at = 0.0
+        self.failures = 0
+        self.compact_requested = False
+        self.busy = False
+        self.closed = False
+        self.writes = 0
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        
+    def submit(self, change):
+        """Ставит изменение в очередь и сразу возвращается"""
+        with self.condition:
+            now = time.monotonic()
+            if not self.pending:
+                self.first_at = now
+            self.last_at = now
+            self.pending.append(change)
+            self.condition.notify_all()
+            
+    def request_compaction(self):
+        """После ближайшей записи свернуть журнал в файлы папок"""
+        with self.condition:
+            self.compact_requested = True
+            if not self.pending:
+                self.first_at = self.last_at = time.monotonic()
+            self.condition.notify_all()
+            
+    def run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if self.closed:
+                        return
+                    # Синхронная запись (flush, save) сама разбирает очередь
+                    if self.busy or not (self.pending or self.compact_requested):
+                        self.condition.wait()
+                        continue
+                    # Ждем паузы в изменениях, но не дольше PERSIST_MAX_DELAY,
+                    # а после ошибки - не раньше retry_at
+                    deadline = min(self.last_at + PERSIST_DEBOUNCE, self.first_at + PERSIST_MAX_DELAY)
+                    timeout = max(deadline, self.retry_at) - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self.condition.wait(timeout)
+                batch, self.pending = self.pending, []
+                compact, self.compact_requested = self.compact_requested, False
+                self.busy = True
+            try:
+                self.write(batch)
+                if compact:
+                    self.store.start_compaction()
+            finally:
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+                    
+    def write(self, batch):
+        """Отдает пачку хранилищу. При ошибке пачка возвращается в начало
+        очереди (порядок изменений важен - удаление идет по индексу)"""
+        if not batch:
+            return True
+        if self.store.log_changes(batch):
+            self.writes += 1
+            self.failures = 0
+            return True
+        with self.condition:
+            now = time.monotonic()
+            if not self.pending:
+                self.first_at = self.last_at = now
+            self.pending[:0] = batch
+            self.retry_at = now + PERSIST_RETRY_DELAY
+            self.failures += 1
+            report = self.failures == 1
+        if report and self.on_error is not None:
+            self.on_error()
+        return False
+        
+    def flush(self):
+        """Синхронно записывает все, что накопилось в очереди.
+        False - запись не удалась, изменения остались в очереди"""
+        with self.condition:
+            while self.busy:
+                self.condition.wait()
+            batch, self.pending = self.pending, []
+            self.busy = True
+        try:
+            return self.write(batch)
+        finally:
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+                
+    def save(self, folders):
+        """Синхронно дописывает очередь и вызывает полную запись
+        store.save(folders). Пачки, которые не удалось дописать в журнал,
+        уже помечены в хранилище грязными - полная запись берет их папки
+        из памяти, и повторять эти пачки после нее нельзя"""
+        with self.condition:
+            while self.busy:
+                self.condition.wait()
+            batch, self.pending = self.pending, []
+            self.busy = True
+        try:
+            written = self.write(batch)
+            saved = self.store.save(folders)
+            if saved and not written:
+                with self.condition:
+                    del self.pending[:len(batch)]
+                    self.failures = 0
+                    self.retry_at = 0.0
+            return saved
+        finally:
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+                
+    def failing(self):
+        """В очереди есть изменения, которые не удалось записать"""
+        return self.failures > 0
+        
+    def close(self):
+        """Дописывает очередь и останавливает поток"""
+        self.flush()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+# ====================== ЭКСПОРТ И ИМПОРТ ======================
+# Экспорт не собирает весь архив в памяти: генератор отдает записи папка
+# за папкой, и каждая сразу пишется строкой CSV или JSON Lines в файл
+# (по желанию сжатый gzip). Память не растет с размером истории, а
+# фоновый поток не блокирует интерфейс.
+EXPORT_DIR = os.path.join(DATA_DIR, "exports")
+EXPORT_FIELDS = ("folder", "name", "amount", "type", "currency", "date")
+EXPORT_PROGRESS_EVERY = 1000
+
+def iter_export_rows(folders, load=None):
+    """Строки экспорта (folder, name, amount, type, currency, date) по одной.
+    Незагруженные папки (None) читаются через load(имя) на время экспорта"""
+    for folder_name in list(folders):
+        folder = folders.get(folder_name)
+        if folder is None and load is not None:
+            folder = load(folder_name)
+        if folder is None:
+            continue
+        # Копия списка ссылок: папку могут менять из интерфейса во время экспорта
+        for record in list(folder.get('records', [])):
+            if record.raw:
+                # Неразобранные сумма или дата выгружаются как были
+                data = record.to_dict()
+                yield (folder_name, record.name, data['amount'], record.type,
+                       record.currency_name, data.get('date', ""))
+                continue
+            yield (folder_name, record.name, format_minor(record.minor), record.type,
+                   record.currency_name, record.date_text if record.ts is not None else "")
+
+def open_export(path, compress):
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+def export_records(folders, path, fmt="csv", compress=False, progress=None, cancel=None,
+                   load=None, total=None):
+    """Пишет записи всех папок в path потоково. progress(сделано, всего)
+    вызывается каждые EXPORT_PROGRESS_EVERY строк; cancel() -> True
+    прерывает экспорт и удаляет недописанный файл. Возвращает число строк"""
+    if total is None:
+        total = sum(len(folder.get('records', [])) for folder in folders.values()
+                    if folder is not None)
+    done = 0
+    tmp_path = path + ".tmp"
+    try:
+        with open_export(tmp_path, compress) as f:
+            if fmt == "csv":
+                writer = csv.writer(f)
+                writer.writerow(EXPORT_FIELDS)
+                write = writer.writerow
+            else:
+                write = lambda row: f.write(
+                    json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + "\n")
+            for row in iter_export_rows(folders, load):
+                write(row)
+                done += 1
+                if done % EXPORT_PROGRESS_EVERY == 0:
+                    if cancel is not None and cancel():
+                        raise InterruptedError("export cancelled")
+                    if progress is not None:
+                        progress(done, total)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if progress is not None:
+        progress(done, total)
+    return done
+
+def export_path(fmt, compress):
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    name = f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    return os.path.join(EXPORT_DIR, name + (".gz" if compress else ""))
+
+# Импорт читает CSV или JSON Lines (в том числе .gz) построчно, проверяет
+# и нормализует строки пачками по IMPORT_BATCH и раскладывает записи по
+# папкам. В данные пользователя они попадают одним шагом в конце, после
+# чего сохранение выполняется один раз - время линейно от размера файла.
+IMPORT_BATCH = 1000
+IMPORT_DATE_FORMATS = (DATE_FORMAT, "%d.%m.%Y", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S",
+                       "%Y-%m-%d %H:%M", "%Y-%m-%d")
+IMPORT_ALIASES = {"description": "name", "title": "name", "sum": "amount", "value": "amount"}
+
+def open_import(path):
+    """Открывает файл импорта, gzip определяется по сигнатуре"""
+    with open(path, "rb") as f:
+        compressed = f.read(2) == b"\x1f\x8b"
+    if compressed:
+        return gzip.open(path, "rt", encoding="utf-8-sig", newline="")
+    return open(path, "r", encoding="utf-8-sig", newline="")
+
+def iter_import_rows(f):
+    """Строки файла как словари: JSON Lines, если первая строка - объект, иначе CSV"""
+    first = f.readline()
+    if first.lstrip().startswith("{"):
+        for line in itertools.chain([first], f):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # Битая строка не прерывает импорт: пустую запись
+                    # normalize_batch отбросит и посчитает в skipped
+                    row = {}
+                yield row
+    else:
+        reader = csv.DictReader(itertools.chain([first], f))
+        reader.fieldnames = [IMPORT_ALIASES.get(field, field)
+                             for field in (name.strip().lower() for name in reader.fieldnames or [])]
+        yield from reader
+
+def import_currency(text):
+    """Название валюты из CURRENCIES по названию, символу или ISO-коду"""
+    text = (text or "").strip()
+    if not text:
+        return CURRENCIES[0]
+    code = currency_iso(text)
+    return next((option for option in CURRENCIES if currency_iso(option) == code), text)
+
+def import_timestamp(text, cache):
+    """Дата строки импорта в секунды эпохи; одинаковые даты разбираются один раз"""
+    text = (text or "").strip()
+    if not text:
+        return None
+    if text in cache:
+        return cache[text]
+    ts = None
+    for fmt in IMPORT_DATE_FORMATS:
+        try:
+            ts = int(datetime.strptime(text, fmt).timestamp())
+            break
+        except ValueError:
+            continue
+    else:
+        if not text.isdigit():
+            raise ValueError(f"invalid date: {text!r}")
+        ts = int(text)
+    cache[text] = ts
+    return ts
+
+def normalize_batch(rows, default_folder, imported, dates):
+    """Проверяет пачку строк и раскладывает записи по папкам.
+    Возвращает число отброшенных строк"""
+    skipped = 0
+    for row in rows:
+        try:
+            name = str(row.get("name") or "").strip()
+            if not name:
+                raise ValueError("empty name")
+            minor = parse_minor(row.get("amount", ""))
+            record_type = str(row.get("type") or "").strip().lower()
+            if record_type not in ("income", "expense"):
+                record_type = "expense" if minor < 0 else "income"
+            record = Record(sys.intern(name), abs(minor), import_timestamp(row.get("date"), dates),
+                            Record.INCOME if record_type == "income" else Record.EXPENSE,
+                            currency_code(import_currency(row.get("currency"))))
+        except (ValueError, TypeError, AttributeError):
+            skipped += 1
+            continue
+        folder_name = str(row.get("folder") or "").strip() or default_folder
+        imported.setdefault(folder_name, []).append(record)
+    return skipped
+
+def import_records(path, default_folder, progress=None, cancel=None):
+    """Читает файл импорта: {папка: [Record]} и число отброшенных строк.
+    progress(прочитано, отброшено) вызывается после каждой пачки,
+    cancel() -> True прерывает импорт (InterruptedError), ничего не меняя"""
+    imported = {}
+    dates = {}
+    done = skipped = 0
+    with open_import(path) as f:
+        rows = iter_import_rows(f)
+        while True:
+            batch = list(itertools.islice(rows, IMPORT_BATCH))
+            if not batch:
+                break
+            if cancel is not None and cancel():
+                raise InterruptedError("import cancelled")
+            skipped += normalize_batch(batch, default_folder, imported, dates)
+            done += len(batch)
+            if progress is not None:
+                progress(done, skipped)
+    return imported, skipped
+
+# ====================== РЕЗЕРВНЫЕ КОПИИ ======================
+# Копия не дублирует данные целиком. Файлы из DATA_DIR режутся на чанки
+# по содержимому: граница ставится после строки, crc32 которой попал под
+# маску, поэтому вставка в начало файла сдвигает лишь соседние чанки.
+# Чанк хранится один раз, сжатым zlib, под именем своего sha256 в
+# backups/chunks/, а каждая копия - это манифест со списком чанков
+# каждого файла. Файлы с теми же размером и mtime, что в прошлом
+# манифесте, даже не читаются - ежедневная копия стоит килобайты.
+BACKUP_DIR = os.path.join(DATA_DIR, "backups")
+BACKUP_CHUNKS_DIR = os.path.join(BACKUP_DIR, "chunks")
+BACKUP_MANIFESTS_DIR = os.path.join(BACKUP_DIR, "manifests")
+BACKUP_CHUNK_MIN = 32 * 1024
+BACKUP_CHUNK_MAX = 256 * 1024
+BACKUP_CHUNK_MASK = 1023
+BACKUP_KEEP = 30
+BACKUP_SKIP_SUFFIXES = (".bak", ".sum", ".tmp", ".corrupt", ".prev", ".migrated", "-wal", "-shm")
+
+def iter_data_files():
+    """Относительные пути всех файлов данных, кроме копий и экспорта"""
+    skip_dirs = (os.path.abspath(BACKUP_DIR), os.path.abspath(EXPORT_DIR))
+    for root, dirs, files in os.walk(DATA_DIR):
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) not in skip_dirs)
+        for name in sorted(files):
+            yield os.path.relpath(os.path.join(root, name), DATA_DIR).replace(os.sep, "/")
+
+def backup_included(rel):
+    """Служебные файлы (.bak, .sum, временные) в копию не попадают"""
+    return not rel.endswith(BACKUP_SKIP_SUFFIXES)
+
+def split_chunks(data):
+    """Режет байты на чанки по содержимому (не короче BACKUP_CHUNK_MIN
+    и не длиннее BACKUP_CHUNK_MAX)"""
+    view = memoryview(data)
+    size = len(data)
+    start = 0
+    while start < size:
+        limit = min(start + BACKUP_CHUNK_MAX, size)
+        end = limit
+        pos = start + BACKUP_CHUNK_MIN
+        while pos < limit:
+            newline = data.find(b"\n", pos, limit)
+            if newline < 0:
+                break
+            if zlib.crc32(view[pos:newline]) & BACKUP_CHUNK_MASK == 0:
+                end = newline + 1
+                break
+            pos = newline + 1
+        yield view[start:end]
+        start = end
+
+def chunk_path(digest):
+    return os.path.join(BACKUP_CHUNKS_DIR, digest[:2], digest)
+
+def store_chunk(chunk):
+    """Сохраняет чанк, если такого еще нет -> (sha256, записано байт)"""
+    digest = hashlib.sha256(chunk).hexdigest()
+    path = chunk_path(digest)
+    if os.path.exists(path):
+        return digest, 0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    packed = zlib.compress(chunk, 6)
+    write_durable(path, packed)
+    return digest, len(packed)
+
+def read_chunk(digest):
+    """Распаковывает чанк и проверяет его sha256"""
+    with open(chunk_path(digest), "rb") as f:
+        data = f.read()
+    try:
+        chunk = zlib.decompress(data)
+    except zlib.error:
+        chunk = None
+    if chunk is None or hashlib.sha256(chunk).hexdigest() != digest:
+        raise ValueError(f"backup chunk {digest} is damaged")
+    return chunk
+
+def list_backups():
+    """Имена копий (манифестов), от новых к старым"""
+    if not os.path.isdir(BACKUP_MANIFESTS_DIR):
+        return []
+    names = [name[:-5] for name in os.listdir(BACKUP_MANIFESTS_DIR) if name.endswith(".json")]
+    return sorted(names, reverse=True)
+
+def manifest_path(name):
+    return os.path.join(BACKUP_MANIFESTS_DIR, name + ".json")
+
+def load_manifest(name):
+    return read_json(manifest_path(name))
+
+@contextlib.contextmanager
+def storage_paused():
+    """Дожидается фонового сворачивания журналов и держит блокировки всех
+    открытых хранилищ и базы: пока они взяты, файлы данных не меняются"""
+    locks = []
+    for store in list(_user_stores.values()):
+        while getattr(store, "compacting", False):
+            time.sleep(0.05)
+        if store.lock not in locks:
+            locks.append(store.lock)
+    if _database is not None and _database.lock not in locks:
+        locks.append(_database.lock)
+    for lock in locks:
+        lock.acquire()
+    try:
+        yield
+    finally:
+        for lock in reversed(locks):
+            lock.release()
+
+def create_backup(progress=None):
+    """Делает инкрементальную копию DATA_DIR. progress(сделано, всего)
+    вызывается по файлам. Возвращает манифест новой копии"""
+    os.makedirs(BACKUP_MANIFESTS_DIR, exist_ok=True)
+    names = list_backups()
+    previous = (load_manifest(names[0]) if names else None) or {}
+    previous_files = previous.get("files", {})
+    
+    files = {}
+    stored_bytes = stored_chunks = 0
+    # Сворачивание журнала не должно заменить файл папки и убрать
+    # journal.log.old посреди копии - иначе в ней пропадут изменения
+    with storage_paused():
+        if _database is not None:
+            _database.checkpoint()
+        paths = [rel for rel in iter_data_files() if backup_included(rel)]
+        for done, rel in enumerate(paths, 1):
+            path = os.path.join(DATA_DIR, rel)
+            try:
+                stat = os.stat(path)
+                entry = previous_files.get(rel)
+                if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    chunks = []
+                    for chunk in split_chunks(data):
+                        digest, written = store_chunk(chunk)
+                        chunks.append(digest)
+                        if written:
+                            stored_bytes += written
+                            stored_chunks += 1
+                    entry = {"size": len(data), "mtime_ns": stat.st_mtime_ns, "chunks": chunks}
+            except FileNotFoundError:
+                # Файл вне хранилищ удалили во время копирования
+                continue
+            files[rel] = entry
+            if progress is not None:
+                progress(done, len(paths))
+            
+    now = datetime.now()
+    name = now.strftime("%Y%m%d_%H%M%S")
+    if names and names[0] >= name:
+        name = f"{names[0]}_1"
+    manifest = {"version": 1, "created": now.strftime(DATE_FORMAT), "files": files,
+                "stored_bytes": stored_bytes, "stored_chunks": stored_chunks}
+    write_text(manifest_path(name), json.dumps(manifest))
+    prune_backups()
+    manifest["name"] = name
+    return manifest
+
+def prune_backups(keep=BACKUP_KEEP):
+    """Удаляет старые копии и чанки, на которые больше никто не ссылается"""
+    names = list_backups()
+    if len(names) <= keep:
+        return 0
+    for name in names[keep:]:
+        path = manifest_path(name)
+        for target in (path, checksum_path(path), backup_path(path), checksum_path(backup_path(path))):
+            if os.path.exists(target):
+                os.remove(target)
+    used = set()
+    for name in names[:keep]:
+        for entry in (load_manifest(name) or {}).get("files", {}).values():
+            used.update(entry["chunks"])
+    removed = 0
+    for root, dirs, files in os.walk(BACKUP_CHUNKS_DIR):
+        for digest in files:
+            if digest not in used:
+                os.remove(os.path.join(root, digest))
+                removed += 1
+    return removed
+
+def restore_backup(name, progress=None):
+    """Возвращает DATA_DIR к состоянию копии name. Все чанки читаются и
+    проверяются до первой записи, поэтому поврежденная копия ничего не
+    портит. Хранилища должны быть закрыты (см. reset_storage)"""
+    manifest = load_manifest(name)
+    if manifest is None:
+        raise ValueError(f"backup {name} not found")
+    files = manifest.get("files", {})
+    contents = {rel: b"".join(read_chunk(digest) for digest in entry["chunks"])
+                for rel, entry in files.items()}
+                
+    # Файлы, появившиеся после копии (и журналы поверх них), убираем:
+    # иначе журнал доиграл бы более новые изменения. .bak тоже: это
+    # данные до восстановления, и при сбое они не должны вернуться
+    stale = (".prev", "-wal", "-shm", ".bak", ".bak.sum")
+    for rel in list(iter_data_files()):
+        if rel not in files and (backup_included(rel) or rel.endswith(stale)):
+            os.remove(os.path.join(DATA_DIR, rel))
+    for done, (rel, data) in enumerate(contents.items(), 1):
+        path = os.path.join(DATA_DIR, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_durable(path, data)
+        if rel.endswith(".json"):
+            write_checksum(path, data)
+        if progress is not None:
+            progress(done, len(contents))
+    return len(contents)
+
+def reset_storage():
+    """Закрывает открытые хранилища (дождавшись фонового сворачивания):
+    после восстановления их состояние в памяти устарело"""
+    global _database, _rates, _accounts, _prepared_backend
+    for store in list(_user_stores.values()):
+        while getattr(store, "compacting", False):
+            time.sleep(0.05)
+    _user_stores.clear()
+    _accounts = None
+    _prepared_backend = None
+    if _database is not None:
+        _database.close()
+        _database = None
+    _rates = None
+
 # ====================== МОБИЛЬНЫЕ ТЕМЫ ======================
-THEMES = {
+# Темы хранятся в hex. В цвета Kivy тема переводится при первом
+# обращении, так что при запуске считается только нужная палитра.
+THEME_COLORS = {
     "Light": {
-        "bg": get_color_from_hex("#F8F9FA"),
-        "card_bg": get_color_from_hex("#FFFFFF"),
-        "primary": get_color_from_hex("#007AFF"),
-        "secondary": get_color_from_hex("#8E8E93"),
-        "text": get_color_from_hex("#000000"),
-        "success": get_color_from_hex("#34C759"),
-        "danger": get_color_from_hex("#FF3B30"),
-        "warning": get_color_from_hex("#FF9500"),
-        "info": get_color_from_hex("#5AC8FA"),
-        "border": get_color_from_hex("#C7C7CC"),
-        "accent": get_color_from_hex("#5856D6")
+        "bg": "#F8F9FA",
+        "card_bg": "#FFFFFF",
+        "primary": "#007AFF",
+        "secondary": "#8E8E93",
+        "text": "#000000",
+        "success": "#34C759",
+        "danger": "#FF3B30",
+        "warning": "#FF9500",
+        "info": "#5AC8FA",
+        "border": "#C7C7CC",
+        "accent": "#5856D6"
     },
     "Dark": {
-        "bg": get_color_from_hex("#000000"),
-        "card_bg": get_color_from_hex("#1C1C1E"),
-        "primary": get_color_from_hex("#0A84FF"),
-        "secondary": get_color_from_hex("#98989D"),
-        "text": get_color_from_hex("#FFFFFF"),
-        "success": get_color_from_hex("#30D158"),
-        "danger": get_color_from_hex("#FF453A"),
-        "warning": get_color_from_hex("#FF9F0A"),
-        "info": get_color_from_hex("#64D2FF"),
-        "border": get_color_from_hex("#38383A"),
-        "accent": get_color_from_hex("#BF5AF2")
+        "bg": "#000000",
+        "card_bg": "#1C1C1E",
+        "primary": "#0A84FF",
+        "secondary": "#98989D",
+        "text": "#FFFFFF",
+        "success": "#30D158",
+        "danger": "#FF453A",
+        "warning": "#FF9F0A",
+        "info": "#64D2FF",
+        "border": "#38383A",
+        "accent": "#BF5AF2"
     },
     "Blue": {
-        "bg": get_color_from_hex("#001F3F"),
-        "card_bg": get_color_from_hex("#003366"),
-        "primary": get_color_from_hex("#0074D9"),
-        "secondary": get_color_from_hex("#7FDBFF"),
-        "text": get_color_from_hex("#FFFFFF"),
-        "success": get_color_from_hex("#2ECC40"),
-        "danger": get_color_from_hex("#FF4136"),
-        "warning": get_color_from_hex("#FF851B"),
-        "info": get_color_from_hex("#39CCCC"),
-        "border": get_color_from_hex("#00509E"),
-        "accent": get_color_from_hex("#B10DC9")
+        "bg": "#001F3F",
+        "card_bg": "#003366",
+        "primary": "#0074D9",
+        "secondary": "#7FDBFF",
+        "text": "#FFFFFF",
+        "success": "#2ECC40",
+        "danger": "#FF4136",
+        "warning": "#FF851B",
+        "info": "#39CCCC",
+        "border": "#00509E",
+        "accent": "#B10DC9"
     },
     "Green": {
-        "bg": get_color_from_hex("#003300"),
-        "card_bg": get_color_from_hex("#006600"),
-        "primary": get_color_from_hex("#2ECC40"),
-        "secondary": get_color_from_hex("#90EE90"),
-        "text": get_color_from_hex("#FFFFFF"),
-        "success": get_color_from_hex("#01FF70"),
-        "danger": get_color_from_hex("#FF4136"),
-        "warning": get_color_from_hex("#FF851B"),
-        "info": get_color_from_hex("#3D9970"),
-        "border": get_color_from_hex("#004D00"),
-        "accent": get_color_from_hex("#FFDC00")
+        "bg": "#003300",
+        "card_bg": "#006600",
+        "primary": "#2ECC40",
+        "secondary": "#90EE90",
+        "text": "#FFFFFF",
+        "success": "#01FF70",
+        "danger": "#FF4136",
+        "warning": "#FF851B",
+        "info": "#3D9970",
+        "border": "#004D00",
+        "accent": "#FFDC00"
     },
     "Purple": {
-        "bg": get_color_from_hex("#2D004F"),
-        "card_bg": get_color_from_hex("#4B0082"),
-        "primary": get_color_from_hex("#9B30FF"),
-        "secondary": get_color_from_hex("#DDA0DD"),
-        "text": get_color_from_hex("#FFFFFF"),
-        "success": get_color_from_hex("#00FA9A"),
-        "danger": get_color_from_hex("#FF1493"),
-        "warning": get_color_from_hex("#FFD700"),
-        "info": get_color_from_hex("#9370DB"),
-        "border": get_color_from_hex("#6A0DAD"),
-        "accent": get_color_from_hex("#00CED1")
+        "bg": "#2D004F",
+        "card_bg": "#4B0082",
+        "primary": "#9B30FF",
+        "secondary": "#DDA0DD",
+        "text": "#FFFFFF",
+        "success": "#00FA9A",
+        "danger": "#FF1493",
+        "warning": "#FFD700",
+        "info": "#9370DB",
+        "border": "#6A0DAD",
+        "accent": "#00CED1"
     }
 }
 
+class ThemeTable:
+    """THEMES[тема][цвет] с переводом палитры из hex по требованию"""
+    
+    def __init__(self, hex_themes):
+        self.hex_themes = hex_themes
+        self.converted = {}
+        
+    def __getitem__(self, theme):
+        colors = self.converted.get(theme)
+        if colors is None:
+            colors = {key: get_color_from_hex(value)
+                      for key, value in self.hex_themes[theme].items()}
+            self.converted[theme] = colors
+        return colors
+        
+    def __contains__(self, theme):
+        return theme in self.hex_themes
+        
+    def __iter__(self):
+        return iter(self.hex_themes)
+        
+    def keys(self):
+        return self.hex_themes.keys()
+
+THEMES = ThemeTable(THEME_COLORS)
+
+# ====================== ЖИВАЯ ПАЛИТРА ======================
+# Цвета текущей темы как Kivy-свойства. Виджеты и инструкции Color
+# привязываются к ним через themed(), поэтому смена темы перекрашивает
+# уже существующие объекты, а не пересобирает дерево виджетов.
+class Palette(EventDispatcher):
+    theme = StringProperty("Light")
+    bg = ColorProperty(THEMES["Light"]["bg"])
+    card_bg = ColorProperty(THEMES["Light"]["card_bg"])
+    primary = ColorProperty(THEMES["Light"]["primary"])
+    secondary = ColorProperty(THEMES["Light"]["secondary"])
+    text = ColorProperty(THEMES["Light"]["text"])
+    success = ColorProperty(THEMES["Light"]["success"])
+    danger = ColorProperty(THEMES["Light"]["danger"])
+    warning = ColorProperty(THEMES["Light"]["warning"])
+    info = ColorProperty(THEMES["Light"]["info"])
+    border = ColorProperty(THEMES["Light"]["border"])
+    accent = ColorProperty(THEMES["Light"]["accent"])
+    
+    def apply(self, theme):
+        """Переключает палитру на тему из THEMES"""
+        for key, value in THEMES[theme].items():
+            setattr(self, key, value)
+        self.theme = theme
+
+PALETTE = Palette()
+
+def _set_palette_color(ref, attr, palette, value):
+    target = ref()
+    if target is not None:
+        setattr(target, attr, value)
+
+def themed(target, **colors):
+    """Привязывает цвета виджета или инструкции Color к палитре:
+    themed(label, color="text"). Привязка снимается вместе с объектом"""
+    for attr, key in colors.items():
+        setattr(target, attr, getattr(PALETTE, key))
+        uid = []
+        ref = weakref.ref(target, lambda r, key=key, uid=uid: PALETTE.unbind_uid(key, uid[0]))
+        uid.append(PALETTE.fbind(key, _set_palette_color, ref, attr))
+    return target
+
 # ====================== ЯЗЫКИ ======================
 LANG = {
     "EN": {
@@ -321,14 +3201,312 @@ class MobileTextInput(TextInput):
 
 class MobileSpinner(Spinner):
     def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.font_size = sp(16)
-        self.size_hint_y = None
-        self.height = dp(50)
-        self.background_normal = ''
-        self.background_color = (1, 1, 1, 0.1)
-        self.color = THEMES["Light"]["text"]
-        self.border_radius = dp(10)
+        super().__init__(**kwargs)
+        self.font_size = sp(16)
+        self.size_hint_y = None
+        self.height = dp(50)
+        self.background_normal = ''
+        self.background_color = (1, 1, 1, 0.1)
+        self.color = THEMES["Light"]["text"]
+        self.border_radius = dp(10)
+
+class PeriodFilter(Spinner):
+    """Выбор периода Today/Week/Month/Year/Custom; on_change вызывается
+    после каждой смены периода"""
+    
+    def __init__(self, lang, on_change, **kwargs):
+        super().__init__(**kwargs)
+        self.font_size = sp(12)
+        self.size_hint_x = None
+        self.width = dp(100)
+        self.background_normal = ''
+        self.background_color = (1, 1, 1, 0.1)
+        themed(self, color="text")
+        self.on_change = on_change
+        self.period = "all"
+        self.custom_range = None
+        self.set_lang(lang)
+        self.bind(text=self.select)
+        
+    def set_lang(self, lang):
+        self.lang = lang
+        self.labels = [LANG[lang][period] for period in FILTER_PERIODS]
+        self.values = self.labels
+        self.text = self.current_label()
+        
+    def current_label(self):
+        """Подпись текущего периода. У произвольного это его даты, а не
+        "Custom" - поэтому выбор Custom в списке всегда меняет текст и
+        снова открывает форму"""
+        if self.period == "custom" and self.custom_range is not None:
+            start, end = self.custom_range
+            return f"{datetime.fromtimestamp(start):%d.%m}-{datetime.fromtimestamp(end - 1):%d.%m}"
+        return self.labels[FILTER_PERIODS.index(self.period)]
+        
+    def range(self):
+        """Текущий диапазон времени или None, если фильтра нет"""
+        if self.period == "custom":
+            return self.custom_range
+        return period_range(self.period)
+        
+    def select(self, instance, text):
+        if text not in self.labels:
+            return
+        period = FILTER_PERIODS[self.labels.index(text)]
+        if period == "custom":
+            # Пока диапазон не выбран, действует и подписан прежний период
+            self.text = self.current_label()
+            self.ask_custom_range()
+        elif period != self.period:
+            self.period = period
+            self.on_change()
+            
+    def ask_custom_range(self):
+        """Спрашивает границы произвольного периода"""
+        form = ModalView(size_hint=(0.9, 0.45), auto_dismiss=False)
+        content = BoxLayout(orientation='vertical', padding=dp(20), spacing=dp(10))
+        today = datetime.now().strftime(DAY_FORMAT)
+        start_input = MobileTextInput(hint_text=DAY_FORMAT, text=today)
+        end_input = MobileTextInput(hint_text=DAY_FORMAT, text=today)
+        error_label = Label(size_hint_y=None, height=dp(30))
+        themed(error_label, color="danger")
+        
+        def apply(inst):
+            try:
+                self.custom_range = parse_day_range(start_input.text, end_input.text)
+            except ValueError:
+                error_label.text = "dd.mm.yyyy"
+                return
+            self.period = "custom"
+            self.text = self.current_label()
+            form.dismiss()
+            self.on_change()
+            
+        def cancel(inst):
+            form.dismiss()
+            
+        buttons = BoxLayout(spacing=dp(10), size_hint_y=None, height=dp(50))
+        cancel_btn = Button(text=LANG[self.lang]["cancel"])
+        apply_btn = Button(text=LANG[self.lang]["filter"])
+        themed(apply_btn, background_color="primary")
+        cancel_btn.bind(on_press=cancel)
+        apply_btn.bind(on_press=apply)
+        buttons.add_widget(cancel_btn)
+        buttons.add_widget(apply_btn)
+        
+        content.add_widget(Label(text=LANG[self.lang]["custom"], font_size=sp(20), bold=True))
+        content.add_widget(start_input)
+        content.add_widget(end_input)
+        content.add_widget(error_label)
+        content.add_widget(buttons)
+        form.add_widget(content)
+        form.open()
+
+class RecordRow(RecycleDataViewBehavior, BoxLayout):
+    """Строка записи для RecycleView: виджеты создаются один раз,
+    а при прокрутке в них только подставляются данные другой записи"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.orientation = 'horizontal'
+        self.padding = [dp(15), dp(10)]
+        self.spacing = dp(10)
+        self.index = 0
+        self.screen = None
+        self.is_income = True
+        
+        with self.canvas.before:
+            themed(Color(), rgba="card_bg")
+            self.bg = RoundedRectangle(pos=self.pos, size=self.size, radius=[dp(10)])
+        self.bind(pos=self.update_bg, size=self.update_bg)
+        
+        # Иконка
+        self.icon = Label(font_size=sp(24), size_hint_x=None, width=dp(40))
+        
+        # Информация
+        info = BoxLayout(orientation='vertical', spacing=dp(5))
+        self.name_label = Label(
+            font_size=sp(16),
+            bold=True,
+            halign='left',
+            text_size=(Window.width * 0.4, None)
+        )
+        themed(self.name_label, color="text")
+        self.details = themed(Label(font_size=sp(12), halign='left'), color="secondary")
+        info.add_widget(self.name_label)
+        info.add_widget(self.details)
+        
+        # Сумма
+        self.amount_label = Label(font_size=sp(18), bold=True)
+        
+        # Кнопка удаления
+        self.delete_btn = Button(
+            text="🗑️",
+            font_size=sp(20),
+            size_hint_x=None,
+            width=dp(50),
+            background_normal='',
+            background_color=(0, 0, 0, 0)
+        )
+        themed(self.delete_btn, color="danger")
+        self.delete_btn.bind(on_press=lambda x: self.screen.delete_record(self.index))
+        
+        self.add_widget(self.icon)
+        self.add_widget(info)
+        self.add_widget(self.amount_label)
+        self.add_widget(self.delete_btn)
+        
+        # Цвет суммы зависит от типа записи, поэтому обновляется вручную
+        PALETTE.bind(theme=self.update_amount_color)
+        
+    def refresh_view_attrs(self, rv, index, data):
+        record = data['record']
+        self.index = data['index']
+        self.screen = rv.screen
+        self.is_income = record.is_income
+        
+        self.icon.text = "💰" if self.is_income else "💸"
+        self.name_label.text = record.name
+        self.details.text = f"{record.date_text} • {record.currency_name}"
+        self.amount_label.text = f"{currency_symbol(record.currency_name)}{format_money(record.minor)}"
+        self.update_amount_color()
+        
+    def update_amount_color(self, *args):
+        self.amount_label.color = PALETTE.success if self.is_income else PALETTE.danger
+        
+    def update_bg(self, instance, value):
+        self.bg.pos = self.pos
+        self.bg.size = self.size
+
+class FolderRow(RecycleDataViewBehavior, BoxLayout):
+    """Карточка папки для RecycleView на главном экране"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.orientation = 'horizontal'
+        self.padding = [dp(15), dp(10)]
+        self.spacing = dp(10)
+        self.folder_name = ''
+        self.screen = None
+        
+        with self.canvas.before:
+            themed(Color(), rgba="card_bg")
+            self.bg = RoundedRectangle(pos=self.pos, size=self.size, radius=[dp(10)])
+        self.bind(pos=self.update_bg, size=self.update_bg)
+        
+        # Иконка папки
+        icon = Label(text="📁", font_size=sp(30), size_hint_x=None, width=dp(50))
+        
+        # Информация о папке
+        info = BoxLayout(orientation='vertical', spacing=dp(5))
+        self.name_label = Label(
+            font_size=sp(18),
+            bold=True,
+            halign='left',
+            text_size=(Window.width * 0.5, None)
+        )
+        themed(self.name_label, color="text")
+        self.details_label = themed(Label(font_size=sp(14), halign='left'), color="secondary")
+        info.add_widget(self.name_label)
+        info.add_widget(self.details_label)
+        
+        # Кнопка открытия
+        self.open_btn = Button(
+            text="→",
+            font_size=sp(24),
+            size_hint_x=None,
+            width=dp(50),
+            background_normal='',
+            background_color=(0, 0, 0, 0)
+        )
+        themed(self.open_btn, color="primary")
+        self.open_btn.bind(on_press=lambda x: self.screen.open_folder(self.folder_name))
+        
+        self.add_widget(icon)
+        self.add_widget(info)
+        self.add_widget(self.open_btn)
+        
+    def refresh_view_attrs(self, rv, index, data):
+        summary = data['summary']
+        self.folder_name = data['name']
+        self.screen = rv.screen
+        self.name_label.text = self.folder_name
+        self.details_label.text = (f"{format_money(summary['balance'])} {data['currency']}"
+                                   f" • {summary['count']} records{excluded_note(summary)}")
+        
+    def update_bg(self, instance, value):
+        self.bg.pos = self.pos
+        self.bg.size = self.size
+
+# ====================== ОВЕРЛЕЙ ПРОИЗВОДИТЕЛЬНОСТИ ======================
+# Надпись поверх всех экранов: время кадра и самые дорогие пути из
+# профилировщика. Режим в настройках: off, on (только сбор) или overlay.
+# Кадры считаются только пока оверлей показан.
+PROFILING_MODES = ("off", "on", "overlay")
+PROFILE_OVERLAY_ROWS = 5
+
+class PerfOverlay(Label):
+    def __init__(self, **kwargs):
+        super().__init__(font_size=sp(11), halign='left', valign='top',
+                         color=(1, 1, 1, 1), size_hint=(None, None), **kwargs)
+        with self.canvas.before:
+            Color(0, 0, 0, 0.6)
+            self.bg = Rectangle(pos=self.pos, size=self.size)
+        self.bind(texture_size=self.place, pos=self.update_bg, size=self.update_bg)
+        self.events = []
+        
+    def show(self):
+        Window.add_widget(self)
+        self.events = [Clock.schedule_interval(self.on_frame, 0),
+                       Clock.schedule_interval(self.refresh, 0.5)]
+        
+    def hide(self):
+        for event in self.events:
+            event.cancel()
+        self.events = []
+        Window.remove_widget(self)
+        
+    def on_frame(self, dt):
+        PROFILER.frame_times.append(dt * 1000)
+        
+    def refresh(self, dt):
+        lines = []
+        frames = PROFILER.frame_summary()
+        if frames is not None:
+            lines.append(f"frame p50 {frames['p50_ms']:.1f} p95 {frames['p95_ms']:.1f} "
+                         f"max {frames['max_ms']:.1f} ms")
+        lines.extend(profile_lines(PROFILER.summary()[:PROFILE_OVERLAY_ROWS]))
+        self.text = "\n".join(lines)
+        
+    def place(self, *args):
+        self.size = (self.texture_size[0] + dp(8), self.texture_size[1] + dp(4))
+        self.pos = (0, Window.height - self.height)
+        
+    def update_bg(self, *args):
+        self.bg.pos = self.pos
+        self.bg.size = self.size
+
+def profile_lines(rows):
+    """Строки сводки профилировщика для оверлея и статистики"""
+    return [f"{row['name']}: {row['count']}x p50 {row['p50_ms']:.1f} p95 {row['p95_ms']:.1f} ms"
+            f" r {row['read'] // 1024} KB w {row['written'] // 1024} KB" for row in rows]
+
+_overlay = None
+
+def apply_profiling(mode):
+    """Включает сбор замеров и показывает или прячет оверлей"""
+    global _overlay
+    PROFILER.enabled = mode in ("on", "overlay")
+    if mode == "overlay" and _overlay is None:
+        _overlay = PerfOverlay()
+        _overlay.show()
+    elif mode != "overlay" and _overlay is not None:
+        _overlay.hide()
+        _overlay = None
+
+def profile_export_path():
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    return os.path.join(EXPORT_DIR, f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
 
 # ====================== ЭКРАН АВТОРИЗАЦИИ ======================
 class AuthScreen(Screen):
@@ -408,19 +3586,26 @@ class AuthScreen(Screen):
             self.show_popup("Error", "Enter email and nickname")
             return
             
-        users = load_users()
+        prepare_storage()
         user_id = hashlib.md5(email.encode()).hexdigest()
-        
-        if user_id in users:
-            if users[user_id]["nickname"] == nickname:
+        account = find_account(user_id)
+        
+        if account is not None:
+            if account["nickname"] == nickname:
+                # Только итоги папок этого пользователя - записи папки
+                # читаются при ее открытии
+                store = get_user_store(user_id)
+                user = store.load_summaries()
+                if user is None:
+                    self.show_popup("Error", "User data not found")
+                    return
                 self.manager.current_user = {
                     "email": email,
                     "nickname": nickname,
                     "user_id": user_id
                 }
-                # Загружаем данные пользователя
-                user_data = users[user_id].get("data", {})
-                main_screen = MainScreen(user_data=user_data)
+                user_data = user.get("data", {})
+                main_screen = MainScreen(user_data=user_data, store=store)
                 self.manager.add_widget(main_screen)
                 self.manager.current = 'main'
             else:
@@ -445,27 +3630,37 @@ class AuthScreen(Screen):
             self.show_popup("Error", "Nickname must be at least 2 characters")
             return
             
-        users = load_users()
+        prepare_storage()
         user_id = hashlib.md5(email.encode()).hexdigest()
-        
-        if user_id in users:
+        if find_account(user_id) is not None:
+            self.show_popup("Error", "User already exists. Please login.")
+            return
+        store = get_user_store(user_id)
+        if store.exists():
+            # Профиль есть, а в каталоге его нет (сбой между записями)
+            add_account(user_id, store.load_profile() or {})
             self.show_popup("Error", "User already exists. Please login.")
             return
             
-        users[user_id] = {
+        profile = {
             "email": email,
             "nickname": nickname,
-            "created_at": datetime.now().isoformat(),
-            "data": {}
+            "created_at": datetime.now().isoformat()
         }
         
-        if save_users(users):
+        try:
+            store.create(profile)
+            created = add_account(user_id, profile)
+        except:
+            created = False
+            
+        if created:
             self.manager.current_user = {
                 "email": email,
                 "nickname": nickname,
                 "user_id": user_id
             }
-            main_screen = MainScreen(user_data={})
+            main_screen = MainScreen(user_data={}, store=store)
             self.manager.add_widget(main_screen)
             self.manager.current = 'main'
         else:
@@ -481,26 +3676,51 @@ class AuthScreen(Screen):
 
 # ====================== ГЛАВНЫЙ ЭКРАН ======================
 class MainScreen(Screen):
-    def __init__(self, user_data=None, **kwargs):
+    def __init__(self, user_data=None, store=None, **kwargs):
         super().__init__(name='main', **kwargs)
         self.user_data = user_data if user_data else {}
+        self.store = store
+        self.persister = Persister(store, self.persist_failed) if store is not None else None
         self.settings = load_settings()
         self.theme = self.settings.get("theme", "Light")
         self.lang = self.settings.get("language", "EN")
+        self.base_currency = self.settings.get("base_currency", BASE_CURRENCY)
         
-        # Загружаем папки из данных пользователя
+        # Папки пользователя: имя -> данные или None, если записи папки еще
+        # не загружены (тогда ее итоги берутся из folder_summaries)
         self.folders = self.user_data.get("folders", {})
+        self.folder_summaries = self.user_data.get("summaries", {})
+        
+        # LRU-пул экранов папок: имя папки -> FolderScreen
+        self.folder_screens = OrderedDict()
+        self.folder_cache_size = max(1, int(self.settings.get("folder_cache_size", FOLDER_CACHE_SIZE)))
+        
+        # Общие итоги пользователя и вклад в них каждой папки
+        self.totals = empty_summary()
+        self.folder_totals = {}
+        for folder_name in self.folders:
+            self.refresh_totals(folder_name)
+            
+        # Колонки для отчетов, временные индексы папок и поисковый индекс
+        # строятся лениво при первом обращении
+        self.columns = None
+        self.time_indexes = {}
+        self.search_index = None
+        
+        # Фон создается один раз, смена темы только меняет его цвет
+        PALETTE.apply(self.theme)
+        with self.canvas.before:
+            themed(Color(), rgba="bg")
+            self.bg = Rectangle(size=Window.size)
+        PALETTE.bind(theme=self.update_stats)
         
         self.build_ui()
+        self.report_recovered()
         
+    @profiled
     def build_ui(self):
         self.clear_widgets()
         
-        # Фон
-        with self.canvas.before:
-            Color(*THEMES[self.theme]["bg"])
-            self.bg = Rectangle(size=Window.size)
-        
         # Главный контейнер
         main = BoxLayout(orientation='vertical')
         
@@ -519,9 +3739,9 @@ class MainScreen(Screen):
             size_hint_x=None,
             width=dp(50),
             background_normal='',
-            background_color=(0, 0, 0, 0),
-            color=THEMES[self.theme]["text"]
+            background_color=(0, 0, 0, 0)
         )
+        themed(menu_btn, color="text")
         menu_btn.bind(on_press=self.show_menu)
         
         # Приветствие пользователя
@@ -529,9 +3749,9 @@ class MainScreen(Screen):
         title = Label(
             text=f"👋 {user_name}",
             font_size=sp(20),
-            bold=True,
-            color=THEMES[self.theme]["text"]
+            bold=True
         )
+        themed(title, color="text")
         
         # Кнопка добавления папки
         add_btn = Button(
@@ -540,9 +3760,9 @@ class MainScreen(Screen):
             size_hint_x=None,
             width=dp(50),
             background_normal='',
-            background_color=(0, 0, 0, 0),
-            color=THEMES[self.theme]["text"]
+            background_color=(0, 0, 0, 0)
         )
+        themed(add_btn, color="text")
         add_btn.bind(on_press=self.show_add_folder_popup)
         
         header.add_widget(menu_btn)
@@ -559,27 +3779,40 @@ class MainScreen(Screen):
             text="📁 Your Folders" if self.lang == "EN" else "📁 Ваши папки",
             font_size=sp(18),
             bold=True,
-            color=THEMES[self.theme]["text"],
             size_hint_y=None,
             height=dp(40),
             padding=[dp(15), 0]
         )
+        themed(folders_label, color="text")
         main.add_widget(folders_label)
         
-        # Скроллируемый список папок
-        self.scroll = ScrollView(size_hint=(1, 1))
-        self.folder_list = BoxLayout(
+        # Виртуализированный список папок из готовых итогов папок
+        self.folders_view = RecycleView(size_hint=(1, 1))
+        self.folders_view.screen = self
+        folders_layout = RecycleBoxLayout(
             orientation='vertical',
-            spacing=dp(10),
+            default_size=(None, dp(80)),
+            default_size_hint=(1, None),
             size_hint_y=None,
+            spacing=dp(10),
             padding=[dp(15), dp(10)]
         )
-        self.folder_list.bind(minimum_height=self.folder_list.setter('height'))
+        folders_layout.bind(minimum_height=folders_layout.setter('height'))
+        self.folders_view.add_widget(folders_layout)
+        self.folders_view.viewclass = FolderRow
         
-        self.load_folders()
+        self.empty_label = Label(
+            text=LANG[self.lang]["no_folders"],
+            font_size=sp(16),
+            halign='center',
+            valign='middle'
+        )
+        themed(self.empty_label, color="secondary")
         
-        self.scroll.add_widget(self.folder_list)
-        main.add_widget(self.scroll)
+        self.folders_box = BoxLayout(size_hint=(1, 1))
+        self.folder_rows = {}
+        self.load_folders()
+        main.add_widget(self.folders_box)
         
         # Нижняя панель
         footer = BoxLayout(
@@ -592,26 +3825,26 @@ class MainScreen(Screen):
             text="📊",
             font_size=sp(24),
             background_normal='',
-            background_color=(0, 0, 0, 0),
-            color=THEMES[self.theme]["text"]
+            background_color=(0, 0, 0, 0)
         )
+        themed(stats_btn, color="text")
         stats_btn.bind(on_press=self.show_stats)
         
         home_btn = Button(
             text="🏠",
             font_size=sp(24),
             background_normal='',
-            background_color=(0, 0, 0, 0),
-            color=THEMES[self.theme]["primary"]
+            background_color=(0, 0, 0, 0)
         )
+        themed(home_btn, color="primary")
         
         settings_btn = Button(
             text="⚙️",
             font_size=sp(24),
             background_normal='',
-            background_color=(0, 0, 0, 0),
-            color=THEMES[self.theme]["text"]
+            background_color=(0, 0, 0, 0)
         )
+        themed(settings_btn, color="text")
         settings_btn.bind(on_press=self.show_settings)
         
         footer.add_widget(stats_btn)
@@ -621,28 +3854,26 @@ class MainScreen(Screen):
         
         self.add_widget(main)
         
+    def refresh_totals(self, folder_name):
+        """Заменяет вклад папки в общие итоги на актуальный - O(1)"""
+        old = self.folder_totals.pop(folder_name, None)
+        if old is not None:
+            summary_add_totals(self.totals, old, -1)
+        if folder_name in self.folders:
+            folder = self.folders[folder_name]
+            if folder is not None:
+                summary = folder_summary(folder)
+            else:
+                summary = self.folder_summaries.get(folder_name) or empty_summary()
+            # Копия, чтобы позже вычесть именно тот вклад, что был добавлен
+            new = empty_summary()
+            summary_add_totals(new, summary)
+            summary_add_totals(self.totals, new)
+            self.folder_totals[folder_name] = new
+        
+    @profiled
     def create_stats_card(self):
         """Создает карточку с общей статистикой"""
-        total_income = 0
-        total_expense = 0
-        total_folders = len(self.folders)
-        total_records = 0
-        
-        for folder_data in self.folders.values():
-            records = folder_data.get('records', [])
-            total_records += len(records)
-            for record in records:
-                try:
-                    amount = float(record.get('amount', 0))
-                    if record.get('type') == 'income':
-                        total_income += amount
-                    else:
-                        total_expense += amount
-                except:
-                    pass
-        
-        balance = total_income - total_expense
-        
         stats_card = BoxLayout(
             orientation='vertical',
             size_hint_y=None,
@@ -652,7 +3883,7 @@ class MainScreen(Screen):
         )
         
         with stats_card.canvas.before:
-            Color(*THEMES[self.theme]["card_bg"])
+            themed(Color(), rgba="card_bg")
             stats_card.bg = RoundedRectangle(
                 pos=stats_card.pos,
                 size=stats_card.size,
@@ -661,169 +3892,118 @@ class MainScreen(Screen):
         
         stats_card.bind(pos=self.update_card_bg, size=self.update_card_bg)
         
-        # Баланс
-        balance_label = Label(
-            text=f"Balance: ${balance:,.2f}",
+        # Баланс и фильтр по периоду
+        balance_row = BoxLayout(spacing=dp(10))
+        self.balance_label = Label(
             font_size=sp(24),
-            bold=True,
-            color=THEMES[self.theme]["success"] if balance >= 0 else THEMES[self.theme]["danger"]
+            bold=True
         )
+        self.period_filter = PeriodFilter(self.lang, self.update_stats)
+        balance_row.add_widget(self.balance_label)
+        balance_row.add_widget(self.period_filter)
         
         # Статистика
         stats_row = BoxLayout(spacing=dp(15))
         
         income_box = BoxLayout(orientation='vertical')
-        income_box.add_widget(Label(
+        income_box.add_widget(themed(Label(
             text="Income",
-            font_size=sp(12),
-            color=THEMES[self.theme]["secondary"]
-        ))
-        income_box.add_widget(Label(
-            text=f"+${total_income:,.2f}",
-            font_size=sp(16),
-            color=THEMES[self.theme]["success"]
-        ))
+            font_size=sp(12)
+        ), color="secondary"))
+        self.income_label = Label(
+            font_size=sp(16)
+        )
+        themed(self.income_label, color="success")
+        income_box.add_widget(self.income_label)
         
         expense_box = BoxLayout(orientation='vertical')
-        expense_box.add_widget(Label(
+        expense_box.add_widget(themed(Label(
             text="Expense",
-            font_size=sp(12),
-            color=THEMES[self.theme]["secondary"]
-        ))
-        expense_box.add_widget(Label(
-            text=f"-${total_expense:,.2f}",
-            font_size=sp(16),
-            color=THEMES[self.theme]["danger"]
-        ))
+            font_size=sp(12)
+        ), color="secondary"))
+        self.expense_label = Label(
+            font_size=sp(16)
+        )
+        themed(self.expense_label, color="danger")
+        expense_box.add_widget(self.expense_label)
         
         folders_box = BoxLayout(orientation='vertical')
-        folders_box.add_widget(Label(
+        folders_box.add_widget(themed(Label(
             text="Folders",
-            font_size=sp(12),
-            color=THEMES[self.theme]["secondary"]
-        ))
-        folders_box.add_widget(Label(
-            text=str(total_folders),
-            font_size=sp(16),
-            color=THEMES[self.theme]["info"]
-        ))
+            font_size=sp(12)
+        ), color="secondary"))
+        self.folders_count_label = Label(
+            font_size=sp(16)
+        )
+        themed(self.folders_count_label, color="info")
+        folders_box.add_widget(self.folders_count_label)
         
         stats_row.add_widget(income_box)
         stats_row.add_widget(expense_box)
         stats_row.add_widget(folders_box)
         
-        stats_card.add_widget(balance_label)
+        stats_card.add_widget(balance_row)
         stats_card.add_widget(stats_row)
         
+        self.update_stats()
         return stats_card
         
+    def update_stats(self, *args):
+        """Обновляет тексты карточки статистики без пересоздания виджетов"""
+        time_range = self.period_filter.range()
+        if time_range is None:
+            totals = convert_summary(self.totals, self.base_currency)
+        else:
+            totals = {"income": 0, "expense": 0, "balance": 0, "count": 0, "excluded": 0}
+            for folder_name in self.folders:
+                summary_add_totals(totals, self.get_time_index(folder_name).totals(time_range))
+        base = self.base_currency
+        balance = totals["balance"]
+        self.balance_label.text = f"Balance: {format_money(balance)} {base}{excluded_note(totals)}"
+        self.balance_label.color = PALETTE.success if balance >= 0 else PALETTE.danger
+        self.income_label.text = f"+{format_money(totals['income'])} {base}"
+        self.expense_label.text = f"-{format_money(totals['expense'])} {base}"
+        self.folders_count_label.text = str(len(self.folders))
+        
     def update_card_bg(self, instance, value):
         if hasattr(instance, 'bg'):
             instance.bg.pos = instance.pos
             instance.bg.size = instance.size
         
+    @profiled
     def load_folders(self):
-        self.folder_list.clear_widgets()
+        self.folders_box.clear_widgets()
         
         if not self.folders:
-            empty_label = Label(
-                text=LANG[self.lang]["no_folders"],
-                font_size=sp(16),
-                color=THEMES[self.theme]["secondary"],
-                size_hint_y=None,
-                height=dp(150),
-                halign='center',
-                valign='middle'
-            )
-            self.folder_list.add_widget(empty_label)
-            self.folder_list.height = dp(150)
+            self.folders_view.data = []
+            self.folders_box.add_widget(self.empty_label)
             return
             
-        for folder_name, folder_data in self.folders.items():
-            card = self.create_folder_card(folder_name, folder_data)
-            self.folder_list.add_widget(card)
-            
-        self.folder_list.height = len(self.folders) * dp(90)
-        
-    def create_folder_card(self, folder_name, folder_data):
-        card = BoxLayout(
-            orientation='horizontal',
-            size_hint_y=None,
-            height=dp(80),
-            padding=[dp(15), dp(10)],
-            spacing=dp(10)
-        )
-        
-        with card.canvas.before:
-            Color(*THEMES[self.theme]["card_bg"])
-            card.bg = RoundedRectangle(
-                pos=card.pos,
-                size=card.size,
-                radius=[dp(10)]
-            )
-        
-        card.bind(pos=self.update_card_bg, size=self.update_card_bg)
-        
-        # Иконка папки
-        icon = Label(
-            text="📁",
-            font_size=sp(30),
-            size_hint_x=None,
-            width=dp(50)
-        )
-        
-        # Информация о папке
-        info = BoxLayout(orientation='vertical', spacing=dp(5))
-        
-        name_label = Label(
-            text=folder_name,
-            font_size=sp(18),
-            bold=True,
-            halign='left',
-            text_size=(Window.width * 0.5, None),
-            color=THEMES[self.theme]["text"]
-        )
-        
-        # Подсчет баланса папки
-        balance = 0
-        records_count = len(folder_data.get('records', []))
-        for record in folder_data.get('records', []):
-            try:
-                amount = float(record.get('amount', 0))
-                if record.get('type') == 'income':
-                    balance += amount
-                else:
-                    balance -= amount
-            except:
-                pass
-                
-        details_label = Label(
-            text=f"${balance:,.2f} • {records_count} records",
-            font_size=sp(14),
-            color=THEMES[self.theme]["secondary"],
-            halign='left'
-        )
-        
-        info.add_widget(name_label)
-        info.add_widget(details_label)
-        
-        # Кнопка открытия
-        open_btn = Button(
-            text="→",
-            font_size=sp(24),
-            size_hint_x=None,
-            width=dp(50),
-            background_normal='',
-            background_color=(0, 0, 0, 0),
-            color=THEMES[self.theme]["primary"]
-        )
-        open_btn.bind(on_press=lambda x, fn=folder_name: self.open_folder(fn))
-        
-        card.add_widget(icon)
-        card.add_widget(info)
-        card.add_widget(open_btn)
-        
-        return card
+        self.folder_rows = {}
+        data = []
+        for folder_name in self.folders:
+            self.folder_rows[folder_name] = len(data)
+            data.append(self.folder_row(folder_name))
+        self.folders_view.data = data
+        self.folders_box.add_widget(self.folders_view)
+        
+    def folder_row(self, folder_name):
+        """Данные строки папки: итоги уже переведены в базовую валюту"""
+        return {'name': folder_name, 'currency': self.base_currency,
+                'summary': convert_summary(self.folder_totals[folder_name], self.base_currency)}
+        
+    def update_folder_row(self, folder_name):
+        """Обновляет одну строку списка папок (или добавляет новую)"""
+        row = self.folder_row(folder_name)
+        index = self.folder_rows.get(folder_name)
+        if index is not None:
+            self.folders_view.data[index] = row
+            return
+        if not self.folders_view.data:
+            self.folders_box.clear_widgets()
+            self.folders_box.add_widget(self.folders_view)
+        self.folder_rows[folder_name] = len(self.folders_view.data)
+        self.folders_view.data.append(row)
         
     def show_add_folder_popup(self, instance):
         """Показывает попап для создания новой папки"""
@@ -865,8 +4045,10 @@ class MainScreen(Screen):
                     self.show_message("Error", "Folder already exists")
                 else:
                     self.folders[name] = {'records': []}
-                    self.save_user_data()
-                    self.load_folders()
+                    self.refresh_totals(name)
+                    self.log_change({"op": "create_folder", "folder": name})
+                    self.update_folder_row(name)
+                    self.update_stats()
                     popup.dismiss()
                     self.show_message("Success", f"Folder '{name}' created")
             else:
@@ -889,40 +4071,214 @@ class MainScreen(Screen):
         )
         popup.open()
         
+    def get_folder(self, folder_name):
+        """Данные папки; записи читаются из хранилища при первом обращении"""
+        folder = self.folders[folder_name]
+        if folder is None:
+            folder = self.folders[folder_name] = self.peek_folder(folder_name)
+        return folder
+        
+    def peek_folder(self, folder_name):
+        """Данные папки без кэширования: выгруженная папка читается из
+        хранилища и после использования в памяти не остается"""
+        folder = self.folders[folder_name]
+        if folder is None:
+            # Хранилище должно видеть все изменения, еще ждущие в очереди
+            if self.persister is not None:
+                self.persister.flush()
+            folder = self.store.load_folder(folder_name)
+            self.report_recovered()
+        return folder
+        
+    def iter_folders(self):
+        """Пары (имя, папка) по одной, без загрузки всех папок в память"""
+        for folder_name in list(self.folders):
+            yield folder_name, self.peek_folder(folder_name)
+        
+    def report_recovered(self):
+        """Сообщает, какие файлы пришлось восстановить из .bak и журнала"""
+        if self.store is None:
+            return
+        names = self.store.take_recovered()
+        if names:
+            text = "Damaged data files were restored\nfrom backup copies:\n" + "\n".join(names)
+            Clock.schedule_once(lambda dt: self.show_message("Recovered", text))
+        
+    def load_all_folders(self):
+        """Загружает записи всех папок (поиск держит ссылки на записи)"""
+        for folder_name in self.folders:
+            self.get_folder(folder_name)
+        return self.folders
+        
+    def release_folders(self, keep=None):
+        """Выгружает записи папок, которые не показывает ни один экран
+        (кроме keep). В памяти остаются только их итоги"""
+        # Пока очередь не записана, часть изменений есть только в памяти
+        if self.persister is not None and self.persister.failing():
+            return
+        released = False
+        for folder_name, folder in self.folders.items():
+            if folder is None or folder_name in self.folder_screens or folder_name == keep:
+                continue
+            self.folder_summaries[folder_name] = folder_summary(folder)
+            self.folders[folder_name] = None
+            self.time_indexes.pop(folder_name, None)
+            released = True
+        # Поисковый индекс ссылается на сами записи - он бы их удержал
+        if released:
+            self.search_index = None
+            
     def open_folder(self, folder_name):
-        """Открывает экран папки"""
-        if folder_name in self.folders:
+        """Открывает экран папки, по возможности из пула"""
+        if folder_name not in self.folders:
+            return
+            
+        folder_screen = self.folder_screens.pop(folder_name, None)
+        if folder_screen is not None:
+            folder_screen.retarget(self.get_folder(folder_name), self.lang, self.theme,
+                                   self.base_currency)
+        else:
+            # Пул заполнен - освобождаем экран, который открывали давнее всего,
+            # и записи папок, которые больше не на экране
+            evicted = False
+            while len(self.folder_screens) >= self.folder_cache_size:
+                _, old_screen = self.folder_screens.popitem(last=False)
+                self.manager.remove_widget(old_screen)
+                old_screen.release()
+                evicted = True
+            if evicted:
+                # Открываемая папка еще не в пуле - ее не выгружаем
+                self.release_folders(keep=folder_name)
+                
             folder_screen = FolderScreen(
                 folder_name=folder_name,
-                records=self.folders[folder_name],
+                records=self.get_folder(folder_name),
                 go_back=self.back_to_main,
                 update_data=self.update_folder_data,
+                time_index=self.get_time_index,
+                base_currency=self.base_currency,
                 lang=self.lang,
                 theme=self.theme
             )
             self.manager.add_widget(folder_screen)
-            self.manager.current = folder_name
             
-    def update_folder_data(self, folder_name, new_data):
+        self.folder_screens[folder_name] = folder_screen
+        self.manager.current = folder_screen.name
+            
+    def update_folder_data(self, folder_name, new_data, change=None):
         """Обновляет данные папки"""
         if folder_name in self.folders:
             self.folders[folder_name] = new_data
-            self.save_user_data()
+            self.refresh_totals(folder_name)
+            self.update_folder_row(folder_name)
+            if change is None:
+                change = {"op": "set_folder", "data": new_data}
+            self.update_indexes(folder_name, change)
+            self.update_stats()
+            self.log_change(dict(change, folder=folder_name))
+            
+    def get_columns(self):
+        """Колоночное представление записей (строится при первом вызове)"""
+        if self.columns is None:
+            self.columns = ColumnStore.build(self.iter_folders(), self.base_currency)
+        return self.columns
+        
+    def get_time_index(self, folder_name):
+        """Временной индекс папки (строится при первом вызове)"""
+        index = self.time_indexes.get(folder_name)
+        if index is None:
+            # Индекс не держит записи - выгруженную папку не кэшируем
+            records = self.peek_folder(folder_name).get('records', [])
+            index = self.time_indexes[folder_name] = TimeIndex(records, self.base_currency)
+        return index
+        
+    def get_search_index(self):
+        """Поисковый индекс по всем папкам (строится при первом вызове)"""
+        if self.search_index is None:
+            self.search_index = SearchIndex.build(self.load_all_folders())
+        return self.search_index
+        
+    def currency_changed(self):
+        """Курсы или базовая валюта изменились: переведенные суммы в колонках
+        и временных индексах устарели, строки и сводки пересчитываются"""
+        self.columns = None
+        self.time_indexes = {}
+        self.load_folders()
+        self.update_stats()
+        for folder_screen in self.folder_screens.values():
+            folder_screen.base_currency = self.base_currency
+            folder_screen.update_summary()
+            
+    def update_indexes(self, folder_name, change):
+        """Обновляет колонки, временной и поисковый индексы после изменения.
+        Добавление и удаление записи правят их на месте, прочие
+        изменения сбрасывают до следующего обращения"""
+        op = change.get("op")
+        if self.search_index is not None:
+            if op == "add_record":
+                self.search_index.add(folder_name, change["record"])
+            elif op == "add_records":
+                for record in change["records"]:
+                    self.search_index.add(folder_name, record)
+            elif op == "delete_record" and "record" in change:
+                self.search_index.remove(change["record"])
+            else:
+                self.search_index = None
+                
+        if self.columns is not None:
+            if op == "add_record":
+                self.columns.append(folder_name, change["record"])
+            elif op == "add_records":
+                self.columns.extend(folder_name, change["records"])
+            else:
+                self.columns = None
+                
+        index = self.time_indexes.get(folder_name)
+        if index is not None:
+            if op == "add_record":
+                index.insert(len(self.folders[folder_name]['records']) - 1, change["record"])
+            elif op == "delete_record":
+                index.remove(change["index"])
+            else:
+                # В том числе пачка импорта: пересборка O(n log n) дешевле
+                # вставки каждой записи в середину индекса
+                del self.time_indexes[folder_name]
             
+    def log_change(self, change):
+        """Ставит изменение данных пользователя в очередь фоновой записи"""
+        if self.persister is not None:
+            self.persister.submit(change)
+            return True
+        return False
+            
+    @profiled
     def save_user_data(self):
-        """Сохраняет данные пользователя"""
-        if hasattr(self.manager, 'current_user'):
-            users = load_users()
-            user_id = self.manager.current_user.get('user_id')
-            if user_id and user_id in users:
-                users[user_id]["data"] = {"folders": self.folders}
-                save_users(users)
+        """Просит фоновый поток записать изменения и свернуть журнал в
+        файлы папок - интерфейс при этом не ждет диска"""
+        if self.persister is not None:
+            self.persister.request_compaction()
+            return True
+        return False
+        
+    @profiled
+    def flush(self, full=False):
+        """Синхронно дописывает очередь изменений (пауза и выход
+        приложения); full=True еще и переписывает грязные файлы папок"""
+        if self.persister is None:
+            return False
+        if full:
+            return self.persister.save(self.folders)
+        return self.persister.flush()
+        
+    def persist_failed(self):
+        """Из потока записи: изменения не записались и будут повторены"""
+        Clock.schedule_once(lambda dt: self.show_message(
+            "Error", "Changes could not be saved.\nThe app will keep retrying."))
                 
     def back_to_main(self):
         """Возвращает на главный экран"""
+        # Строки папок и статистика уже обновлены в update_folder_data
         self.manager.current = 'main'
-        # Обновляем UI
-        self.build_ui()
         
     def show_menu(self, instance):
         """Показывает боковое меню"""
@@ -961,6 +4317,10 @@ class MainScreen(Screen):
         menu_items = [
             ("📊 Statistics", self.show_stats),
             ("📄 Reports", self.show_reports),
+            ("🔍 Search", self.show_search),
+            ("💱 Rates", self.show_rates),
+            ("📤 Export", self.show_export),
+            ("📥 Import", self.show_import),
             ("⚙️ Settings", self.show_settings),
             ("🔄 Backup", self.backup_data),
             ("❓ Help", self.show_help),
@@ -981,61 +4341,462 @@ class MainScreen(Screen):
             btn.bind(on_press=lambda x, cb=callback: (menu.dismiss(), cb(x)) if cb else menu.dismiss())
             content.add_widget(btn)
             
-        menu.add_widget(content)
-        menu.open()
+        menu.add_widget(content)
+        menu.open()
+        
+    def show_stats(self, instance):
+        """Показывает статистику"""
+        total_folders = len(self.folders)
+        total_records = self.totals["count"]
+        
+        content = BoxLayout(orientation='vertical', spacing=dp(15), padding=dp(20))
+        content.add_widget(Label(
+            text="📊 Statistics",
+            font_size=sp(24),
+            bold=True,
+            size_hint_y=None,
+            height=dp(50)
+        ))
+        
+        subtotals = "\n".join(
+            f"        {code}: +{format_money(total['income'])} -{format_money(total['expense'])}"
+            f" = {format_money(total['balance'])}"
+            for code, total in currency_totals(self.totals).items())
+        startup = "\n".join(f"        {line}" for line in startup_report())
+        
+        stats_text = f"""
+        Total Folders: {total_folders}
+        Total Records: {total_records}
+        
+{subtotals}
+        
+        Last Update: {datetime.now().strftime('%Y-%m-%d %H:%M')}
+        Theme: {self.theme}
+        Language: {self.lang}
+        
+        Startup:
+{startup}
+        """
+        
+        content.add_widget(Label(
+            text=stats_text,
+            font_size=sp(16),
+            halign='left'
+        ))
+        
+        # Замеры профилировщика, если он что-то собрал
+        profile = PROFILER.summary()
+        if profile:
+            content.add_widget(Label(
+                text="\n".join(profile_lines(profile[:PROFILE_OVERLAY_ROWS])),
+                font_size=sp(11),
+                halign='left'
+            ))
+        
+        buttons = BoxLayout(spacing=dp(10), size_hint_y=None, height=dp(50))
+        close_btn = Button(
+            text="Close",
+            background_color=THEMES[self.theme]["primary"]
+        )
+        close_btn.bind(on_press=lambda x: popup.dismiss())
+        buttons.add_widget(close_btn)
+        
+        if profile:
+            def export_profile(inst):
+                try:
+                    path = profile_export_path()
+                    lines = PROFILER.export_jsonl(path)
+                except OSError as e:
+                    self.show_message("Error", str(e))
+                    return
+                self.show_message("Profile", f"{lines} lines\n{path}")
+                
+            export_btn = Button(
+                text="Export profile",
+                background_color=THEMES[self.theme]["success"]
+            )
+            export_btn.bind(on_press=export_profile)
+            buttons.add_widget(export_btn)
+        content.add_widget(buttons)
+        
+        popup = Popup(
+            title="",
+            content=content,
+            size_hint=(0.9, 0.8),
+            separator_height=0
+        )
+        popup.open()
+        
+    def show_reports(self, instance):
+        """Показывает итоги по месяцам, валютам и папкам"""
+        columns = self.get_columns()
+        
+        def section(title, groups):
+            lines = [f"[b]{title}[/b]"]
+            for key, summary in groups.items():
+                lines.append(f"{key}:  +{format_money(summary['income'])}  "
+                             f"-{format_money(summary['expense'])}  "
+                             f"= {format_money(summary['balance'])}{excluded_note(summary)}")
+            return "\n".join(lines)
+            
+        # Последние 12 месяцев, самые свежие сверху
+        months = dict(list(columns.group_totals("month").items())[-12:][::-1])
+        report_text = "\n\n".join([
+            section(f"{LANG[self.lang]['month']}, {self.base_currency}", months),
+            section(LANG[self.lang]["currency"], columns.group_totals("currency")),
+            section(f"{LANG[self.lang]['total']}, {self.base_currency}", columns.group_totals("folder"))
+        ])
+        
+        content = BoxLayout(orientation='vertical', spacing=dp(15), padding=dp(20))
+        content.add_widget(Label(
+            text=LANG[self.lang]["report"],
+            font_size=sp(24),
+            bold=True,
+            size_hint_y=None,
+            height=dp(50)
+        ))
+        
+        content.add_widget(Label(
+            text=report_text,
+            markup=True,
+            font_size=sp(14),
+            halign='left'
+        ))
+        
+        close_btn = Button(
+            text="Close",
+            size_hint_y=None,
+            height=dp(50),
+            background_color=THEMES[self.theme]["primary"]
+        )
+        close_btn.bind(on_press=lambda x: popup.dismiss())
+        content.add_widget(close_btn)
+        
+        popup = Popup(
+            title="",
+            content=content,
+            size_hint=(0.9, 0.8),
+            separator_height=0
+        )
+        popup.open()
+        
+    def show_search(self, instance):
+        """Поиск записей по названию во всех папках, постранично"""
+        search = ModalView(size_hint=(0.95, 0.85))
+        content = BoxLayout(orientation='vertical', padding=dp(20), spacing=dp(10))
+        
+        query_input = MobileTextInput(hint_text=LANG[self.lang]["search"])
+        results_box = BoxLayout(orientation='vertical', spacing=dp(5))
+        
+        pager = BoxLayout(spacing=dp(10), size_hint_y=None, height=dp(50))
+        prev_btn = Button(text="<", size_hint_x=None, width=dp(60))
+        page_label = Label()
+        themed(page_label, color="secondary")
+        next_btn = Button(text=">", size_hint_x=None, width=dp(60))
+        pager.add_widget(prev_btn)
+        pager.add_widget(page_label)
+        pager.add_widget(next_btn)
+        
+        state = {"page": 0, "pages": 0}
+        
+        def open_result(folder_name):
+            search.dismiss()
+            self.open_folder(folder_name)
+            
+        def show_page(*args):
+            # На экране только одна страница результатов
+            results, total = self.get_search_index().search(query_input.text, state["page"])
+            state["pages"] = (total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+            results_box.clear_widgets()
+            for folder_name, record in results:
+                sign = "+" if record.is_income else "-"
+                btn = Button(
+                    text=f"{record.name}  {sign}{format_money(record.minor)} {record.currency_name}  • {folder_name}",
+                    font_size=sp(14),
+                    size_hint_y=None,
+                    height=dp(40),
+                    background_normal='',
+                    background_color=(0, 0, 0, 0),
+                    shorten=True
+                )
+                themed(btn, color="text")
+                btn.bind(on_press=lambda x, name=folder_name: open_result(name))
+                results_box.add_widget(btn)
+            results_box.add_widget(Label())
+            page_label.text = f"{state['page'] + 1} / {state['pages']} ({total})" if total else ""
+            
+        def new_query(*args):
+            state["page"] = 0
+            run_query()
+            
+        def turn_page(step):
+            page = state["page"] + step
+            if 0 <= page < state["pages"]:
+                state["page"] = page
+                show_page()
+                
+        # Запрос выполняется после паузы в наборе, а не на каждую букву
+        run_query = Clock.create_trigger(show_page, 0.15)
+        query_input.bind(text=new_query)
+        prev_btn.bind(on_press=lambda x: turn_page(-1))
+        next_btn.bind(on_press=lambda x: turn_page(1))
+        
+        close_btn = Button(
+            text="Close",
+            size_hint_y=None,
+            height=dp(50),
+            background_color=THEMES[self.theme]["primary"]
+        )
+        close_btn.bind(on_press=lambda x: search.dismiss())
+        # Индекс держит записи всех папок - после поиска они не нужны
+        search.bind(on_dismiss=lambda x: self.release_folders())
+        
+        content.add_widget(query_input)
+        content.add_widget(results_box)
+        content.add_widget(pager)
+        content.add_widget(close_btn)
+        search.add_widget(content)
+        search.open()
+        
+    def show_rates(self, instance):
+        """Показывает текущие курсы и добавляет курс валюты на сегодня"""
+        rates = get_rates()
+        form = ModalView(size_hint=(0.9, 0.8))
+        content = BoxLayout(orientation='vertical', padding=dp(20), spacing=dp(10))
+        
+        content.add_widget(Label(
+            text="💱 Rates",
+            font_size=sp(24),
+            bold=True,
+            size_hint_y=None,
+            height=dp(50)
+        ))
+        
+        codes = [currency_iso(name) for name in CURRENCIES]
+        rates_label = Label(font_size=sp(14))
+        
+        def show_latest():
+            base_rate = rates.latest(self.base_currency) or 1.0
+            rates_label.text = "\n".join(
+                f"1 {code} = {(rates.latest(code) or base_rate) / base_rate:.6g} {self.base_currency}"
+                for code in codes if code != self.base_currency)
+        show_latest()
+        
+        other_codes = [code for code in codes if code != self.base_currency]
+        code_spinner = Spinner(
+            text=other_codes[0],
+            values=other_codes,
+            font_size=sp(16),
+            size_hint_y=None,
+            height=dp(50)
+        )
+        rate_input = MobileTextInput(hint_text=f"1 = ? {self.base_currency}", input_filter='float')
+        
+        def save_rate(inst):
+            try:
+                rate = float(rate_input.text)
+            except ValueError:
+                rate = 0
+            if rate <= 0:
+                self.show_message("Error", "Enter valid rate")
+                return
+            # Таблица хранит курсы к USD, а вводится курс к базовой валюте
+            usd_rate = rate * (rates.latest(self.base_currency) or 1.0)
+            rates.update(code_spinner.text, int(datetime.now().timestamp()), usd_rate)
+            rate_input.text = ""
+            show_latest()
+            self.currency_changed()
+            
+        buttons = BoxLayout(spacing=dp(10), size_hint_y=None, height=dp(50))
+        close_btn = Button(text="Close", background_color=THEMES[self.theme]["danger"])
+        close_btn.bind(on_press=lambda x: form.dismiss())
+        save_btn = Button(text="Save", background_color=THEMES[self.theme]["success"])
+        save_btn.bind(on_press=save_rate)
+        buttons.add_widget(close_btn)
+        buttons.add_widget(save_btn)
         
-    def show_stats(self, instance):
-        """Показывает статистику"""
-        total_folders = len(self.folders)
-        total_records = sum(len(folder.get('records', [])) for folder in self.folders.values())
+        content.add_widget(rates_label)
+        content.add_widget(code_spinner)
+        content.add_widget(rate_input)
+        content.add_widget(buttons)
+        form.add_widget(content)
+        form.open()
+        
+    def show_export(self, instance):
+        """Экспорт всех записей в CSV или JSON Lines в фоновом потоке"""
+        from kivy.uix.togglebutton import ToggleButton
+        
+        form = ModalView(size_hint=(0.9, 0.6), auto_dismiss=False)
+        content = BoxLayout(orientation='vertical', padding=dp(20), spacing=dp(10))
         
-        content = BoxLayout(orientation='vertical', spacing=dp(15), padding=dp(20))
         content.add_widget(Label(
-            text="📊 Statistics",
+            text=f"📤 {LANG[self.lang]['export']}",
             font_size=sp(24),
             bold=True,
             size_hint_y=None,
             height=dp(50)
         ))
         
-        stats_text = f"""
-        Total Folders: {total_folders}
-        Total Records: {total_records}
+        format_spinner = Spinner(
+            text="csv",
+            values=["csv", "jsonl"],
+            font_size=sp(16),
+            size_hint_y=None,
+            height=dp(50)
+        )
+        gzip_btn = ToggleButton(text="gzip", size_hint_y=None, height=dp(50))
+        status_label = Label(font_size=sp(14))
         
-        Last Update: {datetime.now().strftime('%Y-%m-%d %H:%M')}
-        Theme: {self.theme}
-        Language: {self.lang}
-        """
+        state = {"thread": None, "cancel": False}
+        
+        show_progress = self.progress_setter(status_label, "{} / {}")
+        
+        def finished(text):
+            state["thread"] = None
+            status_label.text = text
+            start_btn.disabled = False
+            
+        def run(folders, fmt, compress):
+            path = export_path(fmt, compress)
+            try:
+                count = export_records(folders, path, fmt, compress,
+                                       progress=show_progress, cancel=lambda: state["cancel"],
+                                       load=self.store.load_folder, total=self.totals["count"])
+                text = f"{count} → {path}"
+            except InterruptedError:
+                text = "Cancelled"
+            except Exception as e:
+                text = f"Error: {e}"
+            Clock.schedule_once(lambda dt: finished(text))
+            
+        def start(inst):
+            if state["thread"] is not None:
+                return
+            state["cancel"] = False
+            start_btn.disabled = True
+            status_label.text = "..."
+            # Незагруженные папки поток прочитает из хранилища сам - очередь
+            # изменений должна быть уже записана
+            self.flush()
+            state["thread"] = threading.Thread(
+                target=run, args=(dict(self.folders), format_spinner.text, gzip_btn.state == 'down'),
+                daemon=True)
+            state["thread"].start()
+            
+        def close(inst):
+            state["cancel"] = True
+            form.dismiss()
+            
+        buttons = BoxLayout(spacing=dp(10), size_hint_y=None, height=dp(50))
+        close_btn = Button(text="Close", background_color=THEMES[self.theme]["danger"])
+        close_btn.bind(on_press=close)
+        start_btn = Button(text=LANG[self.lang]["export"], background_color=THEMES[self.theme]["success"])
+        start_btn.bind(on_press=start)
+        buttons.add_widget(close_btn)
+        buttons.add_widget(start_btn)
+        
+        content.add_widget(format_spinner)
+        content.add_widget(gzip_btn)
+        content.add_widget(status_label)
+        content.add_widget(buttons)
+        form.add_widget(content)
+        form.open()
+        
+    def apply_import(self, imported):
+        """Добавляет импортированные записи в папки и сохраняет один раз"""
+        for folder_name, records in imported.items():
+            if folder_name not in self.folders:
+                self.folders[folder_name] = {"records": []}
+                self.log_change({"op": "create_folder", "folder": folder_name})
+            folder = self.get_folder(folder_name)
+            extend_records(folder, records)
+            change = {"op": "add_records", "records": records}
+            self.refresh_totals(folder_name)
+            self.update_folder_row(folder_name)
+            self.update_indexes(folder_name, change)
+            self.log_change(dict(change, folder=folder_name))
+            folder_screen = self.folder_screens.get(folder_name)
+            if folder_screen is not None:
+                folder_screen.filter_changed()
+        self.update_stats()
+        self.save_user_data()
+        
+    def show_import(self, instance):
+        """Импорт записей из CSV или JSON Lines (можно .gz) в фоновом потоке"""
+        form = ModalView(size_hint=(0.9, 0.6), auto_dismiss=False)
+        content = BoxLayout(orientation='vertical', padding=dp(20), spacing=dp(10))
         
         content.add_widget(Label(
-            text=stats_text,
-            font_size=sp(16),
-            halign='left'
+            text=f"📥 {LANG[self.lang]['import']}",
+            font_size=sp(24),
+            bold=True,
+            size_hint_y=None,
+            height=dp(50)
         ))
         
-        close_btn = Button(
-            text="Close",
-            size_hint_y=None,
-            height=dp(50),
-            background_color=THEMES[self.theme]["primary"]
-        )
-        close_btn.bind(on_press=lambda x: popup.dismiss())
-        content.add_widget(close_btn)
+        path_input = MobileTextInput(hint_text="/path/to/file.csv")
+        folder_input = MobileTextInput(hint_text=LANG[self.lang]["folder_name"], text="Import")
+        status_label = Label(font_size=sp(14))
         
-        popup = Popup(
-            title="",
-            content=content,
-            size_hint=(0.9, 0.6),
-            separator_height=0
-        )
-        popup.open()
+        state = {"thread": None, "cancel": False}
         
-    def show_reports(self, instance):
-        self.show_message("Info", "Reports feature coming soon!")
+        show_progress = self.progress_setter(status_label, "{} ({} skipped)")
+        
+        def finished(text, imported=None):
+            state["thread"] = None
+            start_btn.disabled = False
+            if imported:
+                self.apply_import(imported)
+            status_label.text = text
+            
+        def run(path, default_folder):
+            imported = None
+            try:
+                imported, skipped = import_records(path, default_folder, progress=show_progress,
+                                                   cancel=lambda: state["cancel"])
+                count = sum(len(records) for records in imported.values())
+                text = f"{count} imported, {skipped} skipped"
+            except InterruptedError:
+                text = "Cancelled"
+            except Exception as e:
+                text = f"Error: {e}"
+            if state["cancel"]:
+                return
+            Clock.schedule_once(lambda dt: finished(text, imported))
+            
+        def start(inst):
+            path = path_input.text.strip()
+            if state["thread"] is not None or not path:
+                return
+            state["cancel"] = False
+            start_btn.disabled = True
+            status_label.text = "..."
+            default_folder = folder_input.text.strip() or "Import"
+            state["thread"] = threading.Thread(target=run, args=(path, default_folder), daemon=True)
+            state["thread"].start()
+            
+        def close(inst):
+            state["cancel"] = True
+            form.dismiss()
+            
+        buttons = BoxLayout(spacing=dp(10), size_hint_y=None, height=dp(50))
+        close_btn = Button(text="Close", background_color=THEMES[self.theme]["danger"])
+        close_btn.bind(on_press=close)
+        start_btn = Button(text=LANG[self.lang]["import"], background_color=THEMES[self.theme]["success"])
+        start_btn.bind(on_press=start)
+        buttons.add_widget(close_btn)
+        buttons.add_widget(start_btn)
+        
+        content.add_widget(path_input)
+        content.add_widget(folder_input)
+        content.add_widget(status_label)
+        content.add_widget(buttons)
+        form.add_widget(content)
+        form.open()
         
     def show_settings(self, instance=None):
         """Показывает настройки"""
-        settings = ModalView(size_hint=(0.9, 0.7))
+        settings = ModalView(size_hint=(0.9, 0.9))
         
         content = BoxLayout(orientation='vertical', padding=dp(20), spacing=dp(15))
         
@@ -1081,19 +4842,88 @@ class MainScreen(Screen):
             height=dp(50)
         )
         
+        # Базовая валюта итогов
+        base_box = BoxLayout(orientation='vertical', spacing=dp(5))
+        base_box.add_widget(Label(
+            text="Base currency",
+            font_size=sp(16),
+            size_hint_y=None,
+            height=dp(30)
+        ))
+        
+        base_spinner = Spinner(
+            text=self.base_currency,
+            values=[currency_iso(name) for name in CURRENCIES],
+            font_size=sp(16),
+            size_hint_y=None,
+            height=dp(50)
+        )
+        
+        # Формат файлов папок
+        format_box = BoxLayout(orientation='vertical', spacing=dp(5))
+        format_box.add_widget(Label(
+            text="Data format",
+            font_size=sp(16),
+            size_hint_y=None,
+            height=dp(30)
+        ))
+        
+        format_spinner = Spinner(
+            text=get_data_format(),
+            values=DATA_FORMATS,
+            font_size=sp(16),
+            size_hint_y=None,
+            height=dp(50)
+        )
+        
+        # Профилирование для диагностики на устройстве
+        profiling_box = BoxLayout(orientation='vertical', spacing=dp(5))
+        profiling_box.add_widget(Label(
+            text="Profiling",
+            font_size=sp(16),
+            size_hint_y=None,
+            height=dp(30)
+        ))
+        
+        profiling_spinner = Spinner(
+            text=self.settings.get("profiling", "off"),
+            values=PROFILING_MODES,
+            font_size=sp(16),
+            size_hint_y=None,
+            height=dp(50)
+        )
+        
         # Кнопки
         buttons = BoxLayout(spacing=dp(10), size_hint_y=None, height=dp(50))
         
         def save_settings_callback(inst):
+            lang_changed = lang_spinner.text != self.lang
+            base_changed = base_spinner.text != self.base_currency
+            format_changed = format_spinner.text != get_data_format()
             self.theme = theme_spinner.text
             self.lang = lang_spinner.text
+            self.base_currency = base_spinner.text
             
             # Сохраняем настройки
-            self.settings = {"theme": self.theme, "language": self.lang}
+            self.settings.update({"theme": self.theme, "language": self.lang,
+                                  "base_currency": self.base_currency,
+                                  "data_format": format_spinner.text,
+                                  "profiling": profiling_spinner.text})
             save_settings(self.settings)
+            apply_profiling(profiling_spinner.text)
+            if format_changed:
+                # Очередь дописывается в журнал, затем все папки - в новом формате
+                self.persister.flush()
+                self.store.rewrite(self.folders, format_spinner.text)
             
             settings.dismiss()
-            self.build_ui()  # Перестраиваем UI с новыми настройками
+            # Тема перекрашивает существующие виджеты на месте,
+            # пересобирать интерфейс нужно только при смене языка
+            PALETTE.apply(self.theme)
+            if lang_changed:
+                self.build_ui()
+            if base_changed:
+                self.currency_changed()
             
         save_btn = Button(
             text="Save",
@@ -1112,16 +4942,134 @@ class MainScreen(Screen):
         
         theme_box.add_widget(theme_spinner)
         lang_box.add_widget(lang_spinner)
+        base_box.add_widget(base_spinner)
+        format_box.add_widget(format_spinner)
+        profiling_box.add_widget(profiling_spinner)
         
         content.add_widget(theme_box)
         content.add_widget(lang_box)
+        content.add_widget(base_box)
+        content.add_widget(format_box)
+        content.add_widget(profiling_box)
         content.add_widget(buttons)
         
         settings.add_widget(content)
         settings.open()
         
     def backup_data(self, instance):
-        self.show_message("Info", "Backup feature coming soon!")
+        """Инкрементальные резервные копии и восстановление из них"""
+        form = ModalView(size_hint=(0.9, 0.6), auto_dismiss=False)
+        content = BoxLayout(orientation='vertical', padding=dp(20), spacing=dp(10))
+        
+        content.add_widget(Label(
+            text="🔄 Backup",
+            font_size=sp(24),
+            bold=True,
+            size_hint_y=None,
+            height=dp(50)
+        ))
+        
+        names = list_backups()
+        backup_spinner = Spinner(
+            text=names[0] if names else "-",
+            values=names,
+            font_size=sp(16),
+            size_hint_y=None,
+            height=dp(50)
+        )
+        status_label = Label(text=f"{len(names)} backups", font_size=sp(14))
+        
+        state = {"thread": None, "confirm": None}
+        
+        show_progress = self.progress_setter(status_label, "{} / {}")
+        
+        def finished(text, closed=False):
+            state["thread"] = None
+            status_label.text = text
+            if closed:
+                # Хранилища закрыты, а данные в памяти могли устареть - даже
+                # если восстановление не удалось, вход заново перечитает диск
+                form.dismiss()
+                self.manager.show_auth()
+                self.show_message("Backup", text)
+                return
+            names = list_backups()
+            backup_spinner.values = names
+            backup_spinner.text = names[0] if names else "-"
+            for button in (create_btn, restore_btn, close_btn):
+                button.disabled = False
+                
+        def run_backup():
+            started = time.perf_counter()
+            try:
+                manifest = create_backup(progress=show_progress)
+                text = (f"{manifest['name']}: {len(manifest['files'])} files, "
+                        f"+{manifest['stored_bytes'] // 1024} KB, "
+                        f"{time.perf_counter() - started:.2f} s")
+            except Exception as e:
+                text = f"Error: {e}"
+            Clock.schedule_once(lambda dt: finished(text))
+            
+        def run_restore(name):
+            try:
+                reset_storage()
+                count = restore_backup(name, progress=show_progress)
+                text = f"{name}: {count} files restored"
+            except Exception as e:
+                text = f"Error: {e}"
+            Clock.schedule_once(lambda dt: finished(text, closed=True))
+            
+        def start(target, *args):
+            if state["thread"] is not None:
+                return
+            for button in (create_btn, restore_btn, close_btn):
+                button.disabled = True
+            status_label.text = "..."
+            state["thread"] = threading.Thread(target=target, args=args, daemon=True)
+            state["thread"].start()
+            
+        def create(inst):
+            # Копия берет файлы с диска - сначала дописываем очередь
+            self.flush()
+            start(run_backup)
+            
+        def restore(inst):
+            name = backup_spinner.text
+            if name not in backup_spinner.values:
+                return
+            # Восстановление затирает текущие данные - нужно второе нажатие
+            if state["confirm"] != name:
+                state["confirm"] = name
+                restore_btn.text = "Confirm restore"
+                status_label.text = f"Replace current data with {name}?"
+                return
+            if self.persister is not None:
+                self.persister.close()
+            start(run_restore, name)
+            
+        def reset_confirm(*args):
+            state["confirm"] = None
+            restore_btn.text = "Restore"
+            
+        actions = BoxLayout(spacing=dp(10), size_hint_y=None, height=dp(50))
+        create_btn = Button(text="Create", background_color=THEMES[self.theme]["success"])
+        create_btn.bind(on_press=create)
+        restore_btn = Button(text="Restore", background_color=THEMES[self.theme]["warning"])
+        restore_btn.bind(on_press=restore)
+        backup_spinner.bind(text=reset_confirm)
+        actions.add_widget(create_btn)
+        actions.add_widget(restore_btn)
+        
+        close_btn = Button(text="Close", background_color=THEMES[self.theme]["danger"],
+                           size_hint_y=None, height=dp(50))
+        close_btn.bind(on_press=lambda inst: form.dismiss())
+        
+        content.add_widget(status_label)
+        content.add_widget(backup_spinner)
+        content.add_widget(actions)
+        content.add_widget(close_btn)
+        form.add_widget(content)
+        form.open()
         
     def show_help(self, instance):
         help_text = """
@@ -1140,8 +5088,19 @@ class MainScreen(Screen):
         self.show_message("Help", help_text)
         
     def logout(self, instance):
+        if self.persister is not None:
+            self.flush(full=True)
+            self.persister.close()
         self.manager.show_auth()
         
+    def progress_setter(self, label, template):
+        """progress(...) для фоновых операций: вызывается из потока, а
+        подпись label (template.format(...)) меняется через Clock"""
+        def show_progress(*values):
+            text = template.format(*values)
+            Clock.schedule_once(lambda dt: setattr(label, 'text', text))
+        return show_progress
+        
     def show_message(self, title, text):
         popup = Popup(
             title=title,
@@ -1152,25 +5111,30 @@ class MainScreen(Screen):
 
 # ====================== ЭКРАН ПАПКИ ======================
 class FolderScreen(Screen):
-    def __init__(self, folder_name, records, go_back, update_data, lang, theme, **kwargs):
-        super().__init__(name=folder_name, **kwargs)
+    def __init__(self, folder_name, records, go_back, update_data, time_index, base_currency,
+                 lang, theme, **kwargs):
+        super().__init__(name=f"folder:{folder_name}", **kwargs)
         self.folder_name = folder_name
         self.records = records
         self.go_back = go_back
         self.update_data = update_data
+        self.time_index = time_index
+        self.base_currency = base_currency
         self.lang = lang
         self.theme = theme
         
+        # Фон создается один раз, смена темы только меняет его цвет
+        with self.canvas.before:
+            themed(Color(), rgba="bg")
+            self.bg = Rectangle(size=Window.size)
+        PALETTE.bind(theme=self.update_summary)
+        
         self.build_ui()
         
+    @profiled
     def build_ui(self):
         self.clear_widgets()
         
-        # Фон
-        with self.canvas.before:
-            Color(*THEMES[self.theme]["bg"])
-            self.bg = Rectangle(size=Window.size)
-        
         # Главный контейнер
         main = BoxLayout(orientation='vertical')
         
@@ -1187,17 +5151,17 @@ class FolderScreen(Screen):
             size_hint_x=None,
             width=dp(50),
             background_normal='',
-            background_color=(0, 0, 0, 0),
-            color=THEMES[self.theme]["text"]
+            background_color=(0, 0, 0, 0)
         )
+        themed(back_btn, color="text")
         back_btn.bind(on_press=lambda x: self.go_back())
         
         title = Label(
             text=self.folder_name,
             font_size=sp(20),
-            bold=True,
-            color=THEMES[self.theme]["text"]
+            bold=True
         )
+        themed(title, color="text")
         
         add_btn = Button(
             text="➕",
@@ -1205,9 +5169,9 @@ class FolderScreen(Screen):
             size_hint_x=None,
             width=dp(50),
             background_normal='',
-            background_color=(0, 0, 0, 0),
-            color=THEMES[self.theme]["text"]
+            background_color=(0, 0, 0, 0)
         )
+        themed(add_btn, color="text")
         add_btn.bind(on_press=self.show_add_record_popup)
         
         header.add_widget(back_btn)
@@ -1224,56 +5188,54 @@ class FolderScreen(Screen):
             text="Records" if self.lang == "EN" else "Записи",
             font_size=sp(18),
             bold=True,
-            color=THEMES[self.theme]["text"],
             size_hint_y=None,
             height=dp(40),
             padding=[dp(15), 0]
         )
+        themed(records_label, color="text")
         main.add_widget(records_label)
         
-        self.scroll = ScrollView(size_hint=(1, 1))
-        self.records_list = BoxLayout(
+        # Виртуализированный список: виджеты строк создаются только
+        # для видимой области и переиспользуются при прокрутке
+        self.records_view = RecycleView(size_hint=(1, 1))
+        self.records_view.screen = self
+        records_layout = RecycleBoxLayout(
             orientation='vertical',
-            spacing=dp(10),
+            default_size=(None, dp(70)),
+            default_size_hint=(1, None),
             size_hint_y=None,
+            spacing=dp(10),
             padding=[dp(15), dp(10)]
         )
-        self.records_list.bind(minimum_height=self.records_list.setter('height'))
+        records_layout.bind(minimum_height=records_layout.setter('height'))
+        self.records_view.add_widget(records_layout)
+        self.records_view.viewclass = RecordRow
         
-        self.load_records()
+        self.empty_label = Label(
+            text="No records yet",
+            font_size=sp(16),
+            halign='center',
+            valign='middle'
+        )
+        themed(self.empty_label, color="secondary")
         
-        self.scroll.add_widget(self.records_list)
-        main.add_widget(self.scroll)
+        self.records_box = BoxLayout(size_hint=(1, 1))
+        self.load_records()
+        main.add_widget(self.records_box)
         
         self.add_widget(main)
         
     def create_summary(self):
-        total_income = 0
-        total_expense = 0
-        
-        for record in self.records.get('records', []):
-            try:
-                amount = float(record.get('amount', 0))
-                if record.get('type') == 'income':
-                    total_income += amount
-                else:
-                    total_expense += amount
-            except:
-                pass
-                
-        balance = total_income - total_expense
-        records_count = len(self.records.get('records', []))
-        
         summary = BoxLayout(
             orientation='vertical',
             size_hint_y=None,
-            height=dp(120),
+            height=dp(140),
             padding=[dp(20), dp(15)],
             spacing=dp(10)
         )
         
         with summary.canvas.before:
-            Color(*THEMES[self.theme]["card_bg"])
+            themed(Color(), rgba="card_bg")
             summary.bg = RoundedRectangle(
                 pos=summary.pos,
                 size=summary.size,
@@ -1282,174 +5244,174 @@ class FolderScreen(Screen):
             
         summary.bind(pos=self.update_summary_bg, size=self.update_summary_bg)
         
-        # Баланс
-        balance_label = Label(
-            text=f"Balance: ${balance:,.2f}",
+        # Баланс и фильтр по периоду
+        balance_row = BoxLayout(spacing=dp(10))
+        self.balance_label = Label(
             font_size=sp(22),
-            bold=True,
-            color=THEMES[self.theme]["success"] if balance >= 0 else THEMES[self.theme]["danger"]
+            bold=True
         )
+        self.period_filter = PeriodFilter(self.lang, self.filter_changed)
+        balance_row.add_widget(self.balance_label)
+        balance_row.add_widget(self.period_filter)
         
         # Детали
         details = BoxLayout(spacing=dp(20))
         
         income_box = BoxLayout(orientation='vertical')
-        income_box.add_widget(Label(
+        income_box.add_widget(themed(Label(
             text="Income",
-            font_size=sp(12),
-            color=THEMES[self.theme]["secondary"]
-        ))
-        income_box.add_widget(Label(
-            text=f"+${total_income:,.2f}",
-            font_size=sp(16),
-            color=THEMES[self.theme]["success"]
-        ))
+            font_size=sp(12)
+        ), color="secondary"))
+        self.income_label = Label(
+            font_size=sp(16)
+        )
+        themed(self.income_label, color="success")
+        income_box.add_widget(self.income_label)
         
         expense_box = BoxLayout(orientation='vertical')
-        expense_box.add_widget(Label(
+        expense_box.add_widget(themed(Label(
             text="Expense",
-            font_size=sp(12),
-            color=THEMES[self.theme]["secondary"]
-        ))
-        expense_box.add_widget(Label(
-            text=f"-${total_expense:,.2f}",
-            font_size=sp(16),
-            color=THEMES[self.theme]["danger"]
-        ))
+            font_size=sp(12)
+        ), color="secondary"))
+        self.expense_label = Label(
+            font_size=sp(16)
+        )
+        themed(self.expense_label, color="danger")
+        expense_box.add_widget(self.expense_label)
         
         count_box = BoxLayout(orientation='vertical')
-        count_box.add_widget(Label(
+        count_box.add_widget(themed(Label(
             text="Records",
-            font_size=sp(12),
-            color=THEMES[self.theme]["secondary"]
-        ))
-        count_box.add_widget(Label(
-            text=str(records_count),
-            font_size=sp(16),
-            color=THEMES[self.theme]["info"]
-        ))
+            font_size=sp(12)
+        ), color="secondary"))
+        self.count_label = Label(
+            font_size=sp(16)
+        )
+        themed(self.count_label, color="info")
+        count_box.add_widget(self.count_label)
         
         details.add_widget(income_box)
         details.add_widget(expense_box)
         details.add_widget(count_box)
         
-        summary.add_widget(balance_label)
+        # Итоги по валютам без перевода
+        self.currencies_label = Label(
+            font_size=sp(12),
+            size_hint_y=None,
+            height=dp(20),
+            shorten=True
+        )
+        themed(self.currencies_label, color="secondary")
+        
+        summary.add_widget(balance_row)
         summary.add_widget(details)
+        summary.add_widget(self.currencies_label)
         
+        self.update_summary()
         return summary
         
+    def update_summary(self, *args):
+        """Обновляет тексты сводки папки без пересоздания виджетов"""
+        if self.records is None:
+            return
+        time_range = self.period_filter.range()
+        summary = folder_summary(self.records)
+        if time_range is None:
+            totals = convert_summary(summary, self.base_currency)
+        else:
+            totals = self.time_index(self.folder_name).totals(time_range)
+        base = self.base_currency
+        balance = totals["balance"]
+        self.balance_label.text = f"Balance: {format_money(balance)} {base}{excluded_note(totals)}"
+        self.balance_label.color = PALETTE.success if balance >= 0 else PALETTE.danger
+        self.income_label.text = f"+{format_money(totals['income'])} {base}"
+        self.expense_label.text = f"-{format_money(totals['expense'])} {base}"
+        self.count_label.text = str(totals["count"])
+        self.currencies_label.text = "  •  ".join(
+            f"{code} {format_money(total['balance'])}"
+            for code, total in currency_totals(summary).items())
+        
     def update_summary_bg(self, instance, value):
         if hasattr(instance, 'bg'):
             instance.bg.pos = instance.pos
             instance.bg.size = instance.size
         
+    @profiled
     def load_records(self):
-        self.records_list.clear_widgets()
-        
         records = self.records.get('records', [])
         
-        if not records:
-            empty_label = Label(
-                text="No records yet",
-                font_size=sp(16),
-                color=THEMES[self.theme]["secondary"],
-                size_hint_y=None,
-                height=dp(100),
-                halign='center',
-                valign='middle'
-            )
-            self.records_list.add_widget(empty_label)
-            self.records_list.height = dp(100)
+        # С фильтром строки берутся срезом временного индекса
+        time_range = self.period_filter.range()
+        if time_range is None:
+            positions = range(len(records))
+        else:
+            positions = self.time_index(self.folder_name).positions_in(time_range)
+        
+        self.records_box.clear_widgets()
+        if not positions:
+            self.records_view.data = []
+            self.records_box.add_widget(self.empty_label)
             return
             
-        for idx, record in enumerate(records):
-            card = self.create_record_card(record, idx)
-            self.records_list.add_widget(card)
-            
-        self.records_list.height = len(records) * dp(80)
+        self.records_view.data = [{'record': records[idx], 'index': idx}
+                                  for idx in positions]
+        self.records_box.add_widget(self.records_view)
         
-    def create_record_card(self, record, index):
-        card = BoxLayout(
-            orientation='horizontal',
-            size_hint_y=None,
-            height=dp(70),
-            padding=[dp(15), dp(10)],
-            spacing=dp(10)
-        )
+    def filter_changed(self):
+        """Перестраивает список и сводку под выбранный период"""
+        self.load_records()
+        self.update_summary()
         
-        with card.canvas.before:
-            Color(*THEMES[self.theme]["card_bg"])
-            card.bg = RoundedRectangle(
-                pos=card.pos,
-                size=card.size,
-                radius=[dp(10)]
-            )
+    def retarget(self, records, lang, theme, base_currency):
+        """Переиспользует экран из пула для актуальных данных папки"""
+        # Тема применяется палитрой сама, пересборка нужна только для языка
+        self.theme = theme
+        self.base_currency = base_currency
+        if lang != self.lang:
+            self.records = records
+            self.lang = lang
+            self.build_ui()
+        elif records is not self.records:
+            self.records = records
+            self.load_records()
+            self.update_summary()
             
-        card.bind(pos=self.update_card_bg, size=self.update_card_bg)
-        
-        # Иконка
-        icon = Label(
-            text="💰" if record.get('type') == 'income' else "💸",
-            font_size=sp(24),
-            size_hint_x=None,
-            width=dp(40)
-        )
-        
-        # Информация
-        info = BoxLayout(orientation='vertical', spacing=dp(5))
-        
-        name_label = Label(
-            text=record.get('name', 'No name'),
-            font_size=sp(16),
-            bold=True,
-            halign='left',
-            text_size=(Window.width * 0.4, None),
-            color=THEMES[self.theme]["text"]
-        )
-        
-        details = Label(
-            text=f"{record.get('date', 'No date')} • {record.get('currency', '$')}",
-            font_size=sp(12),
-            color=THEMES[self.theme]["secondary"],
-            halign='left'
-        )
-        
-        info.add_widget(name_label)
-        info.add_widget(details)
-        
-        # Сумма
-        amount = float(record.get('amount', 0))
-        amount_label = Label(
-            text=f"${amount:,.2f}",
-            font_size=sp(18),
-            bold=True,
-            color=THEMES[self.theme]["success"] if record.get('type') == 'income' else THEMES[self.theme]["danger"]
-        )
-        
-        # Кнопка удаления
-        delete_btn = Button(
-            text="🗑️",
-            font_size=sp(20),
-            size_hint_x=None,
-            width=dp(50),
-            background_normal='',
-            background_color=(0, 0, 0, 0),
-            color=THEMES[self.theme]["danger"]
-        )
-        delete_btn.bind(on_press=lambda x, idx=index: self.delete_record(idx))
-        
-        card.add_widget(icon)
-        card.add_widget(info)
-        card.add_widget(amount_label)
-        card.add_widget(delete_btn)
-        
-        return card
+    def release(self):
+        """Освобождает виджеты и данные экрана, вытесненного из пула"""
+        self.records_view.data = []
+        self.clear_widgets()
+        self.records = None
+        self.go_back = None
+        self.update_data = None
+        self.time_index = None
+        
+    def record_added(self, record):
+        """Добавляет строку новой записи и обновляет сводку"""
+        if self.period_filter.range() is not None:
+            self.filter_changed()
+            return
+        data = self.records_view.data
+        if not data:
+            self.records_box.clear_widgets()
+            self.records_box.add_widget(self.records_view)
+        data.append({'record': record, 'index': len(data)})
+        self.update_summary()
+        
+    def record_deleted(self, index):
+        """Убирает строку удаленной записи и обновляет сводку"""
+        if self.period_filter.range() is not None:
+            self.filter_changed()
+            return
+        data = self.records_view.data
+        # Сдвигаем индексы у строк ниже (меняются только словари данных)
+        for row in data[index + 1:]:
+            row['index'] -= 1
+        del data[index]
+        if not data:
+            self.records_box.clear_widgets()
+            self.records_box.add_widget(self.empty_label)
+        self.update_summary()
         
-    def update_card_bg(self, instance, value):
-        if hasattr(instance, 'bg'):
-            instance.bg.pos = instance.pos
-            instance.bg.size = instance.size
-            
     def show_add_record_popup(self, instance):
         """Показывает попап для добавления записи"""
         from kivy.uix.togglebutton import ToggleButton
@@ -1540,31 +5502,22 @@ class FolderScreen(Screen):
                 self.show_message("Error", "Enter amount")
                 return
                 
+            record_type = 'income' if income_btn.state == 'down' else 'expense'
             try:
-                float(amount_input.text)
-            except:
+                new_record = Record.create(name_input.text, amount_input.text,
+                                           record_type, currency_spinner.text)
+            except ValueError:
                 self.show_message("Error", "Enter valid amount")
                 return
             
-            record_type = 'income' if income_btn.state == 'down' else 'expense'
-            new_record = {
-                'name': name_input.text,
-                'amount': amount_input.text,
-                'type': record_type,
-                'currency': currency_spinner.text,
-                'date': datetime.now().strftime("%d.%m.%Y %H:%M")
-            }
-            
-            if 'records' not in self.records:
-                self.records['records'] = []
-            self.records['records'].append(new_record)
+            add_record(self.records, new_record)
             
             # Обновляем данные в главном экране
-            self.update_data(self.folder_name, self.records)
+            self.update_data(self.folder_name, self.records,
+                             {"op": "add_record", "record": new_record})
             
-            self.load_records()
             form.dismiss()
-            self.build_ui()  # Обновляем UI
+            self.record_added(new_record)
             
         cancel_btn.bind(on_press=lambda x: form.dismiss())
         save_btn.bind(on_press=save_record)
@@ -1584,10 +5537,10 @@ class FolderScreen(Screen):
     def delete_record(self, index):
         """Удаляет запись"""
         if 'records' in self.records and 0 <= index < len(self.records['records']):
-            self.records['records'].pop(index)
-            self.update_data(self.folder_name, self.records)
-            self.load_records()
-            self.build_ui()  # Обновляем UI
+            record = delete_record(self.records, index)
+            self.update_data(self.folder_name, self.records,
+                             {"op": "delete_record", "index": index, "record": record})
+            self.record_deleted(index)
             
     def show_message(self, title, text):
         popup = Popup(
@@ -1619,7 +5572,43 @@ class AppScreenManager(ScreenManager):
 class FinanceMobileApp(App):
     def build(self):
         self.title = "Finance Mobile"
-        return AppScreenManager()
+        setup_window()
+        startup_phase("platform")
+        root = AppScreenManager()
+        startup_phase("first screen")
+        return root
+        
+    def on_start(self):
+        Window.fbind('on_flip', self.on_first_frame)
+        
+    def on_first_frame(self, window):
+        """Первый кадр нарисован - дальше то, что ему не нужно"""
+        window.funbind('on_flip', self.on_first_frame)
+        startup_phase("first frame")
+        Clock.schedule_once(self.finish_startup)
+        
+    def finish_startup(self, dt):
+        apply_profiling(load_settings().get("profiling", "off"))
+        request_storage_permissions()
+        startup_phase("permissions")
+        # Перенос старых данных и каталог пользователей - до первого входа
+        prepare_storage()
+        load_accounts()
+        startup_phase("storage open")
+        
+    def flush_data(self, full=False):
+        """Сбрасывает на диск отложенные изменения вошедшего пользователя"""
+        if self.root is not None and self.root.has_screen('main'):
+            self.root.get_screen('main').flush(full)
+            
+    def on_pause(self):
+        self.flush_data()
+        return True
+        
+    def on_stop(self):
+        self.flush_data(full=True)
+
+startup_phase("module")
 
 # ====================== ЗАПУСК ======================
 if __name__ == '__main__':
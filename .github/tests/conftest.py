@@ -0,0 +1,39 @@
+"""
+Общие фикстуры: приложение импортируется без окна, а DATA_DIR
+(относительный путь) у каждого теста свой - во временной папке.
+
+    python -m pytest .github/tests
+"""
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+os.environ.setdefault("KIVY_NO_FILELOG", "1")
+os.environ.setdefault("KIVY_GL_BACKEND", "mock")
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+# Kivy при импорте перехватывает sys.stderr - возвращаем его pytest
+_stderr = sys.stderr
+import main as app
+sys.stderr = _stderr
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    """Модуль приложения с пустой папкой данных"""
+    monkeypatch.chdir(tmp_path)
+    app.reset_storage()
+    yield app
+    app.reset_storage()
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request, main):
+    """Включенный бэкенд хранения: тест проходит на обоих"""
+    main.save_settings({"storage": request.param})
+    main.prepare_storage()
+    return request.param
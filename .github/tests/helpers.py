@@ -0,0 +1,59 @@
+"""
+Общие данные тестов хранилища: пользователь, записи и изменения всех
+видов, которые пишет интерфейс, и их ожидаемый результат.
+"""
+USER_ID = "u1"
+PROFILE = {"email": "user@test.local", "nickname": "user", "created_at": "2025-01-01T00:00:00"}
+# Полночь 2025-01-01 UTC: журнал хранит время с точностью до минуты
+TS0 = 1735689600
+
+def make_record(main, i):
+    kind = main.Record.INCOME if i % 3 else main.Record.EXPENSE
+    currency = main.currency_code(main.CURRENCIES[i % len(main.CURRENCIES)])
+    return main.Record(f"item {i}", 100 + i * 7, TS0 + i * 3600, kind, currency)
+
+def sample_changes(main, start=0):
+    """Изменения всех видов, которые пишет интерфейс"""
+    return [
+        {"op": "create_folder", "folder": "Food"},
+        {"op": "create_folder", "folder": "Salary"},
+        {"op": "add_records", "folder": "Food",
+         "records": [make_record(main, start + i) for i in range(10)]},
+        {"op": "add_record", "folder": "Salary", "record": make_record(main, start + 10)},
+        {"op": "delete_record", "folder": "Food", "index": 2},
+        {"op": "add_record", "folder": "Food", "record": make_record(main, start + 11)},
+    ]
+
+def more_changes(main, start):
+    return [
+        {"op": "add_record", "folder": "Food", "record": make_record(main, start)},
+        {"op": "delete_record", "folder": "Salary", "index": 0},
+        {"op": "add_record", "folder": "Salary", "record": make_record(main, start + 1)},
+    ]
+
+def expected_folders(main, *batches):
+    folders = {}
+    for changes in batches:
+        for change in changes:
+            main.apply_change(folders, change)
+    return folders
+
+def snapshot(folders):
+    """Папки в сравнимом виде: порядок папок и поля записей"""
+    return [(name, [(record.name, record.minor, record.ts, record.kind, record.currency)
+                    for record in folder["records"]])
+            for name, folder in folders.items()]
+
+def new_store(main):
+    store = main.get_user_store(USER_ID)
+    store.create(PROFILE)
+    return store
+
+def log_all(store, changes):
+    for change in changes:
+        assert store.log_change(change)
+
+def reload(main):
+    """Данные пользователя, прочитанные заново с диска"""
+    main.reset_storage()
+    return main.get_user_store(USER_ID).load()["data"]["folders"]
@@ -0,0 +1,69 @@
+"""
+Резервные копии: восстановление возвращает данные на момент копии, не
+оставляет файлов .bak с данными до восстановления, а поврежденная
+копия отвергается до первой записи.
+"""
+import os
+
+import pytest
+
+from helpers import USER_ID, expected_folders, log_all, make_record, more_changes, new_store, \
+    reload, sample_changes, snapshot
+
+def saved(store, changes):
+    log_all(store, changes)
+    assert store.save(store.load()["data"]["folders"])
+
+@pytest.fixture
+def backed_up(main):
+    """Копия после первой пачки изменений, затем еще две записи поверх"""
+    store = new_store(main)
+    first = sample_changes(main)
+    saved(store, first)
+    manifest = main.create_backup()
+    later = more_changes(main, 100) + [
+        {"op": "create_folder", "folder": "Later"},
+        {"op": "add_record", "folder": "Later", "record": make_record(main, 200)}]
+    saved(store, later)
+    saved(store, more_changes(main, 300))
+    return manifest, first
+
+def test_restore_returns_backed_up_state(main, backed_up):
+    manifest, first = backed_up
+    main.reset_storage()
+    main.restore_backup(manifest["name"])
+
+    assert snapshot(reload(main)) == snapshot(expected_folders(main, first))
+
+def test_restore_leaves_no_pre_restore_backups(main, backed_up):
+    manifest, first = backed_up
+    main.reset_storage()
+    main.restore_backup(manifest["name"])
+
+    assert [rel for rel in main.iter_data_files() if ".bak" in rel] == []
+    # Поврежденный восстановленный файл не откатывается к данным до
+    # восстановления - их .bak больше нет
+    store = main.get_user_store(USER_ID)
+    with open(store.shard_file("Food"), "wb") as f:
+        f.write(b"garbage")
+    names = [record.name for record in reload(main)["Food"]["records"]]
+    assert "item 100" not in names and "item 300" not in names
+
+def test_damaged_backup_is_refused_before_writing(main, backed_up):
+    manifest, first = backed_up
+    main.reset_storage()
+    before = snapshot(reload(main))
+    digest = next(iter(manifest["files"].values()))["chunks"][0]
+    with open(main.chunk_path(digest), "wb") as f:
+        f.write(b"garbage")
+
+    main.reset_storage()
+    with pytest.raises(ValueError):
+        main.restore_backup(manifest["name"])
+    assert snapshot(reload(main)) == before
+
+def test_unchanged_files_are_not_stored_again(main, backed_up):
+    main.create_backup()
+    again = main.create_backup()
+    assert again["stored_chunks"] == 0
+    assert os.path.exists(main.manifest_path(again["name"]))
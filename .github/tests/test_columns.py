@@ -0,0 +1,88 @@
+"""
+Колоночное хранилище для отчетов: итоги по папке, месяцу и валюте с NumPy
+и без него совпадают между собой и с перебором записей, а дописывание
+по одной записи дает те же колонки, что и сборка сразу.
+"""
+import random
+
+import pytest
+
+from helpers import TS0, make_record
+
+DAY = 86400
+GROUPS = ("folder", "month", "currency")
+
+def make_folders(main, seed):
+    main.prepare_storage()
+    main.get_rates().update("EUR", TS0, 1.0837)
+    rng = random.Random(seed)
+    folders = {}
+    for i in range(600):
+        record = make_record(main, i)
+        record.minor = rng.randrange(1, 1000000)
+        record.ts = TS0 - rng.randrange(400) * DAY
+        record.currency = main.currency_code(rng.choice(["$ USD", "€ EUR"]))
+        folders.setdefault(f"F{i % 5}", {"records": []})["records"].append(record)
+    return folders
+
+def build(main, folders, numpy, monkeypatch):
+    with monkeypatch.context() as patch:
+        if not numpy:
+            patch.setattr(main, "get_numpy", lambda: None)
+        return main.ColumnStore.build(folders.items(), "USD")
+
+def test_numpy_and_python_agree(main, monkeypatch):
+    if main.get_numpy() is None:
+        pytest.skip("numpy is not installed")
+    folders = make_folders(main, 1)
+    vectorized = build(main, folders, True, monkeypatch)
+    plain = build(main, folders, False, monkeypatch)
+    assert vectorized.np is not None and plain.np is None
+    for by in GROUPS:
+        assert vectorized.group_totals(by) == plain.group_totals(by)
+
+@pytest.mark.parametrize("numpy", [True, False])
+def test_groups_match_brute_force(main, monkeypatch, numpy):
+    if numpy and main.get_numpy() is None:
+        pytest.skip("numpy is not installed")
+    folders = make_folders(main, 2)
+    store = build(main, folders, numpy, monkeypatch)
+    records = [record for folder in folders.values() for record in folder["records"]]
+
+    months = {}
+    for record in records:
+        months.setdefault(main.month_label(main.month_key(record.ts)), []).append(record)
+    by_month = store.group_totals("month")
+    assert list(by_month) == sorted(months)
+    for label, inside in months.items():
+        assert by_month[label]["count"] == len(inside)
+        assert by_month[label]["income"] == round(sum(main.to_base(record, "USD")
+                                                      for record in inside if record.is_income))
+
+    by_currency = store.group_totals("currency")
+    assert by_currency["€ EUR"]["expense"] == sum(
+        record.minor for record in records
+        if record.currency_name == "€ EUR" and not record.is_income)
+
+    by_folder = store.group_totals("folder")
+    for name, folder in folders.items():
+        summary = main.convert_summary(main.folder_summary(folder), "USD")
+        assert {key: by_folder[name][key] for key in summary} == summary
+
+@pytest.mark.parametrize("numpy", [True, False])
+def test_append_matches_build(main, monkeypatch, numpy):
+    if numpy and main.get_numpy() is None:
+        pytest.skip("numpy is not installed")
+    folders = make_folders(main, 3)
+    built = build(main, folders, numpy, monkeypatch)
+    with monkeypatch.context() as patch:
+        if not numpy:
+            patch.setattr(main, "get_numpy", lambda: None)
+        grown = main.ColumnStore("USD")
+    for name, folder in folders.items():
+        for record in folder["records"]:
+            grown.append(name, record)
+
+    assert grown.size == built.size == 600
+    for by in GROUPS:
+        assert grown.group_totals(by) == built.group_totals(by)
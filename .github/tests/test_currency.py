@@ -0,0 +1,84 @@
+"""
+Перевод в базовую валюту: курс берется на конец месяца записи, все пути
+(convert_summary, TimeIndex, ColumnStore) округляют итог одинаково, а
+записи в валютах без курса не входят в итог и считаются в excluded.
+"""
+import random
+
+import pytest
+
+from helpers import TS0, make_record
+
+MONTH = 30 * 86400
+EVERYTHING = (0, 2 ** 40)
+
+@pytest.fixture(params=["numpy", "python"])
+def columns_mode(request, main, monkeypatch):
+    """ColumnStore с NumPy и без него"""
+    if request.param == "numpy":
+        if main.get_numpy() is None:
+            pytest.skip("numpy is not installed")
+    else:
+        monkeypatch.setattr(main, "get_numpy", lambda: None)
+    return request.param
+
+@pytest.fixture
+def rates(main):
+    main.prepare_storage()
+    rates = main.get_rates()
+    for months_ago in range(12):
+        rates.update("EUR", TS0 - months_ago * MONTH, 1.0837 * (1 + 0.013 * (months_ago % 7)))
+        rates.update("RUB", TS0 - months_ago * MONTH, 0.010937 * (1 + 0.021 * (months_ago % 5)))
+    return rates
+
+def make_folder(main, count, seed, currencies=None):
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        record = make_record(main, i)
+        record.minor = rng.randrange(1, 1000000)
+        record.ts = TS0 - rng.randrange(12 * MONTH)
+        if currencies is not None:
+            record.currency = main.currency_code(rng.choice(currencies))
+        records.append(record)
+    folder = {"records": records}
+    main.folder_summary(folder)
+    return folder
+
+def all_paths(main, folders, base):
+    """Итоги каждой папки тремя путями"""
+    groups = main.ColumnStore.build(folders.items(), base).group_totals("folder")
+    for name, folder in folders.items():
+        yield (main.convert_summary(main.folder_summary(folder), base),
+               main.TimeIndex(folder["records"], base).totals(EVERYTHING),
+               groups[name])
+
+def test_month_end_rate_is_used(main, rates):
+    rates.update("GBP", TS0 + 10 * 86400, 2.0)
+    record = main.Record("x", 100, TS0 + 86400, main.Record.INCOME, main.currency_code("GBP"))
+
+    assert main.to_base(record, "USD") == pytest.approx(200.0)
+    assert main.to_base(record, "GBP") == 100
+
+def test_all_paths_round_the_same_way(main, rates, columns_mode):
+    folders = {f"F{i}": make_folder(main, 2000, i, ["$ USD", "€ EUR", "₽ RUB"])
+               for i in range(4)}
+    for base in ("USD", "EUR"):
+        for summary, indexed, grouped in all_paths(main, folders, base):
+            for key in ("income", "expense", "balance", "count"):
+                assert summary[key] == indexed[key] == grouped[key]
+
+def test_currency_without_rate_is_excluded(main, rates, columns_mode):
+    assert main.get_rates().factor("CHF", main.month_key(TS0), "USD") is None
+    known = make_folder(main, 50, 1, ["$ USD", "€ EUR"])
+    unknown = make_folder(main, 7, 2, ["CHF"])
+    mixed = {"records": known["records"] + unknown["records"]}
+    main.folder_summary(mixed)
+
+    expected = main.convert_summary(main.folder_summary(known), "USD")
+    for totals in next(all_paths(main, {"mixed": mixed}, "USD")):
+        assert totals["excluded"] == 7
+        assert totals["count"] == 57
+        assert (totals["income"], totals["expense"]) == (expected["income"], expected["expense"])
+    assert main.excluded_note({"excluded": 7}) != ""
+    assert main.excluded_note(expected) == ""
@@ -0,0 +1,68 @@
+"""
+Экспорт и импорт: выгруженные CSV и JSON Lines (в том числе .gz)
+читаются обратно теми же записями, а битые строки отбрасываются и
+считаются в skipped, не прерывая импорт.
+"""
+import pytest
+
+from helpers import expected_folders, sample_changes, snapshot
+
+def write(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+@pytest.mark.parametrize("compress", [False, True])
+def test_export_import_round_trip(main, tmp_path, fmt, compress):
+    folders = expected_folders(main, sample_changes(main))
+    path = str(tmp_path / f"out.{fmt}")
+    progress = []
+    count = main.export_records(folders, path, fmt, compress,
+                                progress=lambda done, total: progress.append(done))
+    assert count == sum(len(folder["records"]) for folder in folders.values())
+
+    imported, skipped = main.import_records(path, "Default",
+                                            progress=lambda done, skipped: progress.append(done))
+    assert skipped == 0
+    assert progress[-1] == count
+    assert snapshot({name: {"records": records} for name, records in imported.items()}) == \
+        snapshot(folders)
+
+def test_malformed_jsonl_rows_are_skipped(main, tmp_path):
+    path = write(tmp_path / "in.jsonl", [
+        '{"folder": "Food", "name": "bread", "amount": "2.50", "type": "expense",'
+        ' "currency": "USD", "date": "2025-01-02"}',
+        '{"name": "broken", "amount": ',
+        '{"name": "", "amount": "1"}',
+        '{"name": "no amount", "amount": "abc"}',
+        '{"name": "bad date", "amount": "1", "date": "yesterday"}',
+        '[1, 2]',
+        '',
+        '{"name": "refund", "amount": "-4"}',
+    ])
+    imported, skipped = main.import_records(path, "Default")
+
+    assert skipped == 5
+    bread, = imported["Food"]
+    assert (bread.minor, bread.kind, bread.currency_name) == (250, main.Record.EXPENSE, "$ USD")
+    refund, = imported["Default"]
+    assert (refund.minor, refund.kind, refund.ts) == (400, main.Record.EXPENSE, None)
+
+def test_csv_aliases_and_bad_rows(main, tmp_path):
+    path = write(tmp_path / "in.csv", [
+        "Description,Sum,Date",
+        "coffee,3.20,02.01.2025",
+        "salary,1000,2025-01-31 09:00",
+        ",5,02.01.2025",
+        "tea,,02.01.2025",
+    ])
+    imported, skipped = main.import_records(path, "Default")
+
+    assert skipped == 2
+    assert [(record.name, record.minor) for record in imported["Default"]] == [
+        ("coffee", 320), ("salary", 100000)]
+
+def test_cancelled_import_raises(main, tmp_path):
+    path = write(tmp_path / "in.csv", ["name,amount", "a,1"])
+    with pytest.raises(InterruptedError):
+        main.import_records(path, "Default", cancel=lambda: True)
@@ -0,0 +1,48 @@
+"""
+Журнал изменений: проигрывается в то же состояние, сворачивание (в том
+числе прерванное) его не меняет, оборванная последняя строка не мешает.
+"""
+import os
+
+from helpers import USER_ID, expected_folders, log_all, more_changes, new_store, reload, \
+    sample_changes, snapshot
+
+def test_journal_replay_round_trip(backend, main):
+    changes = sample_changes(main)
+    log_all(new_store(main), changes)
+
+    assert snapshot(reload(main)) == snapshot(expected_folders(main, changes))
+
+def test_compaction_round_trip(main):
+    store = new_store(main)
+    first, second = sample_changes(main), more_changes(main, 100)
+    log_all(store, first)
+    store.save(store.load()["data"]["folders"])
+    log_all(store, second)
+
+    store.compact()
+    assert not os.path.exists(store.journal_file)
+    assert not os.path.exists(store.journal_old_file)
+    assert snapshot(reload(main)) == snapshot(expected_folders(main, first, second))
+
+def test_interrupted_compaction_is_finished_on_load(main):
+    store = new_store(main)
+    changes = sample_changes(main)
+    log_all(store, changes)
+    # Сворачивание прервалось сразу после переименования журнала
+    os.replace(store.journal_file, store.journal_old_file)
+
+    assert snapshot(reload(main)) == snapshot(expected_folders(main, changes))
+    store = main.get_user_store(USER_ID)
+    store.compact()
+    assert not os.path.exists(store.journal_old_file)
+    assert snapshot(reload(main)) == snapshot(expected_folders(main, changes))
+
+def test_torn_journal_line_is_ignored(main):
+    store = new_store(main)
+    changes = sample_changes(main)
+    log_all(store, changes)
+    with open(store.journal_file, "a", encoding="utf-8") as f:
+        f.write('{"op":"add_record","folder":"Food","rec')
+
+    assert snapshot(reload(main)) == snapshot(expected_folders(main, changes))
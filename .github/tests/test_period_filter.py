@@ -0,0 +1,71 @@
+"""
+Фильтр по датам: итоги TimeIndex за диапазон совпадают с перебором
+записей, а подпись PeriodFilter всегда соответствует действующему
+периоду - в том числе после отмены и повторного выбора Custom.
+"""
+import random
+
+import pytest
+
+from helpers import make_record
+
+def open_forms():
+    from kivy.core.window import Window
+    from kivy.uix.modalview import ModalView
+    return [child for child in Window.children if isinstance(child, ModalView)]
+
+def press(form, text):
+    from kivy.uix.button import Button
+    button = next(widget for widget in form.walk()
+                  if isinstance(widget, Button) and widget.text == text)
+    button.dispatch("on_press")
+
+@pytest.fixture
+def period_filter(main):
+    changes = []
+    widget = main.PeriodFilter("EN", lambda: changes.append(widget.range()))
+    widget.changes = changes
+    yield widget
+    for form in open_forms():
+        form.dismiss(animation=False)
+
+def test_time_index_totals_match_brute_force(main):
+    records = [make_record(main, i) for i in range(300)]
+    random.Random(2).shuffle(records)
+    index = main.TimeIndex(records, "USD")
+    start, end = sorted((records[10].ts, records[200].ts))
+    inside = [record for record in records if start <= record.ts < end]
+    totals = index.totals((start, end))
+
+    assert totals["count"] == len(inside)
+    assert sorted(index.positions_in((start, end))) == sorted(
+        position for position, record in enumerate(records) if start <= record.ts < end)
+    assert totals["income"] == round(sum(main.to_base(record, "USD") for record in inside
+                                         if record.is_income))
+
+def test_cancelled_custom_keeps_previous_period(period_filter):
+    period_filter.text = "Month"
+    period_filter.text = "Custom"
+    form, = open_forms()
+    assert not form.auto_dismiss
+    press(form, "Cancel")
+
+    assert period_filter.period == "month"
+    assert period_filter.text == "Month"
+    assert period_filter.range() is not None
+
+def test_custom_can_be_chosen_again(main, period_filter):
+    period_filter.text = "Custom"
+    form, = open_forms()
+    start, end = (widget for widget in form.walk() if isinstance(widget, main.MobileTextInput))
+    start.text, end.text = "01.01.2025", "31.01.2025"
+    press(form, "Filter")
+    form.dismiss(animation=False)
+
+    assert period_filter.period == "custom"
+    assert period_filter.range() == main.parse_day_range("01.01.2025", "31.01.2025")
+    assert period_filter.text == "01.01-31.01"
+    assert period_filter.changes == [period_filter.range()]
+    # Повторный выбор открывает форму снова, чтобы поменять даты
+    period_filter.text = "Custom"
+    assert len(open_forms()) == 1
@@ -0,0 +1,41 @@
+"""
+Записи в целых сотых: сумма и дата, которые не удалось разобрать, идут в
+счет как 0 и "без даты", но их исходный текст сохраняется при записи в
+любом формате и хранилище.
+"""
+import pytest
+
+from helpers import USER_ID, make_record, new_store, reload
+
+LEGACY = {"name": "old", "amount": "12,5 руб", "type": "expense", "currency": "$ USD",
+          "date": "31/12/2019"}
+
+def test_amounts_are_exact_minor_units(main):
+    record = main.Record.from_dict({"name": "x", "amount": "0.10", "type": "income"})
+    assert record.minor == 10 and record.raw is None
+    assert sum(main.Record.from_dict({"amount": "0.10"}).minor for _ in range(10)) == 100
+    assert main.format_minor(-1250) == "-12.50"
+    assert main.Record.from_dict(record.to_dict()).minor == 10
+
+def test_unparsed_fields_are_kept(main):
+    record = main.Record.from_dict(LEGACY)
+    assert (record.minor, record.ts) == (0, None)
+    assert record.to_dict() == LEGACY
+
+@pytest.mark.parametrize("setup", [{"storage": "json", "data_format": "json"},
+                                   {"storage": "json", "data_format": "binary+zlib"},
+                                   {"storage": "sqlite"}])
+def test_unparsed_fields_survive_save(main, setup):
+    main.save_settings(setup)
+    main.prepare_storage()
+    store = new_store(main)
+    changes = [{"op": "create_folder", "folder": "Old"},
+               {"op": "add_records", "folder": "Old",
+                "records": [make_record(main, 1), main.Record.from_dict(LEGACY)]}]
+    for change in changes:
+        assert store.log_change(change)
+    assert store.save(store.load()["data"]["folders"])
+
+    main.reset_storage()
+    assert main.get_user_store(USER_ID).load_folder("Old")["records"][1].to_dict() == LEGACY
+    assert reload(main)["Old"]["records"][1].to_dict() == LEGACY
@@ -0,0 +1,65 @@
+"""
+Восстановление после сбоя: поврежденный файл папки читается из .bak с
+журналом поверх, а сбой посреди атомарной записи оставляет читаемую
+версию файла.
+"""
+import json
+import os
+
+import pytest
+
+from helpers import USER_ID, expected_folders, log_all, more_changes, new_store, reload, \
+    sample_changes, snapshot
+
+def test_damaged_shard_is_recovered_from_backup(main):
+    store = new_store(main)
+    batches = [sample_changes(main), more_changes(main, 100), more_changes(main, 200)]
+    # Две полные записи: у файла папки появляется .bak, а журнал между
+    # ними остается в journal.prev
+    for changes in batches[:2]:
+        log_all(store, changes)
+        assert store.save(store.load()["data"]["folders"])
+    log_all(store, batches[2])
+    shard = store.shard_file("Food")
+    assert os.path.exists(main.backup_path(shard))
+    with open(shard, "wb") as f:
+        f.write(b"garbage")
+
+    folders = reload(main)
+    assert snapshot(folders) == snapshot(expected_folders(main, *batches))
+    assert main.get_user_store(USER_ID).take_recovered() == ["Food"]
+    assert os.path.exists(shard + ".corrupt")
+
+@pytest.mark.parametrize("crash_at", [1, 2])
+def test_crash_inside_write_durable_keeps_a_valid_version(main, monkeypatch, crash_at):
+    """Сбой после crash_at переименований из трех (.sum в .bak, файл в
+    .bak, временный файл на место файла)"""
+    main.write_text("x.json", json.dumps({"version": 1}))
+    main.write_text("x.json", json.dumps({"version": 2}))
+    replace = os.replace
+    calls = []
+    def crashing_replace(src, dst):
+        if len(calls) == crash_at:
+            raise OSError("crash")
+        calls.append(src)
+        replace(src, dst)
+    with monkeypatch.context() as patch:
+        patch.setattr(main.os, "replace", crashing_replace)
+        with pytest.raises(OSError):
+            main.write_text("x.json", json.dumps({"version": 3}))
+
+    assert main.read_json("x.json") == {"version": 2}
+
+def test_backup_with_stale_checksum_after_old_crash(main):
+    """Прежний порядок: файл ушел в .bak, а его .sum - нет. У .bak
+    остался .sum поколения раньше, но профиль все равно читается"""
+    store = new_store(main)
+    changes = sample_changes(main)
+    log_all(store, changes)
+    assert store.save(store.load()["data"]["folders"])
+    profile = store.profile_file
+    assert os.path.exists(main.checksum_path(main.backup_path(profile)))
+    os.replace(profile, main.backup_path(profile))
+
+    assert snapshot(reload(main)) == snapshot(expected_folders(main, changes))
+    assert "profile" in main.get_user_store(USER_ID).take_recovered()
@@ -0,0 +1,38 @@
+"""
+SQLite бэкенд: перенос JSON-файлов в базу и те же данные и итоги, что
+у JSON; удаление по индексу после повторного открытия базы.
+"""
+from helpers import USER_ID, expected_folders, log_all, more_changes, new_store, reload, \
+    sample_changes, snapshot
+
+def test_json_and_sqlite_give_the_same_data(main):
+    changes = sample_changes(main) + more_changes(main, 100)
+    main.save_settings({"storage": "json"})
+    store = new_store(main)
+    log_all(store, changes)
+    json_folders = snapshot(reload(main))
+    json_summaries = main.get_user_store(USER_ID).load_summaries()["data"]["summaries"]
+
+    # Переключение бэкенда переносит JSON-файлы в базу
+    main.save_settings({"storage": "sqlite"})
+    main.reset_storage()
+    main.prepare_storage()
+    assert isinstance(main.get_user_store(USER_ID), main.SqliteStore)
+    assert snapshot(reload(main)) == json_folders
+    sqlite_summaries = main.get_user_store(USER_ID).load_summaries()["data"]["summaries"]
+    assert list(sqlite_summaries) == list(json_summaries)
+    for name, summary in json_summaries.items():
+        for key in ("income", "expense", "balance", "count"):
+            assert sqlite_summaries[name][key] == summary[key]
+
+def test_delete_by_index_after_reopen(main):
+    main.save_settings({"storage": "sqlite"})
+    changes = sample_changes(main)
+    log_all(new_store(main), changes)
+    # id строк для удаления по индексу читаются из базы заново
+    main.reset_storage()
+    delete = [{"op": "delete_record", "folder": "Food", "index": 0},
+              {"op": "delete_record", "folder": "Food", "index": 3}]
+    log_all(main.get_user_store(USER_ID), delete)
+
+    assert snapshot(reload(main)) == snapshot(expected_folders(main, changes, delete))
@@ -0,0 +1,58 @@
+"""
+Шардированное хранилище: полная запись и чтение папок по одной; запись
+переписывает только грязные папки, и только если изменился их хэш.
+"""
+import os
+
+from helpers import USER_ID, expected_folders, log_all, make_record, more_changes, new_store, \
+    reload, sample_changes, snapshot
+
+def test_save_and_load_folder_round_trip(backend, main):
+    store = new_store(main)
+    first, second = sample_changes(main), more_changes(main, 100)
+    log_all(store, first)
+    assert store.save(store.load()["data"]["folders"])
+    log_all(store, second)
+    expected = expected_folders(main, first, second)
+
+    assert snapshot(reload(main)) == snapshot(expected)
+    main.reset_storage()
+    store = main.get_user_store(USER_ID)
+    assert snapshot({name: store.load_folder(name) for name in expected}) == snapshot(expected)
+
+def saved_store(main):
+    """Пользователь с двумя папками, записанными в файлы"""
+    store = new_store(main)
+    log_all(store, sample_changes(main))
+    folders = store.load()["data"]["folders"]
+    assert store.save(folders)
+    return store, folders
+
+def shard_mtimes(main, store):
+    return {name: os.stat(store.shard_file(name)).st_mtime_ns for name in ("Food", "Salary")}
+
+def test_save_rewrites_only_dirty_folders(main):
+    store, folders = saved_store(main)
+    before = shard_mtimes(main, store)
+    change = {"op": "add_record", "folder": "Food", "record": make_record(main, 50)}
+    main.apply_change(folders, change)
+    log_all(store, [change])
+    assert store.save(folders)
+
+    after = shard_mtimes(main, store)
+    assert after["Salary"] == before["Salary"]
+    assert after["Food"] != before["Food"]
+
+def test_unchanged_folder_is_not_rewritten(main):
+    store, folders = saved_store(main)
+    before = shard_mtimes(main, store)
+    # Папка грязная, но ее содержимое (и хэш) осталось прежним
+    changes = [{"op": "add_record", "folder": "Food", "record": make_record(main, 50)},
+               {"op": "delete_record", "folder": "Food", "index": len(folders["Food"]["records"])}]
+    for change in changes:
+        main.apply_change(folders, change)
+    log_all(store, changes)
+    assert store.save(folders)
+
+    assert shard_mtimes(main, store) == before
+    assert snapshot(reload(main)) == snapshot(folders)
@@ -0,0 +1,37 @@
+"""
+Вход по итогам: load_summaries не читает записи папок, а итоги из
+summaries.json с журналом поверх совпадают с посчитанными по записям.
+"""
+from helpers import USER_ID, expected_folders, log_all, more_changes, new_store, \
+    sample_changes
+
+def check_summaries(main, summaries, expected):
+    for name, folder in expected.items():
+        totals = main.folder_summary(folder)
+        for key in ("income", "expense", "balance", "count"):
+            assert summaries[name][key] == totals[key]
+
+def test_summaries_match_records(backend, main):
+    store = new_store(main)
+    first = sample_changes(main)
+    log_all(store, first)
+    store.save(store.load()["data"]["folders"])
+    second = more_changes(main, 100)
+    log_all(store, second)
+
+    main.reset_storage()
+    data = main.get_user_store(USER_ID).load_summaries()["data"]
+    assert data["folders"] == {"Food": None, "Salary": None}
+    check_summaries(main, data["summaries"], expected_folders(main, first, second))
+
+def test_damaged_summaries_are_rebuilt_from_folders(main):
+    store = new_store(main)
+    changes = sample_changes(main)
+    log_all(store, changes)
+    store.save(store.load()["data"]["folders"])
+    with open(store.summaries_file, "w", encoding="utf-8") as f:
+        f.write("{")
+
+    main.reset_storage()
+    data = main.get_user_store(USER_ID).load_summaries()["data"]
+    check_summaries(main, data["summaries"], expected_folders(main, changes))